@@ -15,9 +15,12 @@ from __future__ import print_function, unicode_literals
 import sys
 import codecs
 import re
+import copy
 import bisect
+import array
 from arpeggio.utils import isstr
 import types
+import warnings
 
 __version__ = "1.7"
 
@@ -27,8 +30,29 @@ else:
     text = str
 
 DEFAULT_WS = '\t\n\r '
+
+# Comment handling modes. See `comment_mode` parser parameter.
+COMMENTS_TREE = 'tree'
+COMMENTS_SPAN = 'span'
+COMMENTS_DISCARD = 'discard'
 NOMATCH_MARKER = 0
 
+# Parse events. See Parser.parse_events.
+EVENT_ENTER = 'enter'
+EVENT_EXIT = 'exit'
+EVENT_TERMINAL = 'terminal'
+NEWLINE_RE = re.compile('\n')
+NEWLINE_BYTES_RE = re.compile(b'\n')
+
+# Typecode of arrays of input positions. Positions are 64-bit so that inputs
+# larger than 2 GiB are supported ('l' is 32-bit on Windows). 'q' is not
+# available on Python 2.
+try:
+    array.array(str('q'))
+    _POSITION_TYPECODE = str('q')
+except ValueError:
+    _POSITION_TYPECODE = str('l')
+
 
 class ArpeggioError(Exception):
     """
@@ -104,6 +128,66 @@ class NoMatch(Exception):
         return self.__str__()
 
 
+def _no_newlines(ws):
+    """
+    Returns whitespace without newlines. Used in repetitions terminated at
+    the end of line.
+    """
+    if isinstance(ws, bytes):
+        return ws.replace(b'\n', b'').replace(b'\r', b'')
+    return ws.replace('\n', '').replace('\r', '')
+
+
+def _to_text(value):
+    """
+    Returns text of the value matched by the parser. Values matched in bytes
+    mode are decoded from UTF-8.
+    """
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, bytes) and bytes is not str:
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _join_values(values):
+    """
+    Joins values matched by the parser. Values are bytes in bytes mode.
+    """
+    if values and isinstance(values[0], bytes):
+        return b"".join(values)
+    return "".join(values)
+
+
+def _read_chunks(source, chunk_size):
+    """
+    Yields non-empty chunks of a file-like object or of an iterable.
+    """
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+
+def _shift_positions(nodes, offset):
+    """
+    Moves parse tree nodes by the given offset.
+    """
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        node.position += offset
+        if isinstance(node, NonTerminal):
+            node._position_end += offset
+            stack.extend(node)
+
+
 def flatten(_iterable):
     '''Flattening of python iterables.'''
     result = []
@@ -124,6 +208,8 @@ class DebugPrinter(object):
         _current_ident(int): Current identation level for prints.
     """
 
+    __slots__ = ['debug', '_current_ident']
+
     def __init__(self, **kwargs):
 
         self.debug = kwargs.pop("debug", False)
@@ -166,6 +252,20 @@ class ParsingExpression(object):
         suppress (bool): If this is set to True than no ParseTreeNode will be
             created for this ParsingExpression. Default False.
     """
+
+    # Parser model nodes are visited in the hottest parsing loop so their
+    # attributes are kept in slots. `__dict__` is kept for attributes set by
+    # tools built on top of the parser model (e.g. textX). It is created
+    # only when such an attribute is set. Model nodes can be weakly
+    # referenced.
+    __slots__ = ['elements', 'rule_name', 'root', 'nodes', 'suppress',
+                 '_result_cache', '_recognize_cache', '_exp_str',
+                 '__dict__', '__weakref__']
+
+    # Parse events of this expression can't be committed until it is done.
+    # See Parser.parse_events.
+    _holds_events = False
+
     def __init__(self, *elements, **kwargs):
 
         if len(elements) == 1:
@@ -186,6 +286,10 @@ class ParsingExpression(object):
         # positions.
         self._result_cache = {}  # position -> parse tree at the position
 
+        # Memoization for recognition. Only the recognition result and the end
+        # position are kept.
+        self._recognize_cache = {}  # position -> (result, end position)
+
     @property
     def desc(self):
         return "{}{}".format(self.name, "-" if self.suppress else "")
@@ -204,6 +308,14 @@ class ParsingExpression(object):
         else:
             return id(self)
 
+    def _guards(self, node):
+        """
+        Returns True if this expression may catch the failure of the given
+        sub-expression and continue parsing. Parse events can't be committed
+        while such sub-expression is parsed. See Parser.parse_events.
+        """
+        return False
+
     def _clear_cache(self, processed=None):
         """
         Clears memoization cache. Should be called on input change and end
@@ -214,6 +326,7 @@ class ParsingExpression(object):
         """
 
         self._result_cache = {}
+        self._recognize_cache = {}
 
         if not processed:
             processed = set()
@@ -279,6 +392,23 @@ class ParsingExpression(object):
             previous_root_rule_name = parser.in_rule
             parser.in_rule = self.rule_name
 
+        # Parse events. See Parser.parse_events.
+        events = parser._events
+        if events is not None:
+            if parser.in_lex_rule or parser.in_parse_comments:
+                events = None
+            else:
+                events_mark = len(events)
+                events_guard = self._holds_events or \
+                    (last_pexpression is not None and
+                     last_pexpression._guards(self))
+                if events_guard:
+                    parser._events_guards += 1
+                if self.root and not isinstance(self, Combine):
+                    # Position is set to the position of the first
+                    # following event when events are committed.
+                    events.append([EVENT_ENTER, self.rule_name, None, None])
+
         try:
             result = self._parse(parser)
             if self.suppress or (type(result) is list and
@@ -290,12 +420,18 @@ class ParsingExpression(object):
             # Memoize NoMatch at this position for this rule
             if parser.memoization:
                 self._result_cache[c_pos] = (NOMATCH_MARKER, c_pos)
+            if events is not None:
+                # Drop events of this expression.
+                del events[events_mark:]
             raise
 
         finally:
             # Recover last parsing expression.
             parser.last_pexpression = last_pexpression
 
+            if events is not None and events_guard:
+                parser._events_guards -= 1
+
             if parser.debug:
                 parser.dprint("<<{} rule {}{} at position {} => {}"
                               .format("- Not matched"
@@ -316,14 +452,45 @@ class ParsingExpression(object):
             if not isinstance(result, NonTerminal):
                 result = flatten(result)
 
+            if parser.ast_builder is not None and not parser.in_lex_rule \
+                    and not parser.in_parse_comments:
+                # Build AST node instead of the parse tree node.
+                # See arpeggio.ast
+                result = parser.ast_builder.build(self, result)
+
             # Tree reduction will eliminate Non-terminal with single child.
-            if parser.reduce_tree and len(result) == 1:
+            elif parser.reduce_tree and len(result) == 1:
                 result = result[0]
 
             # If the result is not parse tree node it must be a plain list
             # so create a new NonTerminal.
-            if not isinstance(result, ParseTreeNode):
-                result = NonTerminal(self, result)
+            if type(result) is list:
+                if events is not None:
+                    # Parse tree is not built when parsing to events. Any
+                    # node of the result will do to stand in for this rule.
+                    result = result[-1]
+                elif parser.visitor is not None \
+                        and not parser.in_lex_rule \
+                        and not parser.in_parse_comments:
+                    # In fused parse-and-visit mode visit the new node right
+                    # away.
+                    result = parser._visit_fused(self, result)
+                else:
+                    result = NonTerminal(self, result)
+
+        if events is not None:
+            if not result or isinstance(self, SyntaxPredicate):
+                # Empty or dropped results have no events.
+                del events[events_mark:]
+            else:
+                if isinstance(self, Combine):
+                    events.append((EVENT_TERMINAL, result.rule_name,
+                                   result.position, result.value))
+                elif self.root:
+                    events.append((EVENT_EXIT, self.rule_name,
+                                   parser.position, None))
+                if not parser._events_guards:
+                    parser._commit_events()
 
         # Result caching for use by memoization.
         if parser.memoization:
@@ -331,12 +498,69 @@ class ParsingExpression(object):
 
         return result
 
+    def recognize(self, parser):
+        """
+        Matches this expression at the current position like `parse` but
+        without building parse tree nodes. Only the parser position is
+        updated.
+
+        Returns:
+            None if `parse` would return None, False if `parse` would return
+            an empty result and True otherwise.
+        """
+        c_pos = parser.position
+
+        # Memoization.
+        if parser.memoization:
+            try:
+                result, new_pos = self._recognize_cache[c_pos]
+                parser.position = new_pos
+                parser.cache_hits += 1
+
+                # If NoMatch is recorded at this position raise.
+                if result is NOMATCH_MARKER:
+                    raise parser.nm
+
+                return result
+
+            except KeyError:
+                parser.cache_misses += 1
+
+        try:
+            result = self._recognize(parser)
+        except NoMatch:
+            parser.position = c_pos  # Backtracking
+            if parser.memoization:
+                self._recognize_cache[c_pos] = (NOMATCH_MARKER, c_pos)
+            raise
+
+        if self.suppress:
+            result = None
+
+        if parser.memoization:
+            self._recognize_cache[c_pos] = (result, parser.position)
+
+        return result
+
+    def _recognize(self, parser):
+        """
+        Default recognition for parsing expressions which don't implement
+        their own. Parse tree is built and dropped.
+        """
+        result = self._parse(parser)
+        if result is None or (type(result) is list and result
+                              and result[0] is None):
+            return None
+        return bool(result)
+
 
 class Sequence(ParsingExpression):
     """
     Will match sequence of parser expressions in exact order they are defined.
     """
 
+    __slots__ = ['ws', 'skipws']
+
     def __init__(self, *elements, **kwargs):
         super(Sequence, self).__init__(*elements, **kwargs)
         self.ws = kwargs.pop('ws', None)
@@ -348,7 +572,10 @@ class Sequence(ParsingExpression):
 
         if self.ws is not None:
             old_ws = parser.ws
-            parser.ws = self.ws
+            if parser.eolterm:
+                parser.ws = _no_newlines(self.ws)
+            else:
+                parser.ws = self.ws
 
         if self.skipws is not None:
             old_skipws = parser.skipws
@@ -376,12 +603,51 @@ class Sequence(ParsingExpression):
         if results:
             return results
 
+    def _recognize(self, parser):
+        result = None
+        c_pos = parser.position
+
+        if self.ws is not None:
+            old_ws = parser.ws
+            if parser.eolterm:
+                parser.ws = _no_newlines(self.ws)
+            else:
+                parser.ws = self.ws
+
+        if self.skipws is not None:
+            old_skipws = parser.skipws
+            parser.skipws = self.skipws
+
+        try:
+            for e in self.nodes:
+                if e.recognize(parser):
+                    result = True
+
+        except NoMatch:
+            parser.position = c_pos     # Backtracking
+            raise
+
+        finally:
+            if self.ws is not None:
+                parser.ws = old_ws
+            if self.skipws is not None:
+                parser.skipws = old_skipws
+
+        return result
+
 
 class OrderedChoice(Sequence):
     """
     Will match one of the parser expressions specified. Parser will try to
     match expressions in the order they are defined.
     """
+
+    __slots__ = []
+
+    def _guards(self, node):
+        # Failure of the last alternative is the failure of the choice.
+        return node is not self.nodes[-1]
+
     def _parse(self, parser):
         result = None
         match = False
@@ -401,6 +667,18 @@ class OrderedChoice(Sequence):
 
         return result
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+        for e in self.nodes:
+            try:
+                result = e.recognize(parser)
+                if result is not None:
+                    return result
+            except NoMatch:
+                parser.position = c_pos  # Backtracking
+
+        parser._nm_raise(self, c_pos, parser)
+
 
 class Repetition(ParsingExpression):
     """
@@ -409,17 +687,26 @@ class Repetition(ParsingExpression):
         eolterm(bool): Flag that indicates that end of line should
             terminate repetition match.
     """
+
+    __slots__ = ['eolterm', 'sep']
+
     def __init__(self, *elements, **kwargs):
         super(Repetition, self).__init__(*elements, **kwargs)
         self.eolterm = kwargs.get('eolterm', False)
         self.sep = kwargs.get('sep', None)
 
+    def _guards(self, node):
+        return True
+
 
 class Optional(Repetition):
     """
     Optional will try to match parser expression specified and will not fail
     in case match is not successful.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         result = None
         c_pos = parser.position
@@ -431,20 +718,34 @@ class Optional(Repetition):
 
         return result
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+
+        try:
+            return self.nodes[0].recognize(parser)
+        except NoMatch:
+            parser.position = c_pos  # Backtracking
+
 
 class ZeroOrMore(Repetition):
     """
     ZeroOrMore will try to match parser expression specified zero or more
     times. It will never fail.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         results = []
 
         if self.eolterm:
-            # Remember current eolterm and set eolterm of
-            # this repetition
+            # Remember current eolterm and whitespaces and set eolterm of
+            # this repetition. During eolterm state parser should not treat
+            # newline as a whitespace.
             old_eolterm = parser.eolterm
-            parser.eolterm = self.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
 
         # Prefetching
         append = results.append
@@ -469,8 +770,43 @@ class ZeroOrMore(Repetition):
                 break
 
         if self.eolterm:
-            # Restore previous eolterm
+            # Restore previous eolterm and whitespaces
             parser.eolterm = old_eolterm
+            parser.ws = old_ws
+
+        return results
+
+    def _recognize(self, parser):
+        results = False
+
+        if self.eolterm:
+            old_eolterm = parser.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
+
+        p = self.nodes[0].recognize
+        sep = self.sep.recognize if self.sep else None
+        result = None
+
+        while True:
+            try:
+                c_pos = parser.position
+                if sep and result:
+                    if not sep(parser):
+                        break
+                    results = True
+                result = p(parser)
+                if not result:
+                    break
+                results = True
+            except NoMatch:
+                parser.position = c_pos  # Backtracking
+                break
+
+        if self.eolterm:
+            parser.eolterm = old_eolterm
+            parser.ws = old_ws
 
         return results
 
@@ -479,15 +815,21 @@ class OneOrMore(Repetition):
     """
     OneOrMore will try to match parser expression specified one or more times.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         results = []
         first = True
 
         if self.eolterm:
-            # Remember current eolterm and set eolterm of
-            # this repetition
+            # Remember current eolterm and whitespaces and set eolterm of
+            # this repetition. During eolterm state parser should not treat
+            # newline as a whitespace.
             old_eolterm = parser.eolterm
-            parser.eolterm = self.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
 
         # Prefetching
         append = results.append
@@ -518,8 +860,50 @@ class OneOrMore(Repetition):
                     break
         finally:
             if self.eolterm:
-                # Restore previous eolterm
+                # Restore previous eolterm and whitespaces
+                parser.eolterm = old_eolterm
+                parser.ws = old_ws
+
+        return results
+
+    def _recognize(self, parser):
+        results = False
+        first = True
+
+        if self.eolterm:
+            old_eolterm = parser.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
+
+        p = self.nodes[0].recognize
+        sep = self.sep.recognize if self.sep else None
+        result = None
+
+        try:
+            while True:
+                try:
+                    c_pos = parser.position
+                    if sep and result:
+                        if not sep(parser):
+                            break
+                        results = True
+                    result = p(parser)
+                    if not result:
+                        break
+                    results = True
+                    first = False
+                except NoMatch:
+                    parser.position = c_pos  # Backtracking
+
+                    if first:
+                        raise
+
+                    break
+        finally:
+            if self.eolterm:
                 parser.eolterm = old_eolterm
+                parser.ws = old_ws
 
         return results
 
@@ -528,15 +912,24 @@ class UnorderedGroup(Repetition):
     """
     Will try to match all of the parsing expression in any order.
     """
+
+    __slots__ = []
+
+    # Matched separator may be dropped at the end.
+    _holds_events = True
+
     def _parse(self, parser):
         results = []
         c_pos = parser.position
 
         if self.eolterm:
-            # Remember current eolterm and set eolterm of
-            # this repetition
+            # Remember current eolterm and whitespaces and set eolterm of
+            # this repetition. During eolterm state parser should not treat
+            # newline as a whitespace.
             old_eolterm = parser.eolterm
-            parser.eolterm = self.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
 
         # Prefetching
         append = results.append
@@ -551,6 +944,8 @@ class UnorderedGroup(Repetition):
 
             # Separator
             c_loc_pos_sep = parser.position
+            if parser._events is not None:
+                events_mark = len(parser._events)
             if sep and not first:
                 try:
                     sep_result = sep(parser)
@@ -586,11 +981,14 @@ class UnorderedGroup(Repetition):
             if not match or all_optionals_fail:
                 # If sep is matched backtrack it
                 parser.position = c_loc_pos_sep
+                if parser._events is not None:
+                    del parser._events[events_mark:]
                 break
 
         if self.eolterm:
-            # Restore previous eolterm
+            # Restore previous eolterm and whitespaces
             parser.eolterm = old_eolterm
+            parser.ws = old_ws
 
         if not match:
             # Unsucessful match of the whole PE - full backtracking
@@ -600,6 +998,68 @@ class UnorderedGroup(Repetition):
         if results:
             return results
 
+    def _recognize(self, parser):
+        results = None
+        c_pos = parser.position
+
+        if self.eolterm:
+            old_eolterm = parser.eolterm
+            old_ws = parser.ws
+            parser.eolterm = True
+            parser.ws = _no_newlines(old_ws)
+
+        nodes_to_try = set(self.nodes)
+        sep = self.sep.recognize if self.sep else None
+        sep_result = None
+        first = True
+
+        while nodes_to_try:
+            sep_exc = None
+
+            # Separator
+            c_loc_pos_sep = parser.position
+            if sep and not first:
+                try:
+                    sep_result = sep(parser)
+                except NoMatch as e:
+                    parser.position = c_loc_pos_sep     # Backtracking
+                    sep_exc = e
+
+            c_loc_pos = parser.position
+            match = True
+            all_optionals_fail = True
+            for e in set(nodes_to_try):
+                try:
+                    if e.recognize(parser):
+                        if sep_exc:
+                            raise sep_exc
+                        first = False
+                        match = True
+                        all_optionals_fail = False
+                        results = True
+                        nodes_to_try.remove(e)
+                        break
+
+                except NoMatch:
+                    match = False
+                    parser.position = c_loc_pos     # local backtracking
+
+            if not match or all_optionals_fail:
+                # If sep is matched backtrack it
+                parser.position = c_loc_pos_sep
+                break
+
+        if self.eolterm:
+            parser.eolterm = old_eolterm
+            parser.ws = old_ws
+
+        if not match:
+            # Unsucessful match of the whole PE - full backtracking
+            parser.position = c_pos
+            parser._nm_raise(self, c_pos, parser)
+
+        return results
+
 
 class SyntaxPredicate(ParsingExpression):
     """
@@ -608,12 +1068,20 @@ class SyntaxPredicate(ParsingExpression):
     consume any input.
     """
 
+    __slots__ = []
+
+    # Results of predicates are always dropped.
+    _holds_events = True
+
 
 class And(SyntaxPredicate):
     """
     This predicate will succeed if the specified expression matches current
     input.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         c_pos = parser.position
         for e in self.nodes:
@@ -624,12 +1092,25 @@ class And(SyntaxPredicate):
                 raise
         parser.position = c_pos
 
-
-class Not(SyntaxPredicate):
-    """
-    This predicate will succeed if the specified expression doesn't match
-    current input.
-    """
+    def _recognize(self, parser):
+        c_pos = parser.position
+        for e in self.nodes:
+            try:
+                e.recognize(parser)
+            except NoMatch:
+                parser.position = c_pos
+                raise
+        parser.position = c_pos
+
+
+class Not(SyntaxPredicate):
+    """
+    This predicate will succeed if the specified expression doesn't match
+    current input.
+    """
+
+    __slots__ = []
+
     def _parse(self, parser):
         c_pos = parser.position
         old_in_not = parser.in_not
@@ -646,14 +1127,36 @@ class Not(SyntaxPredicate):
         finally:
             parser.in_not = old_in_not
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+        old_in_not = parser.in_not
+        parser.in_not = True
+        try:
+            for e in self.nodes:
+                try:
+                    e.recognize(parser)
+                except NoMatch:
+                    parser.position = c_pos
+                    return
+            parser.position = c_pos
+            parser._nm_raise(self, c_pos, parser)
+        finally:
+            parser.in_not = old_in_not
+
 
 class Empty(SyntaxPredicate):
     """
     This predicate will always succeed without consuming input.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         pass
 
+    def _recognize(self, parser):
+        pass
+
 
 class Decorator(ParsingExpression):
     """
@@ -663,6 +1166,8 @@ class Decorator(ParsingExpression):
     rules (see :class:Lex).
     """
 
+    __slots__ = []
+
 
 class Combine(Decorator):
     """
@@ -670,6 +1175,9 @@ class Combine(Decorator):
     This rules will always return a Terminal parse tree node.
     Whitespaces will be preserved. Comments will not be matched.
     """
+
+    __slots__ = []
+
     def _parse(self, parser):
         results = []
 
@@ -684,7 +1192,22 @@ class Combine(Decorator):
 
             # Create terminal from result
             return Terminal(self, c_pos,
-                            "".join([x.flat_str() for x in results]))
+                            (b"" if parser.bytes_mode else "")
+                            .join([x.flat_str() for x in results]))
+        except NoMatch:
+            parser.position = c_pos  # Backtracking
+            raise
+        finally:
+            parser.in_lex_rule = oldin_lex_rule
+
+    def _recognize(self, parser):
+        oldin_lex_rule = parser.in_lex_rule
+        parser.in_lex_rule = True
+        c_pos = parser.position
+        try:
+            for parser_model_node in self.nodes:
+                parser_model_node.recognize(parser)
+            return True
         except NoMatch:
             parser.position = c_pos  # Backtracking
             raise
@@ -696,6 +1219,9 @@ class Match(ParsingExpression):
     """
     Base class for all classes that will try to match something from the input.
     """
+
+    __slots__ = ['to_match', 'ignore_case']
+
     def __init__(self, rule_name, root=False):
         super(Match, self).__init__(rule_name=rule_name, root=root)
 
@@ -713,18 +1239,29 @@ class Match(ParsingExpression):
         try:
             parser.in_parse_comments = True
             if parser.comments_model:
+                comments_model = parser.comments_model
+                comment_mode = parser.comment_mode
                 try:
                     while True:
                         # TODO: Consumed whitespaces and comments should be
                         #       attached to the first match ahead.
-                        parser.comments.append(
-                            parser.comments_model.parse(parser))
+                        if comment_mode == COMMENTS_TREE:
+                            parser.comments.append(
+                                comments_model.parse(parser))
+                        else:
+                            # Comment trees are not kept so don't build them.
+                            comment_start = parser.position
+                            comments_model.recognize(parser)
+                            if comment_mode == COMMENTS_SPAN:
+                                parser.comments.append(
+                                    (comment_start, parser.position))
+                        parser.comments_count += 1
                         if parser.skipws:
                             # Whitespace skipping
                             pos = parser.position
                             ws = parser.ws
                             i = parser.input
-                            l = len(i)
+                            l = parser.input_end
                             while pos < l and i[pos] in ws:
                                 pos += 1
                             parser.position = pos
@@ -742,7 +1279,7 @@ class Match(ParsingExpression):
             pos = parser.position
             ws = parser.ws
             i = parser.input
-            l = len(i)
+            l = parser.input_end
             while pos < l and i[pos] in ws:
                 pos += 1
             parser.position = pos
@@ -756,16 +1293,49 @@ class Match(ParsingExpression):
                         parser.position,
                         parser.context()))
 
-        if parser.position in parser.comment_positions:
-            # Skip comments if already parsed.
-            parser.position = parser.comment_positions[parser.position]
-        else:
-            if not parser.in_parse_comments and not parser.in_lex_rule:
-                comment_start = parser.position
-                self._parse_comments(parser)
-                parser.comment_positions[comment_start] = parser.position
+        if parser.comments_model is not None:
+            if parser.position in parser.comment_positions:
+                # Skip comments if already parsed.
+                parser.position = parser.comment_positions[parser.position]
+            else:
+                if not parser.in_parse_comments and not parser.in_lex_rule:
+                    comment_start = parser.position
+                    self._parse_comments(parser)
+                    parser.comment_positions[comment_start] = parser.position
 
         result = self._parse(parser)
+        if not self.suppress:
+            if parser._events is not None and not parser.in_lex_rule \
+                    and not parser.in_parse_comments:
+                parser._events.append((EVENT_TERMINAL, result.rule_name,
+                                       result.position, result.value))
+                if not parser._events_guards:
+                    parser._commit_events()
+            return result
+
+    def recognize(self, parser):
+
+        if parser.skipws and not parser.in_lex_rule:
+            # Whitespace skipping
+            pos = parser.position
+            ws = parser.ws
+            i = parser.input
+            l = parser.input_end
+            while pos < l and i[pos] in ws:
+                pos += 1
+            parser.position = pos
+
+        if parser.comments_model is not None:
+            if parser.position in parser.comment_positions:
+                # Skip comments if already parsed.
+                parser.position = parser.comment_positions[parser.position]
+            else:
+                if not parser.in_parse_comments and not parser.in_lex_rule:
+                    comment_start = parser.position
+                    self._parse_comments(parser)
+                    parser.comment_positions[comment_start] = parser.position
+
+        result = self._recognize(parser)
         if not self.suppress:
             return result
 
@@ -786,6 +1356,9 @@ class RegExMatch(Match):
             or multiple are set.
 
     '''
+
+    __slots__ = ['to_match_regex', 'multiline', 'explicit_flags', 'regex']
+
     def __init__(self, to_match, rule_name='', root=False, ignore_case=None,
                  multiline=None, str_repr=None, re_flags=re.MULTILINE):
         super(RegExMatch, self).__init__(rule_name, root)
@@ -816,7 +1389,7 @@ class RegExMatch(Match):
 
     def _parse(self, parser):
         c_pos = parser.position
-        m = self.regex.match(parser.input, c_pos)
+        m = self.regex.match(parser.input, c_pos, parser.input_end)
         if m:
             matched = m.group()
             if parser.debug:
@@ -831,6 +1404,17 @@ class RegExMatch(Match):
                 parser.dprint("-- NoMatch at {}".format(c_pos))
             parser._nm_raise(self, c_pos, parser)
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+        m = self.regex.match(parser.input, c_pos, parser.input_end)
+        if m:
+            end = m.end()
+            parser.position = end
+            if end > c_pos:
+                return True
+        else:
+            parser._nm_raise(self, c_pos, parser)
+
 
 class StrMatch(Match):
     """
@@ -841,30 +1425,39 @@ class StrMatch(Match):
         ignore_case(bool): If case insensitive match is needed.
             Default is None to support propagation from global parser setting.
     """
+
+    __slots__ = ['_to_match']
+
     def __init__(self, to_match, rule_name='', root=False, ignore_case=None):
         super(StrMatch, self).__init__(rule_name, root)
         self.to_match = to_match
+        # The string compared to the input. Encoded in bytes mode.
+        self._to_match = to_match
         self.ignore_case = ignore_case
 
     def _parse(self, parser):
         c_pos = parser.position
-        input_frag = parser.input[c_pos:c_pos+len(self.to_match)]
+        to_match = self._to_match
+        input_frag = parser.input[c_pos:min(c_pos + len(to_match),
+                                            parser.input_end)]
         if self.ignore_case:
-            match = input_frag.lower() == self.to_match.lower()
+            if type(input_frag) is memoryview:
+                input_frag = input_frag.tobytes()
+            match = input_frag.lower() == to_match.lower()
         else:
-            match = input_frag == self.to_match
+            match = input_frag == to_match
         if match:
             if parser.debug:
                 parser.dprint(
                     "++ Match '{}' at {} => '{}'"
                     .format(self.to_match, c_pos,
-                            parser.context(len(self.to_match))))
-            parser.position += len(self.to_match)
+                            parser.context(len(to_match))))
+            parser.position += len(to_match)
 
             # If this match is inside sequence than mark for suppression
             suppress = type(parser.last_pexpression) is Sequence
 
-            return Terminal(self, c_pos, self.to_match, suppress=suppress)
+            return Terminal(self, c_pos, to_match, suppress=suppress)
         else:
             if parser.debug:
                 parser.dprint(
@@ -873,6 +1466,23 @@ class StrMatch(Match):
                             parser.context(len(self.to_match))))
             parser._nm_raise(self, c_pos, parser)
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+        to_match = self._to_match
+        input_frag = parser.input[c_pos:min(c_pos + len(to_match),
+                                            parser.input_end)]
+        if self.ignore_case:
+            if type(input_frag) is memoryview:
+                input_frag = input_frag.tobytes()
+            match = input_frag.lower() == to_match.lower()
+        else:
+            match = input_frag == to_match
+        if match:
+            parser.position += len(to_match)
+            return True
+        else:
+            parser._nm_raise(self, c_pos, parser)
+
     def __str__(self):
         return self.to_match
 
@@ -892,6 +1502,9 @@ class Kwd(StrMatch):
     """
     A specialization of StrMatch to specify keywords of the language.
     """
+
+    __slots__ = []
+
     def __init__(self, to_match):
         super(Kwd, self).__init__(to_match)
         self.to_match = to_match
@@ -903,6 +1516,9 @@ class EndOfFile(Match):
     """
     The Match class that will succeed in case end of input is reached.
     """
+
+    __slots__ = []
+
     def __init__(self):
         super(EndOfFile, self).__init__("EOF")
 
@@ -912,13 +1528,20 @@ class EndOfFile(Match):
 
     def _parse(self, parser):
         c_pos = parser.position
-        if len(parser.input) == c_pos:
+        if parser.input_end == c_pos:
             return Terminal(EOF(), c_pos, '', suppress=True)
         else:
             if parser.debug:
                 parser.dprint("!! EOF not matched.")
             parser._nm_raise(self, c_pos, parser)
 
+    def _recognize(self, parser):
+        c_pos = parser.position
+        if parser.input_end == c_pos:
+            return True
+        else:
+            parser._nm_raise(self, c_pos, parser)
+
 
 def EOF():
     return EndOfFile()
@@ -966,40 +1589,34 @@ class ParseTreeNode(object):
         "Must be implemented in subclasses."
         raise NotImplementedError
 
-    def visit(self, visitor):
+    def linecol(self, source):
         """
-        Visitor pattern implementation.
+        Returns (line, column) of the start of this node.
 
         Args:
-            visitor(PTNodeVisitor): The visitor object.
+            source(Parser or SourceMap): Parser which produced this node or
+                the source map of the parsed input.
         """
-        if visitor.debug:
-            visitor.dprint("Visiting {}  type:{} str:{}"
-                           .format(self.name, type(self).__name__, text(self)))
+        return source.pos_to_linecol(self.position)
 
-        children = SemanticActionResults()
-        if isinstance(self, NonTerminal):
-            for node in self:
-                child = node.visit(visitor)
-                # If visit returns None suppress that child node
-                if child is not None:
-                    children.append_result(node.rule_name, child)
-
-        visit_name = "visit_%s" % self.rule_name
-        if hasattr(visitor, visit_name):
-            # Call visit method.
-            result = getattr(visitor, visit_name)(self, children)
-
-            # If there is a method with 'second' prefix save
-            # the result of visit for post-processing
-            if hasattr(visitor, "second_%s" % self.rule_name):
-                visitor.for_second_pass.append((self.rule_name, result))
+    def linecol_end(self, source):
+        """
+        Returns (line, column) of the end of this node.
 
-            return result
+        Args:
+            source(Parser or SourceMap): Parser which produced this node or
+                the source map of the parsed input.
+        """
+        return source.pos_to_linecol(self.position_end)
+
+    def visit(self, visitor):
+        """
+        Visitor pattern implementation.
 
-        elif visitor.defaults:
-            # If default actions are enabled
-            return visitor.visit__default__(self, children)
+        Args:
+            visitor(PTNodeVisitor): The visitor object.
+        """
+        return _visit_tree(self, visitor, {})
 
 
 class Terminal(ParseTreeNode):
@@ -1038,7 +1655,8 @@ class Terminal(ParseTreeNode):
         return self.value
 
     def __str__(self):
-        return self.value
+        value = self.value
+        return value if isinstance(value, text) else _to_text(value)
 
     def __unicode__(self):
         return self.__str__()
@@ -1061,11 +1679,15 @@ class NonTerminal(ParseTreeNode, list):
         nodes (list of ParseTreeNode): Children parse tree nodes.
         _filtered (bool): Is this NT a dynamically created filtered NT.
             This is used internally.
+        _index_entry (tuple): (ParseTreeIndex, first, last) where first and
+            last are pre-order numbers of this node and its last descendant.
+            Set only if the tree is indexed. This is used internally.
+        _position_end (int): Cached end position of this node.
 
     """
 
     __slots__ = ['rule', 'rule_name', 'position', 'error', 'comments',
-                 '_filtered', '_expr_cache']
+                 '_filtered', '_expr_cache', '_index_entry', '_position_end']
 
     def __init__(self, rule, nodes, error=False, _filtered=False):
 
@@ -1077,6 +1699,9 @@ class NonTerminal(ParseTreeNode, list):
         self.extend(flatten([nodes]))
         self._filtered = _filtered
 
+        # Children are already constructed so their end position is known.
+        self._position_end = self[-1].position_end if self else position
+
     @property
     def value(self):
         """Terminal protocol."""
@@ -1088,13 +1713,13 @@ class NonTerminal(ParseTreeNode, list):
 
     @property
     def position_end(self):
-        return self[-1].position_end if self else self.position
+        return self._position_end
 
     def flat_str(self):
         """
         Return flatten string representation.
         """
-        return "".join([x.flat_str() for x in self])
+        return _join_values([x.flat_str() for x in self])
 
     def __str__(self):
         return " | ".join([text(x) for x in self])
@@ -1105,6 +1730,40 @@ class NonTerminal(ParseTreeNode, list):
     def __repr__(self):
         return "[ %s ]" % ", ".join([repr(x) for x in self])
 
+    def find_all(self, rule_name):
+        """
+        Returns a list of all nodes in this subtree (this node included)
+        created by the rule with the given name in document order.
+        If the tree is indexed (see ParseTreeIndex) the result is given by
+        the index. Otherwise, the subtree is traversed.
+
+        Args:
+            rule_name(str): The name of the rule.
+        """
+        try:
+            index = self._index_entry[0]
+        except AttributeError:
+            return [n for n in _preorder(self) if n.rule_name == rule_name]
+        return index.find_all(rule_name, self)
+
+    def first(self, rule_name):
+        """
+        Returns the first node in this subtree (this node included) created by
+        the rule with the given name in document order or None if there is
+        no such node.
+
+        Args:
+            rule_name(str): The name of the rule.
+        """
+        try:
+            index = self._index_entry[0]
+        except AttributeError:
+            for n in _preorder(self):
+                if n.rule_name == rule_name:
+                    return n
+            return None
+        return index.first(rule_name, self)
+
     def __getattr__(self, rule_name):
         """
         Find a child (non)terminal by the rule name.
@@ -1114,8 +1773,9 @@ class NonTerminal(ParseTreeNode, list):
                 this node rule.
         """
         # Prevent infinite recursion
-        if rule_name in ['_expr_cache', '_filtered', 'rule', 'rule_name',
-                         'position', 'append', 'extend']:
+        if rule_name in ['_expr_cache', '_filtered', '_index_entry',
+                         '_position_end', 'rule', 'rule_name', 'position',
+                         'append', 'extend']:
             raise AttributeError
 
         try:
@@ -1149,6 +1809,402 @@ class NonTerminal(ParseTreeNode, list):
         return result
 
 
+class VisitedNode(Terminal):
+    """
+    Stands in for an already visited non-terminal when parsing and visiting
+    are fused (see `visitor` parameter of `Parser.parse`). The result of
+    visiting is kept together with the values of the terminals of the
+    visited subtree. Visited non-terminals in the subtree are kept as their
+    VisitedNodes so the text of the subtree is not copied for each level.
+    The value, `str` and `flat_str` are the same as of the replaced
+    non-terminal.
+
+    Attributes:
+        result: The result of visiting the replaced non-terminal.
+        second_pass (list): (rule name, result) pairs from the replaced
+            subtree for the second pass or None.
+    """
+
+    __slots__ = ['result', 'second_pass', '_position_end', '_parts']
+
+    def __init__(self, rule, nodes, result, second_pass):
+        self.rule = rule
+        self.rule_name = rule.rule_name
+        self.position = nodes[0].position if nodes else 0
+        self.error = False
+        self.comments = None
+        self.suppress = False
+        self._position_end = nodes[-1].position_end if nodes \
+            else self.position
+        self._parts = tuple(n.value if isinstance(n, Terminal) and
+                            not isinstance(n, VisitedNode) else n
+                            for n in nodes)
+        self.result = result
+        self.second_pass = second_pass
+
+    @property
+    def value(self):
+        return self.__str__()
+
+    @property
+    def position_end(self):
+        return self._position_end
+
+    def flat_str(self):
+        return _join_values(self._pieces("", lambda n: n.flat_str(),
+                                         lambda v: v))
+
+    def __str__(self):
+        return "".join(self._pieces(" | ", text, _to_text))
+
+    def _pieces(self, separator, node_str, value_str):
+        """
+        Returns the pieces of the string of the replaced non-terminal joined
+        by the separator. Nested VisitedNodes are expanded without recursion.
+        """
+        pieces = []
+        stack = [[iter(self._parts), True]]
+        while stack:
+            top = stack[-1]
+            part = next(top[0], _NO_PART)
+            if part is _NO_PART:
+                stack.pop()
+                continue
+            if top[1]:
+                top[1] = False
+            elif separator:
+                pieces.append(separator)
+            if isinstance(part, VisitedNode):
+                stack.append([iter(part._parts), True])
+            elif isinstance(part, ParseTreeNode):
+                pieces.append(node_str(part))
+            else:
+                pieces.append(value_str(part))
+        return pieces
+
+
+# Marks the end of the parts of VisitedNode.
+_NO_PART = object()
+
+
+def _preorder(node):
+    """
+    Iterates over the given parse tree node and all its descendants in
+    document (pre-)order without recursion.
+    """
+    stack = [node]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        node = pop()
+        yield node
+        if isinstance(node, NonTerminal):
+            extend(reversed(node))
+
+
+class ParseTreeIndex(object):
+    """
+    Whole-tree index of parse tree nodes by rule name and by input position.
+
+    For each rule name the index keeps a list of nodes in document order so
+    that all nodes of the rule, in the whole tree or in any of its subtrees,
+    are found in O(log n + k) time where k is the number of found nodes.
+
+    All nodes are also kept in document (pre-)order together with their
+    start/end positions and parents. As start positions are non-decreasing in
+    this order the node at the given offset and the nodes overlapping the
+    given range are found by bisection.
+
+    The index is built by the parser at the end of parsing if `tree_index`
+    parser parameter is set. It can also be built for an existing tree by
+    instantiating this class.
+
+    Attributes:
+        root (ParseTreeNode): The root of the indexed tree.
+        _rules (dict): rule name -> (list of nodes, list of their pre-order
+            numbers).
+        _nodes (list): All nodes in pre-order.
+        _starts, _ends, _parents (array): Start position, end position and
+            the pre-order number of the parent for each node in `_nodes`.
+            Parent of the root is -1.
+    """
+    def __init__(self, root):
+        self.root = root
+        self._rules = {}
+        self._nodes = []
+        self._starts = array.array(_POSITION_TYPECODE)
+        self._ends = array.array(_POSITION_TYPECODE)
+        self._parents = array.array(_POSITION_TYPECODE)
+
+        rules = self._rules
+        nodes_append = self._nodes.append
+        starts_append = self._starts.append
+        ends_append = self._ends.append
+        parents_append = self._parents.append
+        order = 0
+        # Stack items are (node, parent, leaving) where leaving is the
+        # pre-order number of the node when all its descendants are
+        # processed.
+        stack = [(root, -1, None)]
+        pop = stack.pop
+        append = stack.append
+        while stack:
+            node, parent, leaving = pop()
+            if leaving is not None:
+                node._index_entry = (self, leaving, order - 1)
+                continue
+
+            nodes_append(node)
+            starts_append(node.position)
+            ends_append(node.position_end)
+            parents_append(parent)
+
+            if node.rule_name:
+                try:
+                    nodes, orders = rules[node.rule_name]
+                except KeyError:
+                    nodes, orders = rules[node.rule_name] = ([], [])
+                nodes.append(node)
+                orders.append(order)
+
+            if isinstance(node, NonTerminal):
+                append((node, None, order))
+                for child in reversed(node):
+                    append((child, order, None))
+            order += 1
+
+    def _order_at(self, offset):
+        """
+        Returns the pre-order number of the deepest node containing the given
+        offset or -1 if there is no such node.
+        """
+        # The last node in pre-order starting at or before the offset.
+        # If it doesn't contain the offset the deepest node that does must be
+        # one of its ancestors.
+        order = bisect.bisect_right(self._starts, offset) - 1
+        ends = self._ends
+        parents = self._parents
+        while order >= 0 and ends[order] <= offset:
+            order = parents[order]
+        return order
+
+    def node_at(self, offset):
+        """
+        Returns the deepest node which contains the given offset in the input
+        or None if no node contains it (e.g. offset is in the whitespace
+        between the top level nodes or outside of the tree).
+
+        Args:
+            offset(int): A position in the input string.
+        """
+        order = self._order_at(offset)
+        return self._nodes[order] if order >= 0 else None
+
+    def nodes_at(self, offset):
+        """
+        Returns a list of all nodes which contain the given offset in the
+        input from the outermost to the deepest.
+
+        Args:
+            offset(int): A position in the input string.
+        """
+        result = []
+        order = self._order_at(offset)
+        parents = self._parents
+        while order >= 0:
+            result.append(self._nodes[order])
+            order = parents[order]
+        result.reverse()
+        return result
+
+    def nodes_in_range(self, start, end):
+        """
+        Returns a list of all nodes overlapping the range [start, end) of the
+        input in document order.
+
+        Args:
+            start(int): The start position of the range.
+            end(int): The end position of the range (exclusive).
+        """
+        starts = self._starts
+        first = bisect.bisect_left(starts, start)
+        last = bisect.bisect_left(starts, max(start, end))
+
+        # Nodes starting before the range which overlap with it are exactly
+        # the nodes containing the start position.
+        result = []
+        order = self._order_at(start)
+        parents = self._parents
+        while order >= 0:
+            if starts[order] < start:
+                result.append(self._nodes[order])
+            order = parents[order]
+        result.reverse()
+
+        result.extend(self._nodes[first:last])
+        return result
+
+    def _range(self, rule_name, node):
+        """
+        Returns (nodes, start, end) for the nodes of the given rule
+        contained in the subtree of the given node.
+        """
+        try:
+            nodes, orders = self._rules[rule_name]
+        except KeyError:
+            return [], 0, 0
+
+        if node is None or node is self.root:
+            return nodes, 0, len(nodes)
+
+        if isinstance(node, NonTerminal):
+            index, first, last = node._index_entry
+            if index is not self:
+                raise ValueError("Node '{}' is not indexed by this index."
+                                 .format(node.name))
+        else:
+            # Terminal doesn't have descendants.
+            if node.rule_name == rule_name:
+                return [node], 0, 1
+            return [], 0, 0
+
+        return (nodes, bisect.bisect_left(orders, first),
+                bisect.bisect_right(orders, last))
+
+    def find_all(self, rule_name, node=None):
+        """
+        Returns a list of all nodes created by the rule with the given name
+        in document order.
+
+        Args:
+            rule_name(str): The name of the rule.
+            node(ParseTreeNode): If given only the nodes from the subtree of
+                this node (node included) are returned.
+        """
+        nodes, start, end = self._range(rule_name, node)
+        return nodes[start:end]
+
+    def first(self, rule_name, node=None):
+        """
+        Returns the first node created by the rule with the given name in
+        document order or None if there is no such node.
+
+        Args:
+            rule_name(str): The name of the rule.
+            node(ParseTreeNode): If given only the subtree of this node (node
+                included) is searched.
+        """
+        nodes, start, end = self._range(rule_name, node)
+        return nodes[start] if start < end else None
+
+    def count(self, rule_name, node=None):
+        """
+        Returns the number of nodes created by the rule with the given name.
+
+        Args:
+            rule_name(str): The name of the rule.
+            node(ParseTreeNode): If given only the subtree of this node (node
+                included) is searched.
+        """
+        nodes, start, end = self._range(rule_name, node)
+        return end - start
+
+    @property
+    def rule_names(self):
+        """
+        A list of all indexed rule names.
+        """
+        return list(self._rules)
+
+
+class SourceMap(object):
+    """
+    Maps positions in the input string to (line, column) pairs.
+    Line starts are found once for the whole input so that each position
+    is resolved by bisection. Lines and columns are 1-based.
+
+    Attributes:
+        line_starts (array): Positions at which each line starts.
+        first_line (int): The number of the first line.
+    """
+    def __init__(self, _input, offset=0, line_start=0, first_line=1):
+        """
+        Args:
+            _input(str): The input string.
+            offset(int): The position of the input in the whole input if
+                the input is a part of it.
+            line_start(int): The position in the whole input where the line
+                of the first input character starts.
+            first_line(int): The number of the line of the first input
+                character.
+        """
+        newline_re = NEWLINE_RE if isinstance(_input, text) \
+            else NEWLINE_BYTES_RE
+        self.line_starts = array.array(_POSITION_TYPECODE, [line_start])
+        self.line_starts.extend(offset + m.end()
+                                for m in newline_re.finditer(_input))
+        self.first_line = first_line
+
+    def pos_to_linecol(self, pos):
+        """
+        Calculate (line, column) tuple for the given position.
+        """
+        line_starts = self.line_starts
+        line = bisect.bisect_right(line_starts, pos)
+        return line + self.first_line - 1, pos - line_starts[line - 1] + 1
+
+    def linecols(self, positions):
+        """
+        Resolves many positions at once.
+
+        Args:
+            positions: An iterable of positions. If NumPy is installed and
+                this is NumPy array the resolution is vectorized.
+
+        Returns:
+            A (lines, cols) pair. Lists if positions is a plain iterable or
+            NumPy arrays if positions is NumPy array.
+        """
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        if numpy is not None and isinstance(positions, numpy.ndarray):
+            line_starts = numpy.frombuffer(self.line_starts,
+                                           dtype=self.line_starts.typecode)
+            lines = numpy.searchsorted(line_starts, positions, side='right')
+            cols = positions - line_starts[lines - 1] + 1
+            return lines + (self.first_line - 1), cols
+
+        line_starts = self.line_starts
+        line_offset = self.first_line - 1
+        bisect_right = bisect.bisect_right
+        lines = []
+        cols = []
+        lines_append = lines.append
+        cols_append = cols.append
+        for pos in positions:
+            line = bisect_right(line_starts, pos)
+            lines_append(line + line_offset)
+            cols_append(pos - line_starts[line - 1] + 1)
+        return lines, cols
+
+    def tree_linecols(self, node):
+        """
+        Resolves start and end line/column of the given node and all its
+        descendants.
+
+        Returns:
+            A list of (node, (line, col), (end_line, end_col)) in document
+            order.
+        """
+        nodes = list(_preorder(node))
+        lines, cols = self.linecols([n.position for n in nodes])
+        end_lines, end_cols = self.linecols([n.position_end for n in nodes])
+        return list(zip(nodes, zip(lines, cols), zip(end_lines, end_cols)))
+
+
 # ----------------------------------------------------
 # Semantic Actions
 #
@@ -1210,14 +2266,256 @@ class PTNodeVisitor(DebugPrinter):
         return retval
 
 
-def visit_parse_tree(parse_tree, visitor):
+# Default visit method function. Used to check if it is overridden.
+_DEFAULT_VISIT = getattr(PTNodeVisitor.visit__default__, '__func__',
+                         PTNodeVisitor.visit__default__)
+
+
+def _visit_handler(visitor, handlers, rule_name):
+    """
+    Returns (visit method, second pass method, plain) for the given rule name.
+    Visit method is the default visit method if the visitor has no visit
+    method for the rule and defaults are enabled. Plain is True if the
+    default visit method of PTNodeVisitor is used. It doesn't need
+    the results of the children grouped by rule names.
+
+    Args:
+        visitor(PTNodeVisitor): The visitor object.
+        handlers(dict): Dispatch table. rule name -> (visit method or None,
+            second pass method or None, plain). Filled in on the first visit
+            of each rule name so that visitor methods are looked up only once.
+        rule_name(str): The name of the rule.
+    """
+    try:
+        return handlers[rule_name]
+    except KeyError:
+        pass
+
+    visit = getattr(visitor, "visit_%s" % rule_name, None)
+    if visit is not None:
+        handler = (visit, getattr(visitor, "second_%s" % rule_name, None),
+                   False)
+    elif visitor.defaults:
+        visit = visitor.visit__default__
+        handler = (visit, None,
+                   getattr(visit, '__func__', None) is _DEFAULT_VISIT)
+    else:
+        handler = (None, None, True)
+    handlers[rule_name] = handler
+    return handler
+
+
+def _visit_node(visitor, handlers, node, children, for_second_pass):
+    """
+    Calls visit method for the node with already visited children.
+
+    Args:
+        visitor(PTNodeVisitor): The visitor object.
+        handlers(dict): Dispatch table. See _visit_handler.
+        node(ParseTreeNode): The node to visit.
+        children(SemanticActionResults): Results of visited children or None
+            for terminals.
+        for_second_pass(list): (rule name, result) is appended to this list if
+            there is a second pass method for the node.
+    """
+    try:
+        visit, second, plain = handlers[node.rule_name]
+    except KeyError:
+        visit, second, plain = _visit_handler(visitor, handlers,
+                                              node.rule_name)
+
+    if visit is None:
+        return None
+
+    if children is None:
+        if plain:
+            # Default for Terminal is to convert to string unless suppress
+            # flag is set. See PTNodeVisitor.visit__default__
+            return text(node) if not node.suppress else None
+        children = SemanticActionResults()
+
+    result = visit(node, children)
+
+    # If there is a method with 'second' prefix save
+    # the result of visit for post-processing
+    if second is not None:
+        for_second_pass.append((node.rule_name, result))
+
+    return result
+
+
+def _results(visitor, handlers, node):
+    """
+    Returns a new container for the results of the children of the given
+    non-terminal.
+    """
+    if _visit_handler(visitor, handlers, node.rule_name)[2]:
+        return _PlainResults()
+    return SemanticActionResults()
+
+
+def _visit_tree(root, visitor, handlers, pending=None):
+    """
+    Visits the tree bottom-up calling visitor methods for each node.
+    Uses an explicit stack so the depth of the tree is not limited by the
+    Python recursion limit.
+
+    Args:
+        root(ParseTreeNode): The root of the tree to visit.
+        visitor(PTNodeVisitor): The visitor object.
+        handlers(dict): Dispatch table. See _visit_node.
+        pending(dict): id of node -> future of (result, for_second_pass) for
+            the subtrees visited by the executor. See visit_parse_tree.
+    """
+    debug = visitor.debug
+    for_second_pass = visitor.for_second_pass
+
+    if debug:
+        visitor.dprint("Visiting {}  type:{} str:{}"
+                       .format(root.name, type(root).__name__, text(root)))
+
+    if not isinstance(root, NonTerminal):
+        return _visit_node(visitor, handlers, root, None, for_second_pass)
+
+    # Stack items are (node, results of visited children, iterator over
+    # children yet to visit).
+    stack = [(root, _results(visitor, handlers, root), iter(root))]
+    while True:
+        node, children, nodes_iter = stack[-1]
+        for child in nodes_iter:
+            if pending is not None and id(child) in pending:
+                # Subtree is visited by the executor.
+                result, second_pass = pending.pop(id(child)).result()
+                for_second_pass.extend(second_pass)
+            else:
+                if debug:
+                    visitor.dprint("Visiting {}  type:{} str:{}"
+                                   .format(child.name, type(child).__name__,
+                                           text(child)))
+                if isinstance(child, NonTerminal):
+                    stack.append((child, _results(visitor, handlers, child),
+                                  iter(child)))
+                    break
+
+                # Terminals don't have children so they are visited in place.
+                result = _visit_node(visitor, handlers, child, None,
+                                     for_second_pass)
+            # If visit returns None suppress that child node
+            if result is not None:
+                children.append_result(child.rule_name, result)
+        else:
+            # All children are visited.
+            stack.pop()
+            result = _visit_node(visitor, handlers, node, children,
+                                 for_second_pass)
+            if not stack:
+                return result
+            if result is not None:
+                stack[-1][1].append_result(node.rule_name, result)
+
+
+def _pack_tree(root):
+    """
+    Packs the parse tree to nested tuples for sending to other processes.
+    Terminal is packed as (rule_name, position, value, suppress) and
+    non-terminal as (rule_name, tuple of packed children). Rules are not
+    packed.
+    """
+    if not isinstance(root, NonTerminal):
+        return (root.rule_name, root.position, root.value, root.suppress)
+
+    stack = [(root, [], iter(root))]
+    while True:
+        node, packed, nodes_iter = stack[-1]
+        for child in nodes_iter:
+            if isinstance(child, NonTerminal):
+                stack.append((child, [], iter(child)))
+                break
+            packed.append((child.rule_name, child.position, child.value,
+                           child.suppress))
+        else:
+            stack.pop()
+            packed = (node.rule_name, tuple(packed))
+            if not stack:
+                return packed
+            stack[-1][1].append(packed)
+
+
+def _unpack_tree(packed):
+    """
+    Builds the parse tree from the result of _pack_tree. Rules of the nodes
+    are placeholders which keep only the rule name.
+    """
+    rules = {}
+
+    def rule(rule_name):
+        try:
+            return rules[rule_name]
+        except KeyError:
+            r = rules[rule_name] = ParsingExpression(rule_name=rule_name,
+                                                     root=bool(rule_name))
+            return r
+
+    if len(packed) == 4:
+        rule_name, position, value, suppress = packed
+        return Terminal(rule(rule_name), position, value, suppress=suppress)
+
+    stack = [(packed[0], [], iter(packed[1]))]
+    while True:
+        rule_name, nodes, packed_iter = stack[-1]
+        for child in packed_iter:
+            if len(child) == 2:
+                stack.append((child[0], [], iter(child[1])))
+                break
+            child_rule_name, position, value, suppress = child
+            nodes.append(Terminal(rule(child_rule_name), position, value,
+                                  suppress=suppress))
+        else:
+            stack.pop()
+            node = NonTerminal(rule(rule_name), nodes)
+            if not stack:
+                return node
+            stack[-1][1].append(node)
+
+
+def _visit_packed(visitor, packed):
+    """
+    Visits the packed subtree. Called by the executor in
+    visit_parse_tree. Returns the result of visiting and the list of
+    results for the second pass.
+    """
+    # Visitor is shared by threads of thread executors.
+    visitor = copy.copy(visitor)
+    visitor.for_second_pass = []
+    result = _visit_tree(_unpack_tree(packed), visitor, {})
+    return result, visitor.for_second_pass
+
+
+def visit_parse_tree(parse_tree, visitor, executor=None, parallel_rules=None):
     """
     Applies visitor to parse_tree and runs the second pass
     afterwards.
 
+    If executor is given, subtrees created by the rules from parallel_rules
+    are visited by the executor (e.g. ProcessPoolExecutor from
+    concurrent.futures). Each subtree is packed and sent together with the
+    visitor. The result and the second pass results of each subtree are
+    merged in the input order before the parent node is visited. The second
+    pass is done locally.
+
+    Subtrees must not depend on the state the visitor collects while
+    visiting other parts of the tree, as each is visited by a copy of the
+    visitor. Rules of the nodes in these subtrees keep only the rule name.
+    Visitor and results must be picklable for process executors.
+
     Args:
         parse_tree(ParseTreeNode):
         visitor(PTNodeVisitor):
+        executor(concurrent.futures.Executor): Executor for visiting
+            subtrees. Default is None, i.e. the tree is visited in the
+            current thread.
+        parallel_rules(iterable of str): Names of the rules whose subtrees
+            can be visited independently.
     """
     if not parse_tree:
         raise Exception(
@@ -1226,14 +2524,33 @@ def visit_parse_tree(parse_tree, visitor):
     if visitor.debug:
         visitor.dprint("ASG: First pass")
 
+    pending = None
+    if executor is not None and parallel_rules:
+        # Submit the topmost subtrees created by the parallel rules.
+        parallel_rules = set(parallel_rules)
+        pending = {}
+        stack = [parse_tree] if isinstance(parse_tree, NonTerminal) else []
+        while stack:
+            for node in stack.pop():
+                if isinstance(node, NonTerminal):
+                    if node.rule_name in parallel_rules:
+                        pending[id(node)] = executor.submit(
+                            _visit_packed, visitor, _pack_tree(node))
+                    else:
+                        stack.append(node)
+
     # Visit tree.
-    result = parse_tree.visit(visitor)
+    handlers = {}
+    result = _visit_tree(parse_tree, visitor, handlers, pending)
 
     # Second pass
     if visitor.debug:
         visitor.dprint("ASG: Second pass")
     for sa_name, asg_node in visitor.for_second_pass:
-        getattr(visitor, "second_%s" % sa_name)(asg_node)
+        second = handlers.get(sa_name, (None, None, None))[1]
+        if second is None:
+            second = getattr(visitor, "second_%s" % sa_name)
+        second(asg_node)
 
     return result
 
@@ -1299,25 +2616,57 @@ class SemanticActionResults(list):
     Enables dot access by the name of the rule similar to NonTerminal
     tree navigation.
     Enables index access as well as iteration.
+
+    Attributes:
+        results(dict): Results grouped by the rule name. Built on the first
+            access.
     """
+
+    __slots__ = ['_names', '_results']
+
     def __init__(self):
-        self.results = {}
+        self._names = []
+        self._results = None
 
     def append_result(self, name, result):
-        if name:
-            if name not in self.results:
-                self.results[name] = []
-            self.results[name].append(result)
-
+        self._names.append(name)
         self.append(result)
+        if self._results is not None:
+            self._results = None
+
+    @property
+    def results(self):
+        if self._results is None:
+            results = {}
+            for name, result in zip(self._names, self):
+                if name:
+                    if name not in results:
+                        results[name] = []
+                    results[name].append(result)
+            self._results = results
+        return self._results
 
     def __getattr__(self, attr_name):
-        if attr_name == 'results':
+        # Internal attributes are not rule names. Slots are not set while
+        # the object is copied or unpickled.
+        if attr_name in ('results', '_names', '_results'):
             raise AttributeError
 
         return self.results.get(attr_name, [])
 
 
+class _PlainResults(list):
+    """
+    Results of children for the default visit method of PTNodeVisitor which
+    doesn't access results by rule names.
+    """
+
+    __slots__ = []
+
+    def append_result(self, name, result):
+        self.append(result)
+
+
 # Common semantic actions
 class SemanticActionSingleChild(SemanticAction):
     def first_pass(self, parser, node, children):
@@ -1343,11 +2692,21 @@ class Parser(DebugPrinter):
 
     Attributes:
         comments_model: parser model for comments.
-        comments(list): A list of ParseTreeNode for matched comments.
+        comments(list): A list of ParseTreeNode for matched comments or a list
+            of (start, end) positions of matched comments if `comment_mode`
+            is `span`.
+        comments_count(int): The number of matched comments.
         sem_actions(dict): A dictionary of semantic actions keyed by the
             rule name.
         parse_tree(NonTerminal): The parse tree consisting of NonTerminal and
             Terminal instances.
+        parse_tree_index(ParseTreeIndex): The index of the last parse tree if
+            `tree_index` is set.
+        input_end (int): A position in the input where parsing stops.
+            The end of input for all but `parse_rule`.
+        input_offset (int): A position of the start of `input` in the whole
+            input. Not 0 only in `parse_stream` where the parsed input is
+            dropped.
         in_rule (str): Current rule name.
         in_parse_comments (bool): True if parsing comments.
         in_lex_rule (bool): True if in lexical rule. Currently used in Combine
@@ -1356,14 +2715,37 @@ class Parser(DebugPrinter):
             reporting.
         last_pexpression (ParsingExpression): Last parsing expression
             traversed.
+        eolterm (bool): True if in repetition which should be terminated at
+            the end of line. Newlines are removed from `ws` while in this
+            state.
     """
 
+    # Parser state is read and updated many times for each input position so
+    # it is kept in slots. Concrete parsers (ParserPython, ParserPEG) don't
+    # define `__slots__` so their additional state is kept in the instance
+    # `__dict__`.
+    __slots__ = ['position', 'input', 'ws', 'skipws', 'eolterm',
+                 'reduce_tree', 'autokwd', 'ignore_case', 'memoization',
+                 'comments_model', 'comments', 'comments_count',
+                 'comment_mode', 'comment_positions',
+                 'sem_actions', 'parse_tree', 'keyword_regex', 'in_rule',
+                 'in_parse_comments', 'in_lex_rule', 'in_not',
+                 'last_pexpression', 'nm', '_source_map', 'file_name',
+                 'cache_hits', 'cache_misses', 'parser_model', 'tree_index',
+                 'parse_tree_index', 'visitor', '_visit_handlers',
+                 '_events', '_events_guards', '_events_handler',
+                 'ast_builder', 'input_end', '_rules', 'bytes_mode',
+                 'input_offset', '_input_line', '_expressions',
+                 'parse_cache']
+
     # Not marker for NoMatch rules list. Used if the first unsuccessful rule
     # match is Not.
     FIRST_NOT = Not()
 
     def __init__(self, skipws=True, ws=None, reduce_tree=False, autokwd=False,
-                 ignore_case=False, memoization=False, **kwargs):
+                 ignore_case=False, memoization=False, tree_index=False,
+                 comment_mode=COMMENTS_TREE, bytes_mode=False,
+                 parse_cache=None, **kwargs):
         """
         Args:
             skipws (bool): Should the whitespace skipping be done.  Default is
@@ -1376,30 +2758,59 @@ class Parser(DebugPrinter):
             ignore_case(bool): If case is ignored (default=False)
             memoization(bool): If memoization should be used
                 (a.k.a. packrat parsing)
+            tree_index(bool): If the parse tree should be indexed by rule
+                names at the end of parsing. See ParseTreeIndex.
+                Default is False.
+            comment_mode(str): What is kept for matched comments.
+                `tree` (default) - parse trees of comments are kept in
+                `comments`, `span` - only (start, end) positions are kept in
+                `comments`, `discard` - comments are only counted in
+                `comments_count`. In `span` and `discard` modes parse trees
+                for comments are not built.
+            bytes_mode(bool): If the input is bytes (or mmap, memoryview)
+                instead of text. String matches, regular expressions and
+                whitespace are encoded to UTF-8 and terminals hold bytes.
+                Positions are byte offsets. Default is False.
+            parse_cache(ParseCache): If given, parse trees of files parsed
+                by `parse_file` are kept in this on-disk cache and loaded
+                from it if the file content, the grammar and the parser
+                settings are unchanged. See `arpeggio.cache`.
         """
 
         super(Parser, self).__init__(**kwargs)
 
         # Used to indicate state in which parser should not
         # treat newlines as whitespaces.
-        self._eolterm = False
+        self.eolterm = False
 
         self.skipws = skipws
         if ws is not None:
             self.ws = ws
         else:
             self.ws = DEFAULT_WS
+        self.bytes_mode = bytes_mode
+        if bytes_mode and isinstance(self.ws, text):
+            self.ws = self.ws.encode('utf-8')
 
         self.reduce_tree = reduce_tree
         self.autokwd = autokwd
         self.ignore_case = ignore_case
         self.memoization = memoization
+        self.tree_index = tree_index
+        if comment_mode not in (COMMENTS_TREE, COMMENTS_SPAN,
+                                COMMENTS_DISCARD):
+            raise ValueError("Invalid comment mode '{}'."
+                             .format(comment_mode))
+        self.comment_mode = comment_mode
+        self.parse_cache = parse_cache
         self.comments_model = None
         self.comments = []
+        self.comments_count = 0
         self.comment_positions = {}
         self.sem_actions = {}
 
         self.parse_tree = None
+        self.parse_tree_index = None
 
         # Create regex used for autokwd matching
         flags = 0
@@ -1423,33 +2834,25 @@ class Parser(DebugPrinter):
         # Last parsing expression traversed
         self.last_pexpression = None
 
-    @property
-    def ws(self):
-        return self._ws
+        # Visitor used in fused parse-and-visit mode
+        self.visitor = None
 
-    @ws.setter
-    def ws(self, new_value):
-        self._real_ws = new_value
-        self._ws = new_value
-        if self.eolterm:
-            self._ws = self._ws.replace('\n', '').replace('\r', '')
+        # Uncommitted parse events. Used only while parsing to events.
+        self._events = None
+        self._events_guards = 0
+        self._events_handler = None
 
-    @property
-    def eolterm(self):
-        return self._eolterm
-
-    @eolterm.setter
-    def eolterm(self, new_value):
-        # Toggle newline char in ws on eolterm property set.
-        # During eolterm state parser should not treat
-        # newline as a whitespace.
-        self._eolterm = new_value
-        if self._eolterm:
-            self._ws = self._ws.replace('\n', '').replace('\r', '')
-        else:
-            self._ws = self._real_ws
+        # Builder of AST nodes used instead of the parse tree.
+        # See arpeggio.ast
+        self.ast_builder = None
 
-    def parse(self, _input, file_name=None):
+        # Rules by name. Collected on the first call of `parse_rule`.
+        self._rules = None
+
+        # Parsing expressions of the grammar. See `_model_expressions`.
+        self._expressions = None
+
+    def parse(self, _input, file_name=None, visitor=None):
         """
         Parses input and produces parse tree.
 
@@ -1457,23 +2860,19 @@ class Parser(DebugPrinter):
             _input(str): An input string to parse.
             file_name(str): If input is loaded from file this can be
                 set to file name. It is used in error messages.
+            visitor(PTNodeVisitor): If given, parsing and visiting are fused.
+                Visitor methods are called as each rule succeeds and the
+                result of visiting is returned instead of the parse tree.
+                The parse tree is not kept. See `_visit_fused`.
         """
-        self.position = 0  # Input position
-        self.nm = None  # Last NoMatch exception
-        self.line_ends = []
-        self.input = _input
-        self.file_name = file_name
-        self.comment_positions = {}
-        self.cache_hits = 0
-        self.cache_misses = 0
+        if visitor is not None:
+            return self._parse_visit(_input, file_name, visitor)
+
+        self._init_input(_input, file_name)
         try:
             self.parse_tree = self._parse()
         except NoMatch as e:
-            # Remove Not marker
-            if e.rules[0] is Parser.FIRST_NOT:
-                del e.rules[0]
-            # Get line and column from position
-            e.line, e.col = self.pos_to_linecol(e.position)
+            self._finish_nomatch(e)
             raise
         finally:
             # At end of parsing clear all memoization caches.
@@ -1481,24 +2880,646 @@ class Parser(DebugPrinter):
             if self.memoization:
                 self._clear_caches()
 
+        # Parse tree is not built in fused visiting, event and AST modes.
+        tree_built = self.visitor is None and self._events is None \
+            and self.ast_builder is None
+
+        if self.tree_index and self.parse_tree is not None and tree_built:
+            self.parse_tree_index = ParseTreeIndex(self.parse_tree)
+
         # In debug mode export parse tree to dot file for
-        # visualization
-        if self.debug and self.parse_tree:
-            from arpeggio.export import PTDOTExporter
+        # visualization. Export of large trees is limited.
+        if self.debug and self.parse_tree and tree_built:
+            from arpeggio.export import PTDOTExporter, DEBUG_MAX_NODES
             root_rule_name = self.parse_tree.rule_name
-            PTDOTExporter().exportFile(
+            PTDOTExporter(max_nodes=DEBUG_MAX_NODES).exportFile(
                 self.parse_tree, "{}_parse_tree.dot".format(root_rule_name))
         return self.parse_tree
 
-    def parse_file(self, file_name):
+    def recognize(self, _input, file_name=None):
+        """
+        Checks if the input is valid without building the parse tree.
+        Only the input position is tracked and memoization (if enabled) keeps
+        only end positions. Raises the same NoMatch as `parse` if the input
+        is not valid.
+
+        Args:
+            _input(str): An input string to check.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+
+        Returns:
+            True
+        """
+        self._init_input(_input, file_name)
+        self.parse_tree = None
+        try:
+            self.parser_model.recognize(self)
+        except NoMatch as e:
+            self._finish_nomatch(e)
+            raise
+        finally:
+            if self.memoization:
+                self._clear_caches()
+        return True
+
+    def iter_parse(self, _input, file_name=None, rule_name=None):
+        """
+        Parses input and yields the parse tree of each item of the top-level
+        repetition as soon as it is parsed. The whole parse tree is never
+        built.
+
+        The root rule must be a repetition (ZeroOrMore or OneOrMore) or a
+        sequence with a repetition, e.g.:
+
+            def records(): return header, ZeroOrMore(record), EOF
+
+        Results of the other parts of the root rule are not kept. Memoization
+        caches and comment positions are discarded after each item and
+        `comments` holds only the comments matched while parsing the last
+        item so memory use is bounded by the size of the item.
+
+        The parser must not be used for other parsing until the iteration is
+        done.
+
+        Args:
+            _input(str): An input string to parse.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+            rule_name(str): The name of the rule of repetition items. If not
+                given the first repetition in the root rule is used.
+        """
+        self._init_input(_input, file_name)
+        return self._iter_items(rule_name)
+
+    def parse_stream(self, source, file_name=None, rule_name=None,
+                     chunk_size=65536, lookahead=1024):
+        """
+        Parses input read from a file-like object or an iterable of chunks
+        and yields the parse tree of each item of the top-level repetition
+        as soon as it is parsed. See `iter_parse`.
+
+        Chunks are read on demand. Parsing of each item is repeated with more
+        input if it reached the last `lookahead` characters of the read input
+        so `lookahead` must be larger than the distance any regular
+        expression looks ahead past the end of its match (the length of the
+        longest string match is added). The input before the current item is
+        dropped once it is larger than `chunk_size` so memory use depends on
+        the item size and not on the input size.
+
+        Positions of the yielded nodes and errors are positions in the whole
+        input.
+
+        Args:
+            source: A file-like object or an iterable of input chunks. Chunks
+                are bytes in bytes mode.
+            file_name(str): The name of the source used in error messages.
+            rule_name(str): The name of the rule of repetition items. If not
+                given the first repetition in the root rule is used.
+            chunk_size(int): The size of chunks read from file-like objects.
+            lookahead(int): How close to the end of the read input parsing
+                can get before more input is read.
+        """
+        self._init_input(b'' if self.bytes_mode else '', file_name)
+        return self._iter_items(rule_name, _read_chunks(source, chunk_size),
+                                chunk_size, lookahead)
+
+    def _top_repetition(self, rule_name=None):
+        """
+        Returns (elements, index) where elements are the top-level parts of
+        the root rule and index is the index of the repetition of the given
+        rule. Raises GrammarError if there is no such repetition.
+        """
+        model = self.parser_model
+        elements = model.nodes if type(model) is Sequence else [model]
+        for index, repetition in enumerate(elements):
+            if isinstance(repetition, (ZeroOrMore, OneOrMore)) and \
+                    (rule_name is None or
+                     repetition.nodes[0].rule_name == rule_name):
+                return elements, index
+        raise GrammarError(
+            "Root rule '{}' has no top-level repetition{}."
+            .format(model.rule_name,
+                    " of '{}'".format(rule_name) if rule_name else ""))
+
+    def _iter_items(self, rule_name, chunks=None, chunk_size=0, lookahead=0,
+                    full=False):
+        """
+        Parses the input given by `iter_parse` or read by `parse_stream`
+        and yields items of the top-level repetition. If `full` is set the
+        results of all top-level parts of the root rule are yielded and
+        comments are kept for the whole input.
+        """
+        model = self.parser_model
+        elements, index = self._top_repetition(rule_name)
+        repetition = elements[index]
+
+        # Parser model nodes. Memoization caches are discarded after each
+        # item. String matches fail at their start so the longest one is
+        # added to the lookahead.
+        cached = []
+        longest_match = 0
+        processed = set()
+        stack = [model]
+        if self.comments_model is not None:
+            stack.append(self.comments_model)
+        while stack:
+            node = stack.pop()
+            if id(node) not in processed:
+                processed.add(id(node))
+                cached.append(node)
+                stack.extend(node.nodes)
+                if getattr(node, 'sep', None):
+                    stack.append(node.sep)
+                if isinstance(node, StrMatch):
+                    longest_match = max(longest_match, len(node._to_match))
+        if not self.memoization:
+            cached = []
+        lookahead += longest_match
+
+        self.parse_tree = None
+        self.in_rule = model.rule_name
+        item = repetition.nodes[0]
+        sep = repetition.sep
+        old_ws = self.ws
+        old_skipws = self.skipws
+        old_eolterm = self.eolterm
+        if type(model) is Sequence:
+            if model.ws is not None:
+                self.ws = model.ws
+            if model.skipws is not None:
+                self.skipws = model.skipws
+        # Comments from this index are not yet moved to positions in the
+        # whole input.
+        comments_start = 0
+        try:
+            try:
+                self.last_pexpression = model
+                for element in elements[:index]:
+                    result = self._parse_step(element, chunks, chunk_size,
+                                              lookahead)
+                    if full and result:
+                        for node in self._stream_nodes(result,
+                                                       comments_start):
+                            yield node
+                        comments_start = len(self.comments)
+
+                if repetition.eolterm:
+                    rep_old_ws = self.ws
+                    self.eolterm = True
+                    self.ws = _no_newlines(rep_old_ws)
+
+                first = True
+                result = None
+                while True:
+                    self.last_pexpression = repetition
+                    if not full:
+                        self.comments = []
+                        comments_start = 0
+                    c_pos = self.position
+                    sep_result = None
+                    try:
+                        if sep and result:
+                            sep_result = self._parse_step(
+                                sep, chunks, chunk_size, lookahead)
+                            if not sep_result:
+                                break
+                        result = self._parse_step(item, chunks, chunk_size,
+                                                  lookahead)
+                        if not result:
+                            break
+                    except NoMatch:
+                        self.position = c_pos  # Backtracking
+                        if first and isinstance(repetition, OneOrMore):
+                            raise
+                        break
+                    first = False
+
+                    # Positions before this item will not be parsed again.
+                    for node in cached:
+                        if node._result_cache:
+                            node._result_cache = {}
+                    self.comment_positions = {}
+
+                    if full and sep_result:
+                        for node in self._stream_nodes(sep_result,
+                                                       comments_start):
+                            yield node
+                    for node in self._stream_nodes(result, comments_start):
+                        yield node
+                    comments_start = len(self.comments)
+
+                    if chunks is not None and self.position >= chunk_size:
+                        self._drop_input(self.position)
+
+                if repetition.eolterm:
+                    self.eolterm = old_eolterm
+                    self.ws = rep_old_ws
+
+                self.last_pexpression = model
+                for element in elements[index + 1:]:
+                    result = self._parse_step(element, chunks, chunk_size,
+                                              lookahead)
+                    if full and result:
+                        for node in self._stream_nodes(result,
+                                                       comments_start):
+                            yield node
+                        comments_start = len(self.comments)
+                if full:
+                    self._stream_nodes([], comments_start)
+            except NoMatch as e:
+                e.position += self.input_offset
+                self._finish_nomatch(e)
+                raise
+        finally:
+            self.ws = old_ws
+            self.skipws = old_skipws
+            self.eolterm = old_eolterm
+            self.last_pexpression = None
+            self.in_rule = ''
+            if self.memoization:
+                self._clear_caches()
+
+    def _stream_nodes(self, result, comments_start):
+        """
+        Returns parse tree nodes of the result of a top-level part of the
+        root rule. Positions of the nodes and of the comments from the given
+        index are moved to positions in the whole input.
+        """
+        if isinstance(result, ParseTreeNode):
+            nodes = [result]
+        else:
+            nodes = flatten(result)
+        offset = self.input_offset
+        if offset:
+            _shift_positions(nodes, offset)
+            comments = self.comments
+            if self.comment_mode == COMMENTS_SPAN:
+                comments[comments_start:] = [
+                    (start + offset, end + offset)
+                    for start, end in comments[comments_start:]]
+            else:
+                _shift_positions(comments[comments_start:], offset)
+        return nodes
+
+    def _parse_step(self, expression, chunks, chunk_size, lookahead):
+        """
+        Parses the given expression at the current position. If the input is
+        read from chunks and parsing reached the last `lookahead` characters
+        of the read input it is repeated with at least `chunk_size` more
+        characters.
+        """
+        c_pos = self.position
+        comments_count = len(self.comments)
+        while True:
+            error = None
+            try:
+                result = expression.parse(self)
+            except NoMatch as e:
+                error = e
+            if chunks is not None:
+                reach = self.position
+                if self.nm is not None and self.nm.position > reach:
+                    reach = self.nm.position
+                if reach + lookahead >= self.input_end and \
+                        self._read_input(chunks,
+                                         reach + lookahead + chunk_size):
+                    # Results and errors may be due to missing input.
+                    self.position = c_pos
+                    del self.comments[comments_count:]
+                    if self.nm is not None and self.nm.position >= c_pos:
+                        self.nm = None
+                    self.comment_positions = {}
+                    if self.memoization:
+                        self._clear_caches()
+                    continue
+            if error is not None:
+                raise error
+            return result
+
+    def _read_input(self, chunks, end):
+        """
+        Appends chunks to the input until it is longer than `end` or
+        there are no more chunks. Returns False if nothing is read.
+        """
+        parts = [self.input]
+        size = self.input_end
+        for chunk in chunks:
+            parts.append(chunk)
+            size += len(chunk)
+            if size > end:
+                break
+        if len(parts) == 1:
+            return False
+        self.input = parts[0][:0].join(parts)
+        self.input_end = size
+        self._source_map = None
+        return True
+
+    def _drop_input(self, count):
+        """
+        Drops the given number of characters from the start of the input.
+        Position of the rest of the input in the whole input is kept in
+        `input_offset`.
+        """
+        dropped = self.input[:count]
+        newline = b'\n' if isinstance(dropped, bytes) else '\n'
+        last_newline = dropped.rfind(newline)
+        if last_newline >= 0:
+            line_start, line = self._input_line
+            self._input_line = (self.input_offset + last_newline + 1,
+                                line + dropped.count(newline))
+        self.input_offset += count
+        self.input = self.input[count:]
+        self.input_end = len(self.input)
+        self.position -= count
+        self._source_map = None
+        if self.nm is not None:
+            if self.nm.position >= count:
+                self.nm.position -= count
+            else:
+                self.nm = None
+
+    def parse_rule(self, rule_name, _input, start=0, end=None,
+                   file_name=None):
+        """
+        Parses a part of the input by the given rule of the parser model.
+        The input is not copied. Positions of the nodes and errors are
+        positions in the whole input. The rule may match only a prefix of
+        the part, i.e. `EOF` matches at the end of the part.
+
+        Args:
+            rule_name(str): The name of the rule to parse with.
+            _input(str): An input string.
+            start(int): A position in the input where parsing starts.
+            end(int): A position in the input where parsing stops. The end of
+                the input by default.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+
+        Returns:
+            A tuple (parse tree node, end position). The node is None if the
+            rule doesn't produce a result (e.g. a rule that matched empty
+            input).
+        """
+        if self._rules is None:
+            rules = {}
+            for expr in self._model_expressions():
+                if expr.root:
+                    rules.setdefault(expr.rule_name, expr)
+            self._rules = rules
+        try:
+            rule = self._rules[rule_name]
+        except KeyError:
+            raise ValueError("Unknown rule '{}'.".format(rule_name))
+
+        self._init_input(_input, file_name)
+        if end is not None:
+            self.input_end = min(end, self.input_end)
+        self.position = start
+        self.parse_tree = None
+        self.last_pexpression = None
+        try:
+            result = rule.parse(self)
+        except NoMatch as e:
+            self._finish_nomatch(e)
+            raise
+        finally:
+            self.input_end = len(_input)
+            if self.memoization:
+                self._clear_caches()
+        return result or None, self.position
+
+    def _model_expressions(self):
+        """
+        Returns a list of all parsing expressions of the parser model and
+        the comments model. The order depends only on the grammar so the
+        index in the list can be used as a rule id in serialized parse trees.
+        """
+        if self._expressions is None:
+            expressions = []
+            processed = set()
+            stack = [self.parser_model]
+            if self.comments_model is not None:
+                stack.insert(0, self.comments_model)
+            while stack:
+                expr = stack.pop()
+                if id(expr) not in processed:
+                    processed.add(id(expr))
+                    expressions.append(expr)
+                    stack.extend(reversed(expr.nodes))
+                    if getattr(expr, 'sep', None):
+                        stack.append(expr.sep)
+            self._expressions = expressions
+        return self._expressions
+
+    def _init_input(self, _input, file_name):
+        """
+        Resets parser state for the new input.
+        """
+        self.position = 0  # Input position
+        self.nm = None  # Last NoMatch exception
+        self.eolterm = False
+        self._source_map = None
+        self.input = _input
+        self.input_end = len(_input)
+        self.input_offset = 0
+        self._input_line = (0, 1)
+        self.file_name = file_name
+        self.comment_positions = {}
+        self.comments = []
+        self.comments_count = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.parse_tree_index = None
+
+    def _finish_nomatch(self, e):
+        """
+        Prepares NoMatch raised from the parser model for the user.
+        """
+        # Remove Not marker
+        if e.rules[0] is Parser.FIRST_NOT:
+            del e.rules[0]
+        # Get line and column from position
+        e.line, e.col = self.pos_to_linecol(e.position)
+
+    def parse_events(self, _input, handler, file_name=None):
+        """
+        Parses input without building the parse tree. Parsing is reported
+        to the handler as a stream of events in the input order.
+
+        For each successful rule `handler(EVENT_ENTER, rule_name, position,
+        None)` is called before the events of its content and
+        `handler(EVENT_EXIT, rule_name, position_end, None)` after. For each
+        matched terminal `handler(EVENT_TERMINAL, rule_name, position,
+        value)` is called.
+
+        Events are passed to the handler as soon as parser can't backtrack
+        over them. Until then they are kept in a buffer so the memory used
+        depends on the nesting of the grammar and on the amount of input
+        parser may backtrack over and not on the size of the input.
+
+        Events follow the parse tree built without tree reduction. Rules
+        which match empty input don't produce events. Memoization is not
+        used. If parsing fails NoMatch is raised, events that are already
+        passed to the handler are not revoked.
+
+        Args:
+            _input(str): An input string to parse.
+            handler(callable): Called with (event, rule_name, position, value)
+                for each event.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+        """
+        memoization = self.memoization
+        self.memoization = False
+        self._events = []
+        self._events_guards = 0
+        self._events_handler = handler
+        try:
+            self.parse(_input, file_name)
+            self._commit_events()
+        finally:
+            self.memoization = memoization
+            self._events = None
+            self._events_handler = None
+            self.parse_tree = None
+
+    def _commit_events(self):
+        """
+        Passes buffered parse events to the handler.
+        """
+        events = self._events
+        if not events:
+            return
+
+        # Enter event takes the position of the first event that follows.
+        position = self.position
+        for event in reversed(events):
+            if event[2] is None:
+                event[2] = position
+            else:
+                position = event[2]
+
+        handler = self._events_handler
+        for event in events:
+            handler(*event)
+        del events[:]
+
+    def _parse_visit(self, _input, file_name, visitor):
+        """
+        Fused parse-and-visit. The result is the same as
+        `visit_parse_tree(self.parse(_input), visitor)` for visitors
+        which don't depend on the order of calls to visit methods or on
+        the types of the children of the visited node.
+        """
+        self.visitor = visitor
+        self._visit_handlers = {}
+        try:
+            result = self.parse(_input, file_name)
+        finally:
+            self.visitor = None
+            self.parse_tree = None
+            self.parse_tree_index = None
+
+        if result is None:
+            raise Exception(
+                "Parse tree is empty. You did call parse(), didn't you?")
+
+        if isinstance(result, VisitedNode):
+            if result.second_pass:
+                visitor.for_second_pass.extend(result.second_pass)
+            result = result.result
+        else:
+            # Root rule produced a terminal.
+            result = _visit_node(visitor, self._visit_handlers, result,
+                                 None, visitor.for_second_pass)
+
+        # Second pass
+        handlers = self._visit_handlers
+        for sa_name, asg_node in visitor.for_second_pass:
+            second = handlers.get(sa_name, (None, None, None))[1]
+            if second is None:
+                second = getattr(visitor, "second_%s" % sa_name)
+            second(asg_node)
+
+        return result
+
+    def _visit_fused(self, rule, nodes):
+        """
+        Visits the result of the rule whose non-terminal nodes are already
+        visited and replaced by VisitedNode instances. Returns a VisitedNode
+        standing in for the non-terminal of the result. The non-terminal is
+        built only to be passed to the visit method.
+
+        Visiting results are kept in VisitedNodes so if parser backtracks
+        and drops a node its result and second pass calls are dropped too.
+        Visitor methods can thus be called for nodes which will not be in
+        the final parse tree and should not have side-effects.
+        """
+        visitor = self.visitor
+        handlers = self._visit_handlers
+        visit, second, plain = _visit_handler(visitor, handlers,
+                                              rule.rule_name)
+        second_pass = []
+        children = _PlainResults() if plain else SemanticActionResults()
+        for child in nodes:
+            if isinstance(child, VisitedNode):
+                result = child.result
+                if child.second_pass:
+                    second_pass.extend(child.second_pass)
+            else:
+                result = _visit_node(visitor, handlers, child, None,
+                                     second_pass)
+            # If visit returns None suppress that child node
+            if result is not None:
+                children.append_result(child.rule_name, result)
+
+        result = None
+        if visit is not None:
+            result = visit(NonTerminal(rule, nodes), children)
+            if second is not None:
+                second_pass.append((rule.rule_name, result))
+        return VisitedNode(rule, nodes, result, second_pass or None)
+
+    def parse_file(self, file_name, mmap=False):
         """
         Parses content from the given file.
         Args:
             file_name(str): A file name.
+            mmap(bool): If True the file is memory mapped and decoded
+                directly from the mapping. The file content is not read into
+                an intermediate bytes buffer which lowers peak memory use and
+                read time for large files. In bytes mode the mapped file is
+                parsed without decoding.
+
+        If the parser has a `parse_cache` the parse tree is loaded from the
+        cache if possible.
         """
-        with codecs.open(file_name, 'r', 'utf-8') as f:
-            content = f.read()
+        if self.bytes_mode:
+            if mmap:
+                # Mapped file is parsed in place. It is closed when the
+                # parser input is replaced.
+                content = _map_file(file_name)
+            else:
+                with open(file_name, 'rb') as f:
+                    content = f.read()
+        elif mmap:
+            content = _map_file(file_name)
+            if content:
+                mapped = content
+                try:
+                    content = codecs.utf_8_decode(mapped, 'strict', True)[0]
+                finally:
+                    mapped.close()
+            else:
+                content = ''
+        else:
+            with codecs.open(file_name, 'r', 'utf-8') as f:
+                content = f.read()
 
+        if self.parse_cache is not None:
+            return self.parse_cache.parse(self, content, file_name)
         return self.parse(content, file_name=file_name)
 
     def getASG(self, sem_actions=None, defaults=True):
@@ -1601,30 +3622,33 @@ class Parser(DebugPrinter):
 
         return asg
 
+    @property
+    def line_ends(self):
+        """
+        Positions of the newline characters of the current input.
+
+        Deprecated. Use `source_map` instead.
+        """
+        warnings.warn("Parser.line_ends is deprecated. Use Parser.source_map "
+                      "instead.", DeprecationWarning, stacklevel=2)
+        return [start - 1 for start in self.source_map.line_starts[1:]]
+
+    @property
+    def source_map(self):
+        """
+        SourceMap of the current input. Built on first access.
+        """
+        if self._source_map is None:
+            line_start, line = self._input_line
+            self._source_map = SourceMap(self.input, self.input_offset,
+                                         line_start, line)
+        return self._source_map
+
     def pos_to_linecol(self, pos):
         """
         Calculate (line, column) tuple for the given position in the stream.
         """
-        if not self.line_ends:
-            try:
-                # TODO: Check this implementation on Windows.
-                self.line_ends.append(self.input.index("\n"))
-                while True:
-                    try:
-                        self.line_ends.append(
-                            self.input.index("\n", self.line_ends[-1] + 1))
-                    except ValueError:
-                        break
-            except ValueError:
-                pass
-
-        line = bisect.bisect_left(self.line_ends, pos)
-        col = pos
-        if line > 0:
-            col -= self.line_ends[line - 1]
-            if self.input[self.line_ends[line - 1]] in '\n\r':
-                col -= 1
-        return line + 1, col + 1
+        return self.source_map.pos_to_linecol(pos)
 
     def context(self, length=None, position=None):
         """
@@ -1637,15 +3661,17 @@ class Parser(DebugPrinter):
         """
         if not position:
             position = self.position
+        else:
+            position -= self.input_offset
         if length:
             retval = "{}*{}*{}".format(
-                text(self.input[max(position - 10, 0):position]),
-                text(self.input[position:position + length]),
-                text(self.input[position + length:position + 10]))
+                text(_to_text(self.input[max(position - 10, 0):position])),
+                text(_to_text(self.input[position:position + length])),
+                text(_to_text(self.input[position + length:position + 10])))
         else:
             retval = "{}*{}".format(
-                text(self.input[max(position - 10, 0):position]),
-                text(self.input[position:position + 10]))
+                text(_to_text(self.input[max(position - 10, 0):position])),
+                text(_to_text(self.input[position:position + 10])))
 
         return retval.replace('\n', ' ').replace('\r', '')
 
@@ -1671,6 +3697,36 @@ class Parser(DebugPrinter):
 
         raise self.nm
 
+    def _to_bytes_mode(self):
+        """
+        Converts the parser model for matching bytes input. Called by
+        concrete parsers after the parser model is built if `bytes_mode` is
+        set.
+        """
+        processed = set()
+        stack = [self.parser_model]
+        if self.comments_model is not None:
+            stack.append(self.comments_model)
+        while stack:
+            expr = stack.pop()
+            if id(expr) in processed:
+                continue
+            processed.add(id(expr))
+            stack.extend(expr.nodes)
+            if getattr(expr, 'sep', None):
+                stack.append(expr.sep)
+
+            if isinstance(getattr(expr, 'ws', None), text):
+                expr.ws = expr.ws.encode('utf-8')
+            if isinstance(expr, RegExMatch):
+                regex = expr.regex
+                if isinstance(regex.pattern, text):
+                    expr.regex = re.compile(regex.pattern.encode('utf-8'),
+                                            regex.flags & ~re.UNICODE)
+            elif isinstance(expr, StrMatch):
+                if isinstance(expr._to_match, text):
+                    expr._to_match = expr.to_match.encode('utf-8')
+
     def _clear_caches(self):
         """
         Clear memoization caches if packrat parser is used.
@@ -1680,6 +3736,19 @@ class Parser(DebugPrinter):
             self.comments_model._clear_cache()
 
 
+def _map_file(file_name):
+    """
+    Returns read-only memory mapping of the given file. Empty bytes are
+    returned for empty files as they can't be mapped.
+    """
+    import mmap
+    with open(file_name, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+
 class CrossRef(object):
     '''
     Used for rule reference resolving.
@@ -1712,6 +3781,9 @@ class ParserPython(Parser):
             self.comments_model.root = True
             self.comments_model.rule_name = comment_def.__name__
 
+        if self.bytes_mode:
+            self._to_bytes_mode()
+
         # In debug mode export parser model to dot for
         # visualization
         if self.debug:
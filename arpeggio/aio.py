@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: aio.py
+# Purpose: Parsing from asyncio code without blocking the event loop.
+# License: MIT License
+#######################################################################
+"""
+Asyncio parsing API. Requires Python 3.5+ and is not imported by
+`arpeggio`:
+
+    from arpeggio.aio import parse_async
+
+    tree = await parse_async(parser, input_str)
+
+Parsing runs in an executor or, if `yield_every` is given, in the event
+loop with periodic yields to other tasks. Control is given to other tasks
+only between the items of the top-level repetition of the root rule (see
+`Parser.iter_parse`) so a single large item blocks the loop until it is
+parsed. Grammars without a top-level repetition are always parsed in the
+executor.
+
+Parsing can be cancelled in both modes. If the root rule has a top-level
+repetition parsing is done item by item and cancellation stops it at the
+next item. Otherwise parsing in the executor can't be interrupted and the
+result is discarded.
+
+The parser must not be used by other code while parsing is in progress.
+"""
+import asyncio
+import codecs
+import threading
+from arpeggio import GrammarError, NonTerminal, ParseTreeIndex
+
+
+async def parse_async(parser, _input, file_name=None, executor=None,
+                      yield_every=None):
+    """
+    Parses the input without blocking the event loop and returns the parse
+    tree.
+
+    Args:
+        parser(Parser): The parser.
+        _input(str): An input string to parse.
+        file_name(str): If input is loaded from file this can be
+            set to file name. It is used in error messages.
+        executor(concurrent.futures.Executor): The executor to parse in.
+            The default executor of the loop is used by default.
+        yield_every(int): If given, parsing is done in the event loop
+            and control is given to other tasks after each `yield_every`
+            items of the top-level repetition. The loop is not given
+            control while an item is parsed. If the root rule has no
+            top-level repetition parsing is done in the executor.
+    """
+    if yield_every is not None and _has_top_repetition(parser):
+        parser._init_input(_input, file_name)
+        items = parser._iter_items(None, full=True)
+        nodes = []
+        try:
+            for node in items:
+                nodes.append(node)
+                if len(nodes) % yield_every == 0:
+                    await asyncio.sleep(0)
+        finally:
+            items.close()
+        return _parse_tree(parser, nodes)
+
+    def parse(cancelled):
+        if not _has_top_repetition(parser):
+            return parser.parse(_input, file_name)
+        parser._init_input(_input, file_name)
+        return _collect(parser, parser._iter_items(None, full=True),
+                        cancelled)
+
+    return await _run(parse, executor)
+
+
+async def parse_stream_async(parser, reader, file_name=None, executor=None,
+                             chunk_size=65536, lookahead=1024):
+    """
+    Parses input read from the asyncio stream reader and returns the parse
+    tree. Input is read on demand as in `Parser.parse_stream` while parsing
+    runs in the executor. The root rule must have a top-level repetition.
+
+    Args:
+        parser(Parser): The parser.
+        reader(asyncio.StreamReader): The reader of the input. The input is
+            decoded from UTF-8 unless the parser is in bytes mode.
+        file_name(str): The name of the source used in error messages.
+        executor(concurrent.futures.Executor): The executor to parse in.
+            The default executor of the loop is used by default.
+        chunk_size(int): The size of chunks read from the reader.
+        lookahead(int): See `Parser.parse_stream`.
+    """
+    loop = _running_loop()
+    parser._top_repetition()
+    pending = []
+
+    def chunks(cancelled):
+        decoder = None if parser.bytes_mode \
+            else codecs.getincrementaldecoder('utf-8')()
+        while not cancelled.is_set():
+            read = asyncio.run_coroutine_threadsafe(reader.read(chunk_size),
+                                                    loop)
+            pending[:] = [read]
+            data = read.result()
+            if decoder is None:
+                chunk = data
+            else:
+                chunk = decoder.decode(data, not data)
+            if chunk:
+                yield chunk
+            if not data:
+                return
+
+    def parse(cancelled):
+        parser._init_input(b'' if parser.bytes_mode else '', file_name)
+        items = parser._iter_items(None, chunks(cancelled), chunk_size,
+                                   lookahead, full=True)
+        return _collect(parser, items, cancelled)
+
+    def cancel():
+        for read in pending:
+            read.cancel()
+
+    return await _run(parse, executor, cancel)
+
+
+async def _run(parse, executor, on_cancel=None):
+    """
+    Runs `parse(cancelled)` in the executor. If the awaiting task is
+    cancelled `cancelled` event is set.
+    """
+    loop = _running_loop()
+    cancelled = threading.Event()
+    try:
+        return await loop.run_in_executor(executor, parse, cancelled)
+    except asyncio.CancelledError:
+        cancelled.set()
+        if on_cancel is not None:
+            on_cancel()
+        raise
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        # Python < 3.7
+        return asyncio.get_event_loop()
+
+
+def _has_top_repetition(parser):
+    try:
+        parser._top_repetition()
+    except GrammarError:
+        return False
+    return True
+
+
+def _collect(parser, items, cancelled):
+    """
+    Collects top-level nodes until the input is parsed or parsing is
+    cancelled.
+    """
+    nodes = []
+    try:
+        for node in items:
+            if cancelled.is_set():
+                return None
+            nodes.append(node)
+    finally:
+        items.close()
+    return _parse_tree(parser, nodes)
+
+
+def _parse_tree(parser, nodes):
+    """
+    Creates the parse tree from the top-level nodes the way `Parser.parse`
+    does.
+    """
+    if not nodes:
+        tree = None
+    elif parser.reduce_tree and len(nodes) == 1:
+        tree = nodes[0]
+    else:
+        tree = NonTerminal(parser.parser_model, nodes)
+    parser.parse_tree = tree
+    if parser.tree_index and tree is not None:
+        parser.parse_tree_index = ParseTreeIndex(tree)
+    return tree
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: ast.py
+# Purpose: AST node classes derived from the grammar and AST building
+#          during parsing.
+# License: MIT License
+#######################################################################
+
+from __future__ import unicode_literals
+import keyword
+import re
+from arpeggio import Sequence, OrderedChoice, ZeroOrMore, OneOrMore, \
+    SyntaxPredicate, Match, StrMatch, Combine, EndOfFile, Terminal, \
+    _join_values
+
+# Multiplicity of the field. Used in field inference.
+ONE = 1
+MANY = 2
+
+
+class ASTNode(object):
+    """
+    Base class for AST node classes generated by `ast_classes`.
+
+    Each rule which has references to other rules gets its own subclass
+    with a slot for each referenced rule. A field is a list if the rule
+    can be matched many times, otherwise it is a single value or None.
+    Fields of referenced terminal rules (e.g. regular expression matches)
+    are strings. Anonymous terminals which are not suppressed (e.g. string
+    matches in ordered choices) are collected in the `tokens` list.
+
+    Attributes:
+        position (int): A position in the input where the node starts.
+        position_end (int): A position in the input where the node ends.
+        rule_name (str): The name of the rule (class attribute).
+        _fields (tuple): Names of the fields (class attribute).
+        _lists (frozenset): Names of the fields which are lists (class
+            attribute).
+    """
+
+    __slots__ = ['position', 'position_end']
+
+    rule_name = None
+    _fields = ()
+    _lists = frozenset()
+
+    def __init__(self, position=0, position_end=0, **kwargs):
+        self.position = position
+        self.position_end = position_end
+        for field in self._fields:
+            setattr(self, field,
+                    kwargs.pop(field, [] if field in self._lists else None))
+        if kwargs:
+            raise TypeError("Unknown fields {} for {}."
+                            .format(", ".join(sorted(kwargs)),
+                                    type(self).__name__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__,
+            ", ".join("{}={!r}".format(f, getattr(self, f))
+                      for f in self._fields))
+
+
+class _Passthrough(object):
+    """
+    Result of a rule which has no AST class. The value of the chosen rule for
+    choices or the matched text for rules without references to other rules
+    is used in the field named after the rule.
+    """
+
+    __slots__ = ['rule_name', 'value', 'position', 'position_end']
+
+    def __init__(self, rule_name, value, position, position_end):
+        self.rule_name = rule_name
+        self.value = value
+        self.position = position
+        self.position_end = position_end
+
+
+def _class_name(rule_name):
+    """
+    Converts rule name to CamelCase class name.
+    """
+    name = "".join(p[:1].upper() + p[1:]
+                   for p in re.split(r'[^0-9a-zA-Z]+', rule_name) if p)
+    if not name or name[0].isdigit():
+        name = "Rule" + name
+    return str(name)
+
+
+def _field_name(rule_name):
+    """
+    Converts rule name to a valid field name.
+    """
+    name = re.sub(r'\W', '_', rule_name)
+    if name[:1].isdigit():
+        name = '_' + name
+    if keyword.iskeyword(name) or name in ('position', 'position_end',
+                                           'rule_name'):
+        name += '_'
+    return str(name)
+
+
+def _references(expression):
+    """
+    Returns dict: rule name -> ONE/MANY for rules referenced from the
+    given rule expression. Key None is used for anonymous terminals
+    which are not suppressed.
+    """
+    def merge(refs, other):
+        for name, count in other.items():
+            refs[name] = MANY if name in refs else count
+
+    def walk(expr):
+        refs = {}
+        if isinstance(expr, SyntaxPredicate):
+            # Predicates don't produce results.
+            return refs
+        if isinstance(expr, OrderedChoice):
+            for node in expr.nodes:
+                for name, count in walk_ref(node, expr).items():
+                    refs[name] = max(refs.get(name, 0), count)
+        elif isinstance(expr, (ZeroOrMore, OneOrMore)):
+            for node in expr.nodes:
+                for name in walk_ref(node, expr):
+                    refs[name] = MANY
+        else:
+            for node in expr.nodes:
+                merge(refs, walk_ref(node, expr))
+
+        # Separators of repetitions and unordered groups.
+        if getattr(expr, 'sep', None):
+            for name in walk_ref(expr.sep, expr):
+                refs[name] = MANY
+        return refs
+
+    def walk_ref(expr, parent):
+        if isinstance(expr, EndOfFile):
+            return {}
+        if expr.root:
+            return {expr.rule_name: ONE}
+        if isinstance(expr, (Match, Combine)):
+            if isinstance(expr, StrMatch) and type(parent) is Sequence:
+                # String matches in sequences are suppressed.
+                return {}
+            return {None: MANY}
+        return walk(expr)
+
+    return walk(expression)
+
+
+def _is_choice(expression):
+    """
+    Returns True if the expression is a choice between other rules.
+    """
+    return isinstance(expression, OrderedChoice) and \
+        all(node.root for node in expression.nodes)
+
+
+def ast_classes(parser):
+    """
+    Derives AST node classes from the grammar of the given parser.
+
+    Returns a dict: rule name -> ASTNode subclass for each rule of the
+    grammar except:
+    - terminal rules and rules which don't reference other rules. Their
+      value is the matched text without suppressed string matches,
+    - rules which are ordered choices between other rules. Their value is
+      the value of the chosen rule.
+
+    Args:
+        parser(Parser): ParserPython or ParserPEG instance.
+    """
+    classes = {}
+    processed = set()
+    stack = [parser.parser_model]
+    while stack:
+        expr = stack.pop()
+        if id(expr) in processed:
+            continue
+        processed.add(id(expr))
+        stack.extend(expr.nodes)
+        if getattr(expr, 'sep', None):
+            stack.append(expr.sep)
+
+        if not expr.root or isinstance(expr, (Match, Combine)) \
+                or _is_choice(expr) or expr.rule_name in classes:
+            continue
+
+        refs = _references(expr)
+        tokens = refs.pop(None, None)
+        if not refs:
+            continue
+
+        fields = []
+        lists = []
+        plan = {}
+        for rule_name in sorted(refs):
+            field = _field_name(rule_name)
+            fields.append(field)
+            if refs[rule_name] == MANY:
+                lists.append(field)
+            plan[rule_name] = (field, refs[rule_name] == MANY)
+        if tokens:
+            field = 'tokens_' if 'tokens' in fields else 'tokens'
+            fields.append(field)
+            lists.append(field)
+            plan[''] = (field, True)
+
+        classes[expr.rule_name] = type(_class_name(expr.rule_name),
+                                       (ASTNode,), {
+                                           '__slots__': fields,
+                                           'rule_name': expr.rule_name,
+                                           '_fields': tuple(fields),
+                                           '_lists': frozenset(lists),
+                                           '_plan': plan,
+                                       })
+    return classes
+
+
+class ASTBuilder(object):
+    """
+    Builds AST nodes directly during parsing. The parse tree is not built
+    and there is no visiting.
+
+    Example:
+
+        builder = ASTBuilder(ParserPython(grammar))
+        module = builder.parse(input_str)
+
+    Attributes:
+        parser(Parser): The parser.
+        classes(dict): rule name -> AST node class. See `ast_classes`.
+    """
+
+    def __init__(self, parser, classes=None):
+        """
+        Args:
+            parser(Parser): ParserPython or ParserPEG instance.
+            classes(dict): rule name -> AST node class. Classes can be
+                replaced by subclasses of the generated classes to add
+                methods. Default is the result of `ast_classes(parser)`.
+        """
+        self.parser = parser
+        self.classes = classes if classes is not None else \
+            ast_classes(parser)
+
+    def parse(self, _input, file_name=None):
+        """
+        Parses the input and returns AST node of the root rule.
+
+        Args:
+            _input(str): An input string to parse.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+        """
+        parser = self.parser
+        parser.ast_builder = self
+        try:
+            result = parser.parse(_input, file_name)
+        finally:
+            parser.ast_builder = None
+            parser.parse_tree = None
+        if isinstance(result, (Terminal, _Passthrough)):
+            result = result.value
+        return result
+
+    def build(self, rule, nodes):
+        """
+        Called by the parser for each matched rule instead of creating the
+        parse tree non-terminal.
+
+        Args:
+            rule(ParsingExpression): The root expression of the rule.
+            nodes(list): Terminals, AST nodes and values of choice rules
+                matched by the rule.
+        """
+        cls = self.classes.get(rule.rule_name)
+        if nodes:
+            position = nodes[0].position
+            position_end = nodes[-1].position_end
+        else:
+            position = position_end = self.parser.position
+
+        if cls is None:
+            if len(nodes) == 1:
+                # Choice rule. Pass the value of the chosen rule.
+                value = nodes[0]
+                if not isinstance(value, ASTNode):
+                    value = value.value
+            else:
+                # Rule without references. Use the matched text.
+                value = _join_values([n.value for n in nodes
+                                      if not n.suppress])
+            return _Passthrough(rule.rule_name, value, position,
+                                position_end)
+
+        ast_node = cls.__new__(cls)
+        ast_node.position = position
+        ast_node.position_end = position_end
+        for field in cls._fields:
+            setattr(ast_node, field, [] if field in cls._lists else None)
+
+        plan = cls._plan
+        for node in nodes:
+            try:
+                field, many = plan[node.rule_name]
+            except KeyError:
+                continue
+            if node.rule_name == '' and node.suppress:
+                # Keywords and punctuation.
+                continue
+            value = node if isinstance(node, ASTNode) else node.value
+            if many:
+                getattr(ast_node, field).append(value)
+            else:
+                setattr(ast_node, field, value)
+        return ast_node
+
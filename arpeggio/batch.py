@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: batch.py
+# Purpose: Parsing of many files in a process pool.
+# License: MIT License
+#######################################################################
+"""
+Parsing of many files in parallel. Files are distributed over a process
+pool (`concurrent.futures`, the `futures` backport on Python 2) and results
+are returned as they are needed:
+
+    def make_parser():
+        return ParserPython(grammar)
+
+    for result in parse_files(file_names, make_parser, workers=4):
+        if result.error is not None:
+            print(result.error)
+        else:
+            process(result.tree)
+
+Each worker builds the parser once using `parser_factory`, which must be
+picklable (e.g. a module-level function). Parse trees are sent back in the
+compact format of `arpeggio.serialize`. If a visitor is given it is run in
+the worker and only its result is sent back.
+"""
+
+from __future__ import unicode_literals
+import copy
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from arpeggio import NoMatch, EndOfFile, Parser, visit_parse_tree
+from arpeggio.serialize import dumps, loads
+
+# Rule ids of the rules which are not in the parser model.
+_EOF_RULE = -1
+_FIRST_NOT_RULE = -2
+
+# Parsers built in the worker by parser factory.
+_local = threading.local()
+
+
+class FileResult(object):
+    """
+    Result of parsing a file by `parse_files`.
+
+    Attributes:
+        file_name(str): The name of the file.
+        tree(ParseTreeNode): The parse tree if trees are transferred.
+            Nodes are bound to the rules of a parser built in the calling
+            process.
+        result: The result of the visitor if the visitor is given.
+        error(Exception): `NoMatch` if the file can't be parsed or the error
+            raised while reading the file. None if there is no error.
+    """
+    __slots__ = ['file_name', 'tree', 'result', 'error']
+
+    def __init__(self, file_name, tree=None, result=None, error=None):
+        self.file_name = file_name
+        self.tree = tree
+        self.result = result
+        self.error = error
+
+    def __repr__(self):
+        return "<FileResult {} {}>".format(
+            self.file_name, "error" if self.error is not None else "ok")
+
+
+def parse_files(paths, parser_factory, workers=None, ordered=True,
+                tree=None, visitor=None, executor=None):
+    """
+    Parses the files in a process pool and yields a `FileResult` for each
+    file.
+
+    Args:
+        paths(iterable of str): The names of the files to parse.
+        parser_factory(callable): Called without arguments to build the
+            parser. Called once in each worker and in this process if parse
+            trees or errors are sent back. Must be picklable.
+        workers(int): The number of worker processes. Default is the number
+            of CPUs.
+        ordered(bool): If True (default) results are yielded in the order of
+            `paths`. Otherwise, results are yielded as the files are parsed.
+        tree(bool): If parse trees are sent back. Default is True if the
+            visitor is not given.
+        visitor(PTNodeVisitor): If given, the parse tree of each file is
+            visited in the worker by a copy of this visitor and the result
+            of visiting is sent back. The visitor and its results must be
+            picklable.
+        executor(concurrent.futures.Executor): If given, files are parsed by
+            this executor instead of a new process pool.
+    """
+    if tree is None:
+        tree = visitor is None
+    own_executor = executor is None
+    if own_executor:
+        if workers is None:
+            workers = _cpu_count()
+        executor = ProcessPoolExecutor(workers)
+    else:
+        workers = workers or getattr(executor, '_max_workers', None) or \
+            _cpu_count()
+
+    # The number of files submitted ahead so that results are not kept for
+    # too long if they are consumed slowly.
+    limit = workers * 4
+    paths = iter(paths)
+    pending = deque()
+    parser = []
+
+    def submit():
+        for file_name in paths:
+            pending.append(executor.submit(_parse_file, parser_factory,
+                                           file_name, tree, visitor))
+            if len(pending) >= limit:
+                break
+
+    def result(future):
+        file_name, data, visit_result, error = future.result()
+        if (data is not None or error is not None) and not parser:
+            parser.append(parser_factory())
+        if data is not None:
+            data = loads(data, parser[0])
+        if error is not None and not isinstance(error, Exception):
+            error = _load_error(error, parser[0])
+        return FileResult(file_name, data, visit_result, error)
+
+    try:
+        submit()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            yield result(future)
+            submit()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+
+def _cpu_count():
+    try:
+        return os.cpu_count() or 1
+    except AttributeError:
+        # Python 2
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+
+def _worker_parser(parser_factory):
+    """
+    Returns the parser built by the factory in this worker.
+    """
+    try:
+        parsers = _local.parsers
+    except AttributeError:
+        parsers = _local.parsers = {}
+    try:
+        return parsers[parser_factory]
+    except KeyError:
+        parser = parsers[parser_factory] = parser_factory()
+        return parser
+
+
+def _parse_file(parser_factory, file_name, tree, visitor):
+    """
+    Parses the file in the worker. Returns the file name, the serialized
+    parse tree, the result of the visitor and the error.
+    """
+    parser = _worker_parser(parser_factory)
+    try:
+        parse_tree = parser.parse_file(file_name)
+    except NoMatch as e:
+        return file_name, None, None, _dump_error(e, parser)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        return file_name, None, None, e
+
+    data = visit_result = None
+    if tree and parse_tree is not None:
+        data = dumps(parse_tree, parser)
+    if visitor is not None and parse_tree is not None:
+        # Visitor is shared by the files parsed in this process.
+        visitor = copy.copy(visitor)
+        visitor.for_second_pass = []
+        visit_result = visit_parse_tree(parse_tree, visitor)
+    return file_name, data, visit_result, None
+
+
+def _dump_error(error, parser):
+    """
+    Returns picklable details of NoMatch. Rules are given by their ids in
+    the parser model.
+    """
+    ids = dict((id(expr), i)
+               for i, expr in enumerate(parser._model_expressions()))
+    rules = []
+    for rule in error.rules:
+        if id(rule) in ids:
+            rules.append(ids[id(rule)])
+        elif isinstance(rule, EndOfFile):
+            rules.append(_EOF_RULE)
+        elif rule is Parser.FIRST_NOT:
+            rules.append(_FIRST_NOT_RULE)
+    return (rules, error.position, parser.file_name,
+            parser.pos_to_linecol(error.position),
+            parser.context(position=error.position))
+
+
+def _load_error(details, parser):
+    """
+    Returns NoMatch from the details given by `_dump_error`. Rules are bound
+    to the given parser.
+    """
+    rule_ids, position, file_name, linecol, context = details
+    expressions = parser._model_expressions()
+    rules = []
+    for rule_id in rule_ids:
+        if rule_id == _EOF_RULE:
+            rules.append(EndOfFile())
+        elif rule_id == _FIRST_NOT_RULE:
+            rules.append(Parser.FIRST_NOT)
+        else:
+            rules.append(expressions[rule_id])
+    error = NoMatch(rules, position, _ErrorSource(file_name, linecol, context))
+    error.line, error.col = linecol
+    return error
+
+
+class _ErrorSource(object):
+    """
+    Stands for the worker parser in NoMatch raised in the worker. Provides
+    the location of the error for the error message.
+    """
+    def __init__(self, file_name, linecol, context):
+        self.file_name = file_name
+        self._linecol = linecol
+        self._context = context
+
+    def pos_to_linecol(self, pos):
+        return self._linecol
+
+    def context(self, length=None, position=None):
+        return self._context
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: cache.py
+# Purpose: Persistent cache of parse trees keyed by the input content.
+# License: MIT License
+#######################################################################
+"""
+On-disk cache of parse results. Parse trees are stored in files named by a
+hash of the grammar, the parser settings and the input content so unchanged
+input is loaded from the cache instead of being parsed again:
+
+    cache = ParseCache('.parse_cache')
+    parser = ParserPython(grammar, parse_cache=cache)
+    tree = parser.parse_file(file_name)
+
+The cache directory can be shared by several processes. Entries are written
+to temporary files and renamed into place so readers never see a partially
+written entry.
+"""
+
+from __future__ import unicode_literals
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+from arpeggio import text, ParseTreeIndex, COMMENTS_TREE
+from arpeggio.serialize import dumps, loads, _fingerprint
+
+# Format of the cache entries. Changing the format invalidates the cache.
+FORMAT = 2
+MAGIC = b'ARPC'
+SUFFIX = '.tree'
+
+_META_LENGTH = struct.Struct(str('<I'))
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class ParseCache(object):
+    """
+    Persistent cache of parse trees.
+
+    Attributes:
+        directory(str): The cache directory.
+        max_size(int): The maximal size of the cache files in bytes. The
+            least recently used entries are removed when the cache grows
+            larger. None for unbounded cache.
+        hits(int): The number of parse trees loaded from the cache.
+        misses(int): The number of inputs parsed and stored in the cache.
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        # Current size of the cache. Computed on the first store.
+        self._size = None
+
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    def parse(self, parser, _input, file_name=None):
+        """
+        Returns the parse tree of the input from the cache or parses the
+        input and stores the parse tree. The parser state (`parse_tree`,
+        `comments`, `parse_tree_index`...) is the same as after
+        `parser.parse`.
+
+        Args:
+            parser(Parser): The parser.
+            _input(str): An input string to parse.
+            file_name(str): If input is loaded from file this can be
+                set to file name. It is used in error messages.
+        """
+        try:
+            key = self.key(parser, _input)
+        except UnicodeEncodeError:
+            # Text which can't be encoded can't be hashed.
+            return parser.parse(_input, file_name)
+
+        path = os.path.join(self.directory, key + SUFFIX)
+        loaded = self._load(parser, path)
+        if loaded is None:
+            self.misses += 1
+            tree = parser.parse(_input, file_name)
+            self._store(parser, path)
+            return tree
+
+        self.hits += 1
+        tree, comments, comments_count = loaded
+        parser._init_input(_input, file_name)
+        parser.parse_tree = tree
+        parser.comments = comments
+        parser.comments_count = comments_count
+        if parser.tree_index and tree is not None:
+            parser.parse_tree_index = ParseTreeIndex(tree)
+        return tree
+
+    def key(self, parser, _input):
+        """
+        Returns the cache key for the given parser and input.
+        """
+        key = hashlib.sha256()
+        # Entry header is written by marshal whose format depends on the
+        # Python version.
+        key.update(MAGIC + bytes(bytearray([FORMAT, marshal.version])))
+        key.update(_fingerprint(parser))
+        if isinstance(_input, text):
+            _input = _input.encode('utf-8')
+        key.update(hashlib.sha256(_input).digest())
+        return key.hexdigest()
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        for _, _, path in self._entries():
+            _remove(path)
+        self._size = 0
+
+    def _load(self, parser, path):
+        """
+        Returns (parse tree, comments, comments count) from the cache entry
+        or None if there is no valid entry.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        try:
+            start = len(MAGIC) + _META_LENGTH.size
+            meta_end = start + _META_LENGTH.unpack_from(data, len(MAGIC))[0]
+            has_tree, spans, comments_count = \
+                marshal.loads(data[start:meta_end])
+            nodes = loads(data[meta_end:], parser)
+        except (ValueError, TypeError, EOFError, struct.error):
+            # Entry is damaged. It will be overwritten.
+            return None
+
+        # Mark as recently used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        tree = nodes.pop(0) if has_tree else None
+        comments = nodes if spans is None else [tuple(s) for s in spans]
+        return tree, comments, comments_count
+
+    def _store(self, parser, path):
+        """
+        Stores the result of the last parse to the given cache file.
+        """
+        tree = parser.parse_tree
+        nodes = [tree] if tree is not None else []
+        if parser.comment_mode == COMMENTS_TREE:
+            nodes.extend(parser.comments)
+            spans = None
+        else:
+            spans = [tuple(s) for s in parser.comments]
+        try:
+            nodes = dumps(nodes, parser)
+        except ValueError:
+            # The tree is not made of the parser model rules.
+            return
+        meta = marshal.dumps((tree is not None, spans,
+                              parser.comments_count))
+        data = MAGIC + _META_LENGTH.pack(len(meta)) + meta + nodes
+
+        # Size of the replaced entry, e.g. if it was invalid.
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            _replace(tmp_path, path)
+        except OSError:
+            # E.g. the entry is being replaced by another process.
+            _remove(tmp_path)
+            return
+
+        if self.max_size is not None:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _entries(self):
+        """
+        Returns a list of (modification time, size, path) of the cache
+        entries.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Removed by another process.
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache takes at
+        most 3/4 of `max_size` so that eviction is not done on each store.
+        """
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        limit = self.max_size * 3 // 4
+        for _, entry_size, path in entries:
+            if size <= limit:
+                break
+            _remove(path)
+            size -= entry_size
+        self._size = size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
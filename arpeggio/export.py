@@ -9,7 +9,12 @@
 
 from __future__ import unicode_literals
 import io
-from arpeggio import Terminal
+import os
+from collections import deque
+from arpeggio import Terminal, NonTerminal, text
+
+# Limit of the number of nodes exported in debug mode.
+DEBUG_MAX_NODES = 5000
 
 
 class Exporter(object):
@@ -21,10 +26,6 @@ class Exporter(object):
         super(Exporter, self).__init__()
 
         # Export initialization
-        self._render_set = set()        # Used in rendering to prevent
-                                        # rendering
-                                        # of the same node multiple times
-
         self._adapter_map = {}          # Used as a registry of adapters to
                                         # ensure that the same adapter is
                                         # returned for the same adaptee object
@@ -47,6 +48,13 @@ class Exporter(object):
         self._export(obj)
         self._outf.close()
 
+    def exportStream(self, obj, stream):
+        """
+        Export of obj to an open text file object. The stream is not closed.
+        """
+        self._outf = stream
+        self._export(obj)
+
     def _export(self, obj):
         self._outf.write(self._start())
         self._render_node(obj)
@@ -165,22 +173,74 @@ class PTDOTExportAdapter(PMDOTExportAdapter):
 class DOTExporter(Exporter):
     """
     Export to DOT language (part of GraphViz, see http://www.graphviz.org/)
+
+    Graphs are rendered iteratively so deep graphs don't hit the recursion
+    limit. The export of large graphs can be limited. Nodes whose children
+    are not exported get a "..." child.
+
+    Attributes:
+        max_depth(int): If given, only the nodes at most this far from the
+            root (the root is at depth 0) are exported.
+        max_nodes(int): If given, at most this many nodes are exported.
+        root(str): If given, only the subgraph of the first node of the
+            rule with this name is exported.
     """
+
+    # If nodes can be reached by more than one path and rendered nodes
+    # must be tracked.
+    _shared_nodes = True
+
+    def __init__(self, max_depth=None, max_nodes=None, root=None):
+        super(DOTExporter, self).__init__()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.root = root
+
     def _render_node(self, node):
-        if not node in self._render_set:
-            self._render_set.add(node)
-            self._outf.write('\n%s [label="%s"];' %
-                             (node.id, self._dot_label_esc(node.desc)))
-            #TODO Comment handling
-#            if hasattr(node, "comments") and root.comments:
-#                retval += self.node(root.comments)
-#                retval += '\n%s->%s [label="comment"]' % \
-                            #(id(root), id(root.comments))
-            for name, n in node.neighbours:
-                self._outf.write('\n%s->%s [label="%s"]' %
-                                 (node.id, n.id, name))
-                self._outf.write('\n')
-                self._render_node(n)
+        write = self._outf.write
+        max_depth = self.max_depth
+        max_nodes = self.max_nodes
+        rendered = set() if self._shared_nodes else None
+        count = 0
+        truncated = False
+
+        # Nodes are rendered in depth-first order. Each stack entry is
+        # (node, depth, parent id, edge label).
+        stack = [(node, 0, None, None)]
+        while stack:
+            node, depth, parent_id, name = stack.pop()
+            node_id = node.id
+            if rendered is not None and node_id in rendered:
+                self._render_edge(parent_id, node_id, name)
+                continue
+            if max_nodes is not None and count >= max_nodes:
+                truncated = True
+                continue
+            count += 1
+            if rendered is not None:
+                rendered.add(node_id)
+            write('\n%s [label="%s"];' %
+                  (node_id, self._dot_label_esc(node.desc)))
+            self._render_edge(parent_id, node_id, name)
+
+            neighbours = node.neighbours
+            if not neighbours:
+                continue
+            if max_depth is not None and depth >= max_depth:
+                write('\n%s_more [label="...", shape=plaintext];' % node_id)
+                self._render_edge(node_id, '%s_more' % node_id, '')
+                continue
+            for name, n in reversed(neighbours):
+                stack.append((n, depth + 1, node_id, name))
+
+        if truncated:
+            write('\ntruncated [label="Export limited to %d nodes", '
+                  'shape=note];' % max_nodes)
+
+    def _render_edge(self, parent_id, node_id, name):
+        if parent_id is not None:
+            self._outf.write('\n%s->%s [label="%s"]\n' %
+                             (parent_id, node_id, name))
 
     def _start(self):
         return "digraph arpeggio_graph {"
@@ -201,21 +261,480 @@ class PMDOTExporter(DOTExporter):
     """
     def export(self, obj):
         return super(PMDOTExporter, self).\
-            export(PMDOTExportAdapter(obj, self))
+            export(PMDOTExportAdapter(self._root(obj), self))
 
     def exportFile(self, obj, file_name):
         return super(PMDOTExporter, self).\
-            exportFile(PMDOTExportAdapter(obj, self), file_name)
+            exportFile(PMDOTExportAdapter(self._root(obj), self), file_name)
+
+    def exportStream(self, obj, stream):
+        return super(PMDOTExporter, self).\
+            exportStream(PMDOTExportAdapter(self._root(obj), self), stream)
+
+    def _root(self, model):
+        """
+        Returns the parsing expression of the `root` rule.
+        """
+        if self.root is None:
+            return model
+        visited = set()
+        queue = deque([model])
+        while queue:
+            expr = queue.popleft()
+            if expr.rule_name == self.root:
+                return expr
+            if id(expr) not in visited:
+                visited.add(id(expr))
+                queue.extend(expr.nodes)
+        raise ValueError("Rule '{}' is not in the parser model."
+                         .format(self.root))
 
 
 class PTDOTExporter(DOTExporter):
     """
     A convenience DOTExport extension that uses PTDOTExportAdapter
     """
+
+    # Parse tree nodes have a single parent.
+    _shared_nodes = False
+
     def export(self, obj):
         return super(PTDOTExporter, self).\
-            export(PTDOTExportAdapter(obj, self))
+            export(PTDOTExportAdapter(self._root(obj), self))
 
     def exportFile(self, obj, file_name):
         return super(PTDOTExporter, self).\
-            exportFile(PTDOTExportAdapter(obj, self), file_name)
+            exportFile(PTDOTExportAdapter(self._root(obj), self), file_name)
+
+    def exportStream(self, obj, stream):
+        return super(PTDOTExporter, self).\
+            exportStream(PTDOTExportAdapter(self._root(obj), self), stream)
+
+    def _root(self, tree):
+        """
+        Returns the first node of the `root` rule.
+        """
+        if self.root is None:
+            return tree
+        if isinstance(tree, NonTerminal):
+            node = tree.first(self.root)
+        else:
+            node = tree if tree.rule_name == self.root else None
+        if node is None:
+            raise ValueError("There is no node of rule '{}' in the parse "
+                             "tree.".format(self.root))
+        return node
+
+
+# -------------------------------------------------------------------------
+# Support for JSON
+
+
+class JSONExporter(Exporter):
+    """
+    Streaming export of parse trees to JSON. Nodes are written to the output
+    as they are visited so memory use depends only on the depth of the tree.
+    Each node is an object with `rule`, `start` and `end` keys. Terminals
+    have `value` and non-terminals have `children` list.
+
+    Attributes:
+        spans(bool): If start and end positions are written.
+        values(bool): If values of terminals are written.
+        rule_names(bool): If rule names are written.
+    """
+    def __init__(self, spans=True, values=True, rule_names=True):
+        super(JSONExporter, self).__init__()
+        self.spans = spans
+        self.values = values
+        self.rule_names = rule_names
+
+        # Rule name -> JSON string.
+        self._names = {}
+
+        # Imported here as `json` is imported only if JSON is exported. It
+        # may be shadowed by a module of the user (see examples/json).
+        from json.encoder import encode_basestring
+        self._encode = encode_basestring
+
+    def _render_node(self, node):
+        write = self._outf.write
+        write(self._open(node))
+        if isinstance(node, Terminal):
+            return
+        stack = [iter(node)]
+        first = True
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                write("]}")
+                first = False
+                continue
+            if not first:
+                write(", ")
+            write(self._open(child))
+            if isinstance(child, NonTerminal):
+                stack.append(iter(child))
+                first = True
+            else:
+                first = False
+
+    def _open(self, node):
+        """
+        Returns the JSON object of the terminal or the beginning of the JSON
+        object of the non-terminal up to its children.
+        """
+        record = self._record(node)
+        if isinstance(node, Terminal):
+            return record + "}"
+        return record + (', "children": [' if len(record) > 1
+                         else '"children": [')
+
+    def _record(self, node, fields=None):
+        """
+        Returns the JSON object of the node without the closing brace.
+        """
+        if fields is None:
+            fields = []
+        if self.rule_names:
+            try:
+                name = self._names[node.rule_name]
+            except KeyError:
+                name = self._names[node.rule_name] = \
+                    self._encode(node.rule_name)
+            fields.append('"rule": ' + name)
+        if self.spans:
+            fields.append('"start": %d, "end": %d' %
+                          (node.position, node.position_end))
+        if self.values and isinstance(node, Terminal):
+            value = node.value
+            if not isinstance(value, text):
+                # Parsed in bytes mode.
+                value = value.decode('utf-8', 'replace')
+            fields.append('"value": ' + self._encode(value))
+        return "{" + ", ".join(fields)
+
+
+class NDJSONExporter(JSONExporter):
+    """
+    Streaming export of parse trees to newline delimited JSON. Each node is
+    written on its own line in pre-order. Besides the keys written by
+    `JSONExporter` (without `children`) there are `id` of the node (the
+    number of the node in pre-order) and `parent` id (null for the root).
+    """
+    def _render_node(self, node):
+        write = self._outf.write
+        record = self._record
+        write(record(node, ['"id": 0, "parent": null']) + "}\n")
+        if isinstance(node, Terminal):
+            return
+        node_id = 0
+        stack = [(iter(node), 0)]
+        while stack:
+            children, parent = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+            node_id += 1
+            write(record(child, ['"id": %d, "parent": %d' % (node_id, parent)])
+                  + "}\n")
+            if isinstance(child, NonTerminal):
+                stack.append((iter(child), node_id))
+
+
+# -------------------------------------------------------------------------
+# Support for NumPy
+
+
+class NumPyExporter(object):
+    """
+    Export of parse trees to NumPy arrays for vectorized analysis. Requires
+    NumPy. A tree is flattened to columns with an item for each node in
+    pre-order:
+
+        rule - index of the rule name in `rule_names`,
+        parent - index of the parent node (-1 for the root),
+        depth - depth of the node (0 for the root),
+        start, end - start and end position of the node,
+        terminal - True for terminals.
+
+    Rule ids are kept by the exporter so the ids are the same in all trees
+    exported by the same exporter.
+
+    Attributes:
+        rule_names(list): Rule names indexed by rule ids.
+    """
+    def __init__(self, parser=None):
+        """
+        Args:
+            parser(Parser): If given, rule ids are assigned to all rules of
+                the parser model in advance. Trees exported by different
+                exporters of the same parser have the same rule ids.
+        """
+        self.rule_names = []
+        self._rule_ids = {}
+        if parser is not None:
+            for expr in parser._model_expressions():
+                self._rule_id(expr.rule_name)
+            self._rule_id('EOF')
+
+    def export(self, tree):
+        """
+        Returns a dict of NumPy arrays with the columns described above and
+        `rule_names` array.
+        """
+        import numpy
+
+        rules = []
+        parents = []
+        depths = []
+        starts = []
+        ends = []
+        terminals = []
+        rule_ids = self._rule_ids
+        stack = [(tree, -1, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            try:
+                rules.append(rule_ids[node.rule_name])
+            except KeyError:
+                rules.append(self._rule_id(node.rule_name))
+            parents.append(parent)
+            depths.append(depth)
+            starts.append(node.position)
+            ends.append(node.position_end)
+            if isinstance(node, NonTerminal):
+                terminals.append(False)
+                index = len(rules) - 1
+                depth += 1
+                stack.extend([(child, index, depth)
+                              for child in reversed(node)])
+            else:
+                terminals.append(True)
+
+        return {
+            'rule': numpy.array(rules, dtype=numpy.int32),
+            'parent': numpy.array(parents, dtype=numpy.int64),
+            'depth': numpy.array(depths, dtype=numpy.int32),
+            'start': numpy.array(starts, dtype=numpy.int64),
+            'end': numpy.array(ends, dtype=numpy.int64),
+            'terminal': numpy.array(terminals, dtype=numpy.bool_),
+            'rule_names': numpy.array(self.rule_names, dtype=numpy.str_),
+        }
+
+    def exportFile(self, tree, directory):
+        """
+        Saves each array to `<name>.npy` file in the given directory which
+        is created if it doesn't exist. Arrays can be memory-mapped when
+        loaded (see `load`).
+        """
+        import numpy
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, array in self.export(tree).items():
+            numpy.save(os.path.join(directory, name + '.npy'), array,
+                       allow_pickle=False)
+
+    @staticmethod
+    def load(directory, mmap_mode='r'):
+        """
+        Returns a dict of the arrays saved by `exportFile`. By default the
+        arrays are memory-mapped read-only so the data is not copied.
+
+        Args:
+            directory(str): The directory given to `exportFile`.
+            mmap_mode(str): Passed to `numpy.load`. If None the arrays are
+                read into memory.
+        """
+        import numpy
+        arrays = {}
+        for name in os.listdir(directory):
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = numpy.load(
+                    os.path.join(directory, name), mmap_mode=mmap_mode,
+                    allow_pickle=False)
+        return arrays
+
+    def _rule_id(self, rule_name):
+        try:
+            return self._rule_ids[rule_name]
+        except KeyError:
+            rule_id = self._rule_ids[rule_name] = len(self.rule_names)
+            self.rule_names.append(rule_name)
+            return rule_id
+
+
+# -------------------------------------------------------------------------
+# Support for SQLite
+
+
+class SQLiteExporter(object):
+    """
+    Export of parse trees of many files to a SQLite database for structural
+    queries over a whole corpus. Nodes of each file are numbered in
+    pre-order and stored in `nodes` table:
+
+        file - id of the file in `files` table,
+        id - number of the node in the file,
+        rule - id of the rule name in `rules` table,
+        start, end - start and end position of the node,
+        parent - id of the parent node (NULL for the root),
+        value - value of the terminal (NULL for non-terminals).
+
+    `named_nodes` view has the file and the rule names instead of ids. Nodes
+    are indexed by rule and value, by parent and by position.
+
+    Files are exported with `add`, which replaces the nodes previously
+    stored for the file. Changes are committed after about `batch_size`
+    changed rows, on `commit` and on `close`. The exporter is a context manager
+    which closes the database on exit.
+
+    Attributes:
+        connection(sqlite3.Connection): The database connection.
+        batch_size(int): The number of changed rows after which changes
+            are committed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            digest TEXT
+        );
+        CREATE TABLE IF NOT EXISTS rules (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS nodes (
+            file INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            rule INTEGER NOT NULL,
+            start INTEGER NOT NULL,
+            "end" INTEGER NOT NULL,
+            parent INTEGER,
+            value,
+            PRIMARY KEY (file, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS nodes_rule ON nodes (rule, value);
+        CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (file, parent);
+        CREATE INDEX IF NOT EXISTS nodes_position ON nodes (file, start);
+        CREATE VIEW IF NOT EXISTS named_nodes AS
+            SELECT files.name AS file, nodes.id AS id, rules.name AS rule,
+                   nodes.start AS start, nodes."end" AS "end",
+                   nodes.parent AS parent, nodes.value AS value
+            FROM nodes JOIN files ON nodes.file = files.id
+                 JOIN rules ON nodes.rule = rules.id;
+    """
+
+    def __init__(self, database, batch_size=100000):
+        """
+        Args:
+            database(str): The path of the database file. The database and
+                its tables are created if they don't exist.
+            batch_size(int): See `batch_size` attribute.
+        """
+        import sqlite3
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(self.SCHEMA)
+        self.batch_size = batch_size
+        self._pending = 0
+        self._rule_ids = dict((name, rule_id) for rule_id, name in
+                              self.connection.execute(
+                                  "SELECT id, name FROM rules"))
+
+    def add(self, tree, file_name, digest=None):
+        """
+        Stores the parse tree of the file. Nodes previously stored for the
+        file are removed.
+
+        Args:
+            tree(ParseTreeNode): The parse tree.
+            file_name(str): The name of the file.
+            digest(str): An optional digest of the file content. See
+                `digest` method.
+        """
+        connection = self.connection
+        changes = connection.total_changes
+        row = connection.execute("SELECT id FROM files WHERE name = ?",
+                                 (file_name,)).fetchone()
+        if row is None:
+            file_id = connection.execute(
+                "INSERT INTO files (name, digest) VALUES (?, ?)",
+                (file_name, digest)).lastrowid
+        else:
+            file_id = row[0]
+            connection.execute("DELETE FROM nodes WHERE file = ?",
+                               (file_id,))
+            connection.execute("UPDATE files SET digest = ? WHERE id = ?",
+                               (digest, file_id))
+
+        connection.executemany(
+            'INSERT INTO nodes (file, id, rule, start, "end", parent, value) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', self._rows(tree, file_id))
+        self._pending += connection.total_changes - changes
+        if self._pending >= self.batch_size:
+            self.commit()
+
+    def remove(self, file_name):
+        """
+        Removes the file and its nodes.
+        """
+        connection = self.connection
+        row = connection.execute("SELECT id FROM files WHERE name = ?",
+                                 (file_name,)).fetchone()
+        if row is not None:
+            connection.execute("DELETE FROM nodes WHERE file = ?", row)
+            connection.execute("DELETE FROM files WHERE id = ?", row)
+
+    def digest(self, file_name):
+        """
+        Returns the digest given when the file was stored or None if the
+        file is not stored. Used for incremental updates where only the
+        changed files are parsed and stored again.
+        """
+        row = self.connection.execute(
+            "SELECT digest FROM files WHERE name = ?", (file_name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def commit(self):
+        self.connection.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.connection.rollback()
+            self.connection.close()
+
+    def _rows(self, tree, file_id):
+        """
+        Yields the rows of the nodes in pre-order.
+        """
+        rule_ids = self._rule_ids
+        node_id = 0
+        stack = [(tree, None)]
+        while stack:
+            node, parent = stack.pop()
+            try:
+                rule_id = rule_ids[node.rule_name]
+            except KeyError:
+                rule_id = rule_ids[node.rule_name] = self.connection.execute(
+                    "INSERT INTO rules (name) VALUES (?)",
+                    (node.rule_name,)).lastrowid
+            if isinstance(node, NonTerminal):
+                value = None
+                stack.extend([(child, node_id) for child in reversed(node)])
+            else:
+                value = node.value
+            yield (file_id, node_id, rule_id, node.position,
+                   node.position_end, parent, value)
+            node_id += 1
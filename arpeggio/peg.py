@@ -267,6 +267,9 @@ class ParserPEG(Parser):
             self.comments_model.root = True
             self.comments_model.rule_name = comment_rule_name
 
+        if self.bytes_mode:
+            self._to_bytes_mode()
+
         # In debug mode export parser model to dot for
         # visualization
         if self.debug:
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: serialize.py
+# Purpose: Compact binary serialization of parse trees.
+# License: MIT License
+#######################################################################
+"""
+Compact binary serialization of parse trees. Unlike pickle only the nodes
+are written. Rules are written as ids from the table of the parser model
+expressions and nodes are bound to the rules of the given parser on load:
+
+    data = dumps(tree, parser)
+    ...
+    tree = loads(data, parser)
+
+The parser used for loading must be built from the same grammar with the
+same settings as the parser which produced the tree.
+
+Format: header (magic, version, flags, grammar fingerprint) followed by
+columns of integers and two string blobs. Nodes are written level by level
+(breadth-first). There is a rule id and a non-terminal flag for each node,
+the number of children for each non-terminal and, for each terminal, the
+suppress flag, the difference of its position from the position of the
+previous terminal and an index in the table of distinct terminal values.
+Each column is written as an array of fixed size integers of the smallest
+size which fits all values of the column.
+"""
+
+from __future__ import unicode_literals
+import array
+import gc
+import hashlib
+import struct
+import sys
+import weakref
+from itertools import chain, compress, count, repeat
+from operator import attrgetter, not_, sub
+try:
+    from itertools import accumulate
+except ImportError:
+    # Python 2
+    accumulate = None
+from arpeggio import __version__, text, NonTerminal, Terminal, EndOfFile, \
+    ParsingExpression
+
+MAGIC = b'ARPT'
+VERSION = 1
+
+# Header flags.
+FLAG_LIST = 1
+
+_HEADER = struct.Struct(str('<4sBB16s'))
+_LENGTH = struct.Struct(str('<BQ'))
+
+# Array type codes by item size.
+_TYPECODES = {}
+for _typecode in 'BHILQ':
+    try:
+        _TYPECODES.setdefault(array.array(str(_typecode)).itemsize,
+                              str(_typecode))
+    except ValueError:
+        # 'Q' is not available on Python 2.
+        pass
+
+# Parsing expression attributes which are not part of the grammar.
+_SKIP_ATTRS = frozenset(['elements', 'nodes', '__dict__', '__weakref__'])
+
+# Parser -> fingerprint of its grammar.
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def dumps(nodes, parser):
+    """
+    Returns the serialized parse tree as bytes.
+
+    Args:
+        nodes(ParseTreeNode or list): A parse tree or a list of parse trees
+            (e.g. comments) produced by the parser.
+        parser(Parser): The parser which produced the nodes.
+    """
+    is_list = isinstance(nodes, list) and not isinstance(nodes, NonTerminal)
+    level = list(nodes) if is_list else [nodes]
+    ids = dict((id(expr), i)
+               for i, expr in enumerate(parser._model_expressions(), 1))
+    get_rule = attrgetter('rule')
+
+    sizes = []
+    rules = []
+    flags = []
+    counts = []
+    suppress = []
+    positions = []
+    values = []
+
+    # Whole levels are processed by iterators implemented in C. This is
+    # much faster than visiting node by node.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while level:
+            sizes.append(len(level))
+            level_rules = list(map(ids.get, map(id, map(get_rule, level))))
+            if None in level_rules:
+                level_rules = [_rule_id(n, r)
+                               for n, r in zip(level, level_rules)]
+            rules.extend(level_rules)
+            level_flags = list(map(isinstance, level, repeat(NonTerminal)))
+            flags.extend(level_flags)
+            nonterminals = list(compress(level, level_flags))
+            terminals = list(compress(level, map(not_, level_flags)))
+            counts.extend(map(len, nonterminals))
+            suppress.extend(map(attrgetter('suppress'), terminals))
+            positions.extend(map(attrgetter('position'), terminals))
+            values.extend(map(attrgetter('value'), terminals))
+            level = list(chain.from_iterable(nonterminals))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    table = list(dict.fromkeys(values))
+    value_ids = list(map(dict(zip(table, count())).__getitem__, values))
+    is_bytes = [not isinstance(v, text) for v in table]
+    text_blob = "".join([v for v in table if isinstance(v, text)]) \
+        .encode('utf-8')
+    bytes_blob = b"".join([v for v in table if not isinstance(v, text)])
+
+    # Terminals of a level are in the input order so the differences
+    # between positions are small. Differences at the start of a level are
+    # negative so they are zigzag encoded.
+    deltas = [d << 1 if d >= 0 else (~d << 1) | 1
+              for d in map(sub, positions, [0] + positions)]
+
+    return b"".join([
+        _HEADER.pack(MAGIC, VERSION, FLAG_LIST if is_list else 0,
+                     _fingerprint(parser)),
+        _pack_ints(sizes), _pack_ints(rules), _pack_ints(flags),
+        _pack_ints(counts), _pack_ints(suppress), _pack_ints(deltas),
+        _pack_ints(value_ids), _pack_ints(list(map(len, table))),
+        _pack_ints(is_bytes),
+        _LENGTH.pack(1, len(text_blob)), text_blob,
+        _LENGTH.pack(1, len(bytes_blob)), bytes_blob])
+
+
+def loads(data, parser):
+    """
+    Returns the parse tree (or the list of parse trees) serialized by
+    `dumps`. Nodes are bound to the rules of the given parser.
+
+    Args:
+        data(bytes): Serialized parse tree.
+        parser(Parser): The parser built from the same grammar as the parser
+            used in `dumps`.
+    """
+    try:
+        magic, version, header_flags, fingerprint = \
+            _HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError("Invalid serialized parse tree.")
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Invalid serialized parse tree.")
+    if fingerprint != _fingerprint(parser):
+        raise ValueError("Parse tree was serialized by a parser with a "
+                         "different grammar.")
+
+    offset = _HEADER.size
+    columns = []
+    for i in range(11):
+        column, offset = _unpack(data, offset, blob=i >= 9)
+        columns.append(column)
+    sizes, rules, flags, counts, suppress, deltas, value_ids, lengths, \
+        is_bytes, text_blob, bytes_blob = columns
+
+    blobs = [text_blob.decode('utf-8'), bytes_blob]
+    starts = [0, 0]
+    table = []
+    for length, blob in zip(lengths, is_bytes):
+        start = starts[blob]
+        table.append(blobs[blob][start:start + length])
+        starts[blob] = start + length
+    try:
+        values = list(map(table.__getitem__, value_ids))
+    except IndexError:
+        raise ValueError("Invalid serialized parse tree.")
+    positions = _accumulate([d >> 1 if not d & 1 else ~(d >> 1)
+                             for d in deltas])
+    ends = [p + len(v) for p, v in zip(positions, values)]
+
+    # End of file terminals have their own rule instances in the parse
+    # trees. A single instance is used for all loaded terminals.
+    expressions = [EndOfFile()] + parser._model_expressions()
+    rule_names = [expr.rule_name for expr in expressions]
+
+    # Offsets of the levels in the node, terminal and non-terminal columns.
+    levels = []
+    node = terminal = nonterminal = 0
+    for size in sizes:
+        nonterminals = flags[node:node + size].count(1)
+        levels.append((node, node + size, terminal, nonterminal))
+        node += size
+        terminal += size - nonterminals
+        nonterminal += nonterminals
+    if node != len(rules) or node != len(flags) or \
+            terminal != len(positions) or terminal != len(suppress) or \
+            nonterminal != len(counts):
+        raise ValueError("Invalid serialized parse tree.")
+
+    # Levels are built from the deepest one. Children of the non-terminals
+    # of a level are the consecutive slices of the level below.
+    new_terminal = Terminal.__new__
+    new_nonterminal = NonTerminal.__new__
+    below = []
+    below_ends = []
+
+    # Parse trees have no reference cycles. Collecting garbage while the
+    # tree is built only slows down the allocation of the nodes.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for start, end, terminal, nonterminal in reversed(levels):
+            child = 0
+            level = []
+            append = level.append
+            level_ends = []
+            append_end = level_ends.append
+            for rule_id, is_nonterminal in zip(rules[start:end],
+                                               flags[start:end]):
+                if is_nonterminal:
+                    node = new_nonterminal(NonTerminal)
+                    node.rule = expressions[rule_id]
+                    node.rule_name = rule_names[rule_id]
+                    node.error = False
+                    node.comments = None
+                    node._filtered = False
+                    last = child + counts[nonterminal]
+                    nonterminal += 1
+                    if last > child:
+                        children = below[child:last]
+                        node.extend(children)
+                        node.position = children[0].position
+                        node._position_end = below_ends[last - 1]
+                        child = last
+                    else:
+                        node.position = node._position_end = 0
+                    append_end(node._position_end)
+                else:
+                    node = new_terminal(Terminal)
+                    node.rule = expressions[rule_id]
+                    node.rule_name = rule_names[rule_id]
+                    node.position = positions[terminal]
+                    node.error = False
+                    node.comments = None
+                    node.value = values[terminal]
+                    node.suppress = suppress[terminal] == 1
+                    append_end(ends[terminal])
+                    terminal += 1
+                append(node)
+            if child != len(below):
+                raise ValueError("Invalid serialized parse tree.")
+            below = level
+            below_ends = level_ends
+    except IndexError:
+        raise ValueError("Invalid serialized parse tree.")
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if header_flags & FLAG_LIST:
+        return below
+    if len(below) != 1:
+        raise ValueError("Invalid serialized parse tree.")
+    return below[0]
+
+
+def dump(nodes, parser, f):
+    """
+    Writes the serialized parse tree to the binary file object.
+    See `dumps`.
+    """
+    f.write(dumps(nodes, parser))
+
+
+def load(f, parser):
+    """
+    Reads the serialized parse tree from the binary file object.
+    See `loads`.
+    """
+    return loads(f.read(), parser)
+
+
+def grammar_fingerprint(parser):
+    """
+    Returns a hash of the parser model and the comments model. The hash
+    changes if any rule of the grammar changes.
+
+    Args:
+        parser(Parser): The parser.
+    """
+    expressions = parser._model_expressions()
+    ids = dict((id(expr), i) for i, expr in enumerate(expressions))
+    fingerprint = hashlib.sha256()
+    fingerprint.update("{} {}".format(VERSION, __version__).encode('utf-8'))
+    for expr in expressions:
+        desc = [type(expr).__name__, [ids[id(n)] for n in expr.nodes]]
+        names = set(getattr(expr, '__dict__', ()))
+        for cls in type(expr).__mro__:
+            names.update(getattr(cls, '__slots__', ()))
+        for name in sorted(names - _SKIP_ATTRS):
+            if name.startswith('_'):
+                continue
+            value = getattr(expr, name, None)
+            if isinstance(value, ParsingExpression):
+                value = ('ref', ids.get(id(value)))
+            elif hasattr(value, 'pattern') and hasattr(value, 'flags'):
+                # Compiled regular expression.
+                value = (value.pattern, value.flags)
+            elif value is not None and \
+                    not isinstance(value, (text, bytes, bool, int, float)):
+                continue
+            desc.append((name, value))
+        fingerprint.update(repr(desc).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def _fingerprint(parser):
+    """
+    Returns 16 bytes hash of the grammar fingerprint of the parser and the
+    parser settings which change parse trees.
+    """
+    try:
+        fingerprint = _fingerprints[parser]
+    except KeyError:
+        fingerprint = _fingerprints[parser] = grammar_fingerprint(parser)
+    options = (parser.skipws, parser.ws, parser.reduce_tree, parser.autokwd,
+               parser.ignore_case, parser.comment_mode, parser.bytes_mode)
+    return hashlib.sha256("{} {!r}".format(fingerprint, options)
+                          .encode('utf-8')).digest()[:16]
+
+
+def _rule_id(node, rule_id):
+    """
+    Returns the rule id of the node whose rule may not be in the parser
+    model. End of file terminals have their own rule instances.
+    """
+    if rule_id is not None:
+        return rule_id
+    if not isinstance(node.rule, EndOfFile):
+        raise ValueError("Rule '{}' is not in the parser model."
+                         .format(node.rule.name))
+    return 0
+
+
+def _accumulate(values):
+    """
+    Returns the list of running sums of the values.
+    """
+    if accumulate is not None:
+        return list(accumulate(values))
+    sums = []
+    total = 0
+    for value in values:
+        total += value
+        sums.append(total)
+    return sums
+
+
+def _pack_ints(values):
+    """
+    Packs the list of non-negative integers as an array of the smallest
+    item size which fits all values.
+    """
+    top = max(values) if values else 0
+    for itemsize in sorted(_TYPECODES):
+        if top < 1 << (8 * itemsize):
+            break
+    else:
+        raise OverflowError("Value {} is too large.".format(top))
+    column = array.array(_TYPECODES[itemsize], values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    data = column.tobytes() if hasattr(column, 'tobytes') \
+        else column.tostring()
+    return _LENGTH.pack(itemsize, len(values)) + data
+
+
+def _unpack(data, offset, blob=False):
+    """
+    Returns the column (or the string blob) packed at the offset and the
+    offset after it.
+    """
+    try:
+        itemsize, length = _LENGTH.unpack_from(data, offset)
+    except struct.error:
+        raise ValueError("Invalid serialized parse tree.")
+    offset += _LENGTH.size
+    end = offset + itemsize * length
+    if end > len(data) or itemsize not in _TYPECODES:
+        raise ValueError("Invalid serialized parse tree.")
+    chunk = bytes(data[offset:end])
+    if blob:
+        return chunk, end
+    column = array.array(_TYPECODES[itemsize])
+    if hasattr(column, 'frombytes'):
+        column.frombytes(chunk)
+    else:
+        column.fromstring(chunk)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column, end
@@ -0,0 +1,170 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing memory use and attribute access cost of the parser model and
+#   the parser state on the perf grammar. With `--baseline <git revision>`
+#   the same measurements are done with the arpeggio package of the given
+#   revision (e.g. the revision before slots were introduced) and both are
+#   reported. Each measurement runs in its own interpreter.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import codecs
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from os.path import dirname, join, abspath
+
+
+HERE = dirname(abspath(__file__))
+ROOT = abspath(join(HERE, '..', '..'))
+
+
+def model_expressions(parser):
+    expressions = []
+    visited = set()
+    stack = [parser.parser_model]
+    while stack:
+        expr = stack.pop()
+        if id(expr) not in visited:
+            visited.add(id(expr))
+            expressions.append(expr)
+            stack.extend(expr.nodes)
+    return expressions
+
+
+def access_state(parser, count):
+    """
+    Reads the state the way whitespace skipping in Match.parse does.
+    """
+    t_start = time.time()
+    for _ in range(count):
+        if parser.skipws and not parser.in_lex_rule:
+            pos = parser.position
+            ws = parser.ws
+            i = parser.input
+            parser.position = pos
+    return time.time() - t_start
+
+
+def access_model(expressions, count):
+    """
+    Reads the attributes of parser model nodes used while parsing.
+    """
+    t_start = time.time()
+    for _ in range(count):
+        for expr in expressions:
+            expr.rule_name
+            expr.root
+            expr.nodes
+            expr.suppress
+    return time.time() - t_start
+
+
+def measure():
+    """
+    Measures the arpeggio package found on the path.
+    """
+    from arpeggio import ParserPython
+    from grammar import rhapsody
+
+    try:
+        import tracemalloc
+        tracemalloc.start()
+        parser = ParserPython(rhapsody)
+        model_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    except ImportError:
+        # Python 2
+        parser = ParserPython(rhapsody)
+        model_memory = None
+
+    expressions = model_expressions(parser)
+    # Slotted expressions may have `__dict__` which is empty unless some
+    # other attribute is set.
+    with_dict = [e for e in expressions if getattr(e, '__dict__', None)]
+    node_size = sum(sys.getsizeof(e) for e in expressions) + \
+        sum(sys.getsizeof(e.__dict__) for e in with_dict)
+
+    file_name = join(HERE, 'test_inputs', 'LightSwitch.rpy')
+    with codecs.open(file_name, "r", encoding="utf-8") as f:
+        content = f.read()
+    parse_times = []
+    for _ in range(3):
+        t_start = time.time()
+        parser.parse(content)
+        parse_times.append(time.time() - t_start)
+
+    parser.input = content
+    parser.position = 0
+    return {
+        'model nodes': len(expressions),
+        'nodes with __dict__': len(with_dict),
+        'model node bytes': node_size,
+        'parser build memory': model_memory,
+        'state access x 1M (sec)': min(access_state(parser, 1000000)
+                                       for _ in range(3)),
+        'model access x 100 (sec)': min(access_model(expressions, 100)
+                                        for _ in range(3)),
+        'parse LightSwitch.rpy (sec)': min(parse_times),
+    }
+
+
+def run(package_dir):
+    """
+    Measures the arpeggio package in the given directory in a new
+    interpreter.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package_dir, HERE])
+    output = subprocess.check_output(
+        [sys.executable, abspath(__file__), '--measure'], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def extract(revision, directory):
+    """
+    Extracts the arpeggio package of the git revision to the directory.
+    """
+    archive = subprocess.check_output(
+        ['git', 'archive', '--format=tar', revision, 'arpeggio'], cwd=ROOT)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+
+def main():
+    if '--measure' in sys.argv:
+        print(json.dumps(measure()))
+        return
+
+    results = [('current', run(ROOT))]
+    if '--baseline' in sys.argv:
+        revision = sys.argv[sys.argv.index('--baseline') + 1]
+        directory = tempfile.mkdtemp()
+        try:
+            extract(revision, directory)
+            results.append((revision, run(directory)))
+        finally:
+            shutil.rmtree(directory)
+
+    print('{:30}'.format('') +
+          ''.join('{:>14}'.format(name) for name, _ in results))
+    for key in sorted(results[0][1]):
+        values = []
+        for _, result in results:
+            value = result[key]
+            values.append('{:>14}'.format(
+                '-' if value is None else
+                '{:.3f}'.format(value) if isinstance(value, float)
+                else value))
+        print('{:30}'.format(key) + ''.join(values))
+
+
+if __name__ == '__main__':
+    main()
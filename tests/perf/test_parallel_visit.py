@@ -0,0 +1,61 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing the speed of semantic analysis of independent subtrees in a
+#   process pool on the bibtex example. Per entry analysis is simulated
+#   by hashing of the entry fields.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import codecs
+import hashlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from os.path import dirname, join, abspath
+from arpeggio import ParserPython, visit_parse_tree
+
+EXAMPLES = abspath(join(dirname(__file__), '..', '..', 'examples'))
+sys.path.insert(0, join(EXAMPLES, 'bibtex'))
+
+from bibtex import bibfile, BibtexVisitor  # noqa
+
+
+class AnalysingVisitor(BibtexVisitor):
+
+    def visit_bibentry(self, node, children):
+        entry = super(AnalysingVisitor, self).visit_bibentry(node, children)
+        digest = text = repr(sorted(entry.items())).encode('utf-8')
+        for _ in range(2000):
+            digest = hashlib.sha256(digest + text).digest()
+        entry['digest'] = digest
+        return entry
+
+
+def timeit(message, visit):
+    t_start = time.time()
+    result = visit()
+    print('{}: {:.3f} sec'.format(message, time.time() - t_start))
+    return result
+
+
+def main():
+    file_name = join(EXAMPLES, 'bibtex', 'bibtex_example.bib')
+    with codecs.open(file_name, "r", encoding="utf-8") as f:
+        content = f.read() * 50
+    parse_tree = ParserPython(bibfile).parse(content)
+    print('Bibtex: {:.2f} KB, {} cores'.format(len(content)/1000,
+                                             cpu_count()))
+
+    serial = timeit('  serial', lambda: visit_parse_tree(
+        parse_tree, AnalysingVisitor()))
+    with ProcessPoolExecutor() as executor:
+        parallel = timeit('  process pool', lambda: visit_parse_tree(
+            parse_tree, AnalysingVisitor(), executor=executor,
+            parallel_rules=['bibentry']))
+    assert serial == parallel
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing the speed of parsing many files in a process pool compared to
+#   serial parsing on the perf grammar.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import shutil
+import tempfile
+import time
+from multiprocessing import cpu_count
+from os.path import dirname, join
+from arpeggio import ParserPython
+from arpeggio.batch import parse_files
+from grammar import rhapsody
+
+
+def make_parser():
+    return ParserPython(rhapsody)
+
+
+def timeit(message, func):
+    t_start = time.time()
+    result = func()
+    print('  {}: {:.3f} sec'.format(message, time.time() - t_start))
+    return result
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        source = join(dirname(__file__), 'test_inputs', 'LightSwitch.rpy')
+        file_names = []
+        for i in range(8):
+            file_name = join(directory, 'file{}.rpy'.format(i))
+            shutil.copy(source, file_name)
+            file_names.append(file_name)
+        print('{} files, {} cores'.format(len(file_names), cpu_count()))
+
+        parser = make_parser()
+        timeit('serial', lambda: [parser.parse_file(f) for f in file_names])
+        timeit('process pool, trees', lambda: list(
+            parse_files(file_names, make_parser)))
+        timeit('process pool, no trees', lambda: list(
+            parse_files(file_names, make_parser, tree=False)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing the speed of input validation without building the parse tree
+#   (Parser.recognize) compared to parsing.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import codecs
+import time
+from os.path import dirname, join, getsize
+from arpeggio import ParserPython
+from grammar import rhapsody
+
+
+def timeit(message, check, content, file_size):
+    times = []
+    for _ in range(3):
+        t_start = time.time()
+        check(content)
+        times.append(time.time() - t_start)
+    elapsed = min(times)
+    print('{}: {:.2f} sec, {:.2f} KB/sec'.format(message, elapsed,
+                                                file_size/1000/elapsed))
+
+
+def main():
+
+    file_name = join(dirname(__file__), 'test_inputs', 'LightSwitchDouble.rpy')
+    file_size = getsize(file_name)
+    with codecs.open(file_name, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    for memoization in (False, True):
+        parser = ParserPython(rhapsody, memoization=memoization)
+        print('Memoization: {}'.format(memoization))
+        timeit('  parse', parser.parse, content, file_size)
+        timeit('  recognize', parser.recognize, content, file_size)
+
+
+if __name__ == '__main__':
+    main()
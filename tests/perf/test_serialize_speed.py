@@ -0,0 +1,46 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing the speed and size of the compact binary serialization of
+#   parse trees compared to pickle on the perf grammar.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import codecs
+import pickle
+import time
+from os.path import dirname, join
+from arpeggio import ParserPython
+from arpeggio.serialize import dumps, loads
+from grammar import rhapsody
+
+
+def timeit(message, func):
+    t_start = time.time()
+    result = func()
+    print('  {}: {:.3f} sec'.format(message, time.time() - t_start))
+    return result
+
+
+def main():
+    file_name = join(dirname(__file__), 'test_inputs', 'LightSwitchDouble.rpy')
+    with codecs.open(file_name, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    parser = ParserPython(rhapsody)
+    tree = timeit('parse', lambda: parser.parse(content))
+
+    print('serialize')
+    data = timeit('dumps', lambda: dumps(tree, parser))
+    loaded = timeit('loads', lambda: loads(data, parser))
+    print('  size: {:.1f} KB'.format(len(data) / 1000))
+    assert str(loaded) == str(tree)
+
+    print('pickle')
+    data = timeit('dumps', lambda: pickle.dumps(tree, -1))
+    timeit('loads', lambda: pickle.loads(data))
+    print('  size: {:.1f} KB'.format(len(data) / 1000))
+
+
+if __name__ == '__main__':
+    main()
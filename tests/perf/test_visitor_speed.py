@@ -0,0 +1,94 @@
+#-*- coding: utf-8 -*-
+#######################################################################
+# Testing the speed of semantic analysis (parse tree visiting) on the
+#   calc and bibtex examples. The recursive visiting with per node
+#   method lookup (the old implementation) is given for comparison.
+#   Parsing followed by visiting is compared with fused parse-and-visit.
+# License: MIT License
+#######################################################################
+from __future__ import print_function, unicode_literals
+
+import codecs
+import sys
+import time
+from os.path import dirname, join, abspath
+from arpeggio import ParserPython, NonTerminal, SemanticActionResults, \
+    visit_parse_tree
+
+EXAMPLES = abspath(join(dirname(__file__), '..', '..', 'examples'))
+sys.path.insert(0, join(EXAMPLES, 'calc'))
+sys.path.insert(0, join(EXAMPLES, 'bibtex'))
+
+from calc import calc, CalcVisitor  # noqa
+from bibtex import bibfile, BibtexVisitor  # noqa
+
+
+def recursive_visit(node, visitor):
+    children = SemanticActionResults()
+    if isinstance(node, NonTerminal):
+        for n in node:
+            child = recursive_visit(n, visitor)
+            if child is not None:
+                children.append_result(n.rule_name, child)
+
+    visit_name = "visit_%s" % node.rule_name
+    if hasattr(visitor, visit_name):
+        result = getattr(visitor, visit_name)(node, children)
+        if hasattr(visitor, "second_%s" % node.rule_name):
+            visitor.for_second_pass.append((node.rule_name, result))
+        return result
+    elif visitor.defaults:
+        return visitor.visit__default__(node, children)
+
+
+def timeit(message, visit, parse_tree, visitor_class):
+    times = []
+    for _ in range(3):
+        visitor = visitor_class()
+        t_start = time.time()
+        visit(parse_tree, visitor)
+        times.append(time.time() - t_start)
+    print('{}: {:.3f} sec'.format(message, min(times)))
+
+
+def timeit_fused(parser, content, visitor_class):
+    times = []
+    for _ in range(3):
+        t_start = time.time()
+        visit_parse_tree(parser.parse(content), visitor_class())
+        times.append(time.time() - t_start)
+    print('  parse + visit: {:.3f} sec'.format(min(times)))
+    times = []
+    for _ in range(3):
+        t_start = time.time()
+        parser.parse(content, visitor=visitor_class())
+        times.append(time.time() - t_start)
+    print('  fused parse and visit: {:.3f} sec'.format(min(times)))
+
+
+def main():
+
+    # Calc
+    expression = "-(4-1)*5+(2+4.67)+5.89/(.2+7)"
+    input_expr = "\n".join([expression] * 3000)
+    parser = ParserPython(calc)
+    parse_tree = parser.parse(input_expr)
+    print('Calc: {} expressions'.format(3000))
+    timeit('  recursive', recursive_visit, parse_tree, CalcVisitor)
+    timeit('  visit_parse_tree', visit_parse_tree, parse_tree, CalcVisitor)
+    timeit_fused(parser, input_expr, CalcVisitor)
+
+    # Bibtex
+    file_name = join(EXAMPLES, 'bibtex', 'bibtex_example.bib')
+    with codecs.open(file_name, "r", encoding="utf-8") as f:
+        content = f.read() * 200
+    parser = ParserPython(bibfile)
+    parse_tree = parser.parse(content)
+    print('Bibtex: {:.2f} KB'.format(len(content)/1000))
+    timeit('  recursive', recursive_visit, parse_tree, BibtexVisitor)
+    timeit('  visit_parse_tree', visit_parse_tree, parse_tree, BibtexVisitor)
+    timeit_fused(parser, content, BibtexVisitor)
+
+
+if __name__ == '__main__':
+    main()
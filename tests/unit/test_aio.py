@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_aio
+# Purpose: Test asyncio parsing API.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import sys
+import pytest  # noqa
+
+if sys.version_info < (3, 5):
+    pytest.skip("asyncio API requires Python 3.5+", allow_module_level=True)
+
+import asyncio  # noqa
+import threading  # noqa
+from concurrent.futures import ThreadPoolExecutor  # noqa
+from arpeggio import ParserPython, ZeroOrMore, Optional, EOF, NoMatch  # noqa
+from arpeggio import RegExMatch as _  # noqa
+from arpeggio.aio import parse_async, parse_stream_async  # noqa
+
+
+def comment():     return _(r'#.*')
+def key():         return _(r'[a-z]+')
+def value():       return _(r'\d+')
+def record():      return key, "=", value, ";"
+def header():      return "records", ":"
+def records():     return Optional(header), ZeroOrMore(record, sep=","), EOF
+def expression():  return value, ZeroOrMore(["+", "-"], value), EOF
+def addition():    return value, "+", value, EOF
+
+
+INPUT = "records: # header\n" + ",\n".join(
+    "# {}\nk = {};".format(i, i) for i in range(200))
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_parse_async_executor(loop):
+    parser = ParserPython(records, comment)
+    expected = repr(parser.parse(INPUT))
+    comments = [c.value for c in parser.comments]
+
+    tree = loop.run_until_complete(parse_async(parser, INPUT))
+    assert repr(tree) == expected
+    assert [c.value for c in parser.comments] == comments
+    assert parser.parse_tree is tree
+
+    with ThreadPoolExecutor(1) as executor:
+        tree = loop.run_until_complete(
+            parse_async(parser, INPUT, executor=executor))
+    assert repr(tree) == expected
+
+
+def test_parse_async_no_repetition(loop):
+    parser = ParserPython(expression)
+    tree = loop.run_until_complete(parse_async(parser, "1 + 2 - 3"))
+    assert str(tree) == str(parser.parse("1 + 2 - 3"))
+
+    # Without top-level repetition parsing falls back to the executor.
+    parser = ParserPython(addition)
+    submitted = []
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(fn)
+            return super(Executor, self).submit(fn, *args, **kwargs)
+
+    with Executor(1) as executor:
+        tree = loop.run_until_complete(
+            parse_async(parser, "1 + 2", executor=executor,
+                        yield_every=1))
+    assert str(tree) == str(parser.parse("1 + 2"))
+    assert len(submitted) == 1
+
+
+def test_parse_async_in_loop(loop):
+    parser = ParserPython(records, comment, reduce_tree=True)
+    expected = repr(parser.parse(INPUT))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = loop.create_task(ticker())
+        tree = await parse_async(parser, INPUT, yield_every=10)
+        task.cancel()
+        return tree
+
+    tree = loop.run_until_complete(main())
+    assert repr(tree) == expected
+    # Other tasks were run while parsing.
+    assert len(ticks) > 10
+
+
+def test_parse_async_error(loop):
+    parser = ParserPython(records)
+    text = "records: a = 1, b = , c = 3;"
+    with pytest.raises(NoMatch) as parse_error:
+        parser.parse(text)
+    for yield_every in (None, 1):
+        with pytest.raises(NoMatch) as e:
+            loop.run_until_complete(
+                parse_async(parser, text, yield_every=yield_every))
+        assert str(e.value) == str(parse_error.value)
+
+
+def test_parse_async_cancel_in_loop(loop):
+    parser = ParserPython(records, comment)
+
+    async def main():
+        task = loop.create_task(parse_async(parser, INPUT, yield_every=1))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    loop.run_until_complete(main())
+    # Parser is free for other parsing.
+    assert parser.in_rule == ''
+    assert parser.parse("records:")
+
+
+def test_parse_async_cancel_executor(loop):
+    parser = ParserPython(records, comment)
+    started = threading.Event()
+    stop = threading.Event()
+
+    def blocking_input():
+        for i in range(200):
+            yield "k = {};".format(i)
+            started.set()
+            stop.wait(1)
+
+    class Reader(object):
+        def __init__(self):
+            self.chunks = blocking_input()
+
+        async def read(self, size):
+            return next(self.chunks, "").encode('utf-8')
+
+    async def main():
+        task = loop.create_task(parse_stream_async(parser, Reader(),
+                                                   chunk_size=4))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with ThreadPoolExecutor(1) as executor:
+        loop.set_default_executor(executor)
+        loop.run_until_complete(main())
+        stop.set()
+    assert parser.in_rule == ''
+
+
+def test_parse_stream_async(loop):
+    parser = ParserPython(records, comment)
+    expected = repr(parser.parse(INPUT))
+    data = INPUT.encode('utf-8')
+
+    async def main():
+        reader = asyncio.StreamReader()
+        tree = loop.create_task(parse_stream_async(parser, reader,
+                                                   chunk_size=7,
+                                                   lookahead=3))
+        for i in range(0, len(data), 5):
+            reader.feed_data(data[i:i + 5])
+            await asyncio.sleep(0)
+        reader.feed_eof()
+        return await tree
+
+    tree = loop.run_until_complete(main())
+    assert repr(tree) == expected
+    assert len(parser.input) < len(INPUT)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_ast
+# Purpose: Test AST classes derived from the grammar and AST building.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, Optional, EOF
+from arpeggio import RegExMatch as _
+from arpeggio.peg import ParserPEG
+from arpeggio.ast import ASTNode, ASTBuilder, ast_classes
+
+
+def name():        return _(r'[a-z]+')
+def string():      return '"', _(r'[^"]*'), '"'
+def number():      return _(r'\d+')
+def value():       return [number, string, name]
+def field():       return name, "=", value, Optional(["!", "?"])
+def record():      return "record", name, "{", ZeroOrMore(field), "}"
+def records():     return ZeroOrMore(record), EOF
+
+
+INPUT = """
+record a { x = 1 y = "s" ! }
+record b { z = a }
+"""
+
+
+def test_ast_classes():
+
+    classes = ast_classes(ParserPython(records))
+
+    # No classes for terminal rules, choices and rules without references.
+    assert sorted(classes) == ['field', 'record', 'records']
+
+    Field = classes['field']
+    assert Field.__name__ == 'Field'
+    assert issubclass(Field, ASTNode)
+    assert Field._fields == ('name', 'value', 'tokens')
+    assert Field._lists == frozenset(['tokens'])
+    assert classes['record']._fields == ('field', 'name')
+    assert classes['records']._lists == frozenset(['record'])
+
+    # Nodes are slotted.
+    f = Field(name='x', value='1')
+    assert not hasattr(f, '__dict__')
+    assert f.tokens == []
+    with pytest.raises(TypeError):
+        Field(unknown=1)
+
+
+def test_ast_builder():
+
+    parser = ParserPython(records)
+    builder = ASTBuilder(parser)
+    result = builder.parse(INPUT)
+
+    Record, Field = builder.classes['record'], builder.classes['field']
+    assert result.record == [
+        Record(name='a', field=[Field(name='x', value='1'),
+                                Field(name='y', value='s', tokens=['!'])]),
+        Record(name='b', field=[Field(name='z', value='a')])]
+
+    first = result.record[0]
+    assert first.position == INPUT.index('record')
+    assert first.position_end == INPUT.index('}') + 1
+    assert parser.parse_tree is None
+
+    # Parser still builds parse trees.
+    assert parser.parse(INPUT).rule_name == 'records'
+
+
+def test_ast_builder_peg():
+
+    grammar = r"""
+    records <- record* EOF;
+    record <- "record" name "{" field* "}";
+    field <- name "=" value;
+    value <- number / name;
+    number <- r'\d+';
+    name <- r'[a-z]+';
+    """
+    builder = ASTBuilder(ParserPEG(grammar, 'records'))
+    result = builder.parse(INPUT.replace('"s" !', '2'))
+
+    assert [f.value for r in result.record for f in r.field] == \
+        ['1', '2', 'a']
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_bytes_mode
+# Purpose: Test parsing of bytes input without decoding.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, OneOrMore, EOF, \
+    Sequence, Combine, NoMatch, visit_parse_tree, PTNodeVisitor
+from arpeggio.cleanpeg import ParserPEG
+from arpeggio import RegExMatch as _
+
+
+def comment():     return _(r'//.*')
+def key():         return _(r'[a-zšđ]+')
+def number():      return _(r'-?\d+')
+def flag():        return Combine("+", key)
+def value():       return [number, flag,
+                           ("[", ZeroOrMore(number, sep=","), "]")]
+def pair():        return key, "=", value
+def line():        return Sequence(OneOrMore(pair, sep=";"), eolterm=True)
+def config():      return ZeroOrMore(line), EOF
+
+
+TEXT = """
+šđ = 1; b = [1, -2]  // comment
+c = -3; d =+on
+"""
+
+
+def test_bytes_mode_tree():
+    parser = ParserPython(config, comment, bytes_mode=True)
+    data = TEXT.encode('utf-8')
+    tree = parser.parse(data)
+    text_tree = ParserPython(config, comment).parse(TEXT)
+
+    keys = [p[0].value for p in tree.find_all('pair')]
+    assert keys == ['šđ'.encode('utf-8'), b'b', b'c', b'd']
+    assert tree.find_all('flag')[0].value == b'+on'
+    numbers = [n.value for n in tree.find_all('number')]
+    assert numbers == [b'1', b'1', b'-2', b'-3']
+    # Positions are byte offsets.
+    assert tree.find_all('pair')[1].position == 11
+    assert text_tree.find_all('pair')[1].position == 9
+
+    # Text of the tree is the same as in the text mode.
+    assert str(tree) == str(text_tree)
+    assert len(parser.comments) == 1
+    assert parser.comments[0].value == b'// comment'
+
+
+def test_bytes_mode_buffers():
+    parser = ParserPython(config, bytes_mode=True)
+    data = b"a = 1; b = [2]\n"
+    expected = str(parser.parse(data))
+    assert str(parser.parse(bytearray(data))) == expected
+    assert str(parser.parse(memoryview(data))) == expected
+    assert parser.recognize(memoryview(data))
+
+
+def test_bytes_mode_mmap(tmpdir):
+    file_name = str(tmpdir.join('config.txt'))
+    with io.open(file_name, 'wb') as f:
+        f.write(TEXT.encode('utf-8'))
+    parser = ParserPython(config, comment, bytes_mode=True)
+    tree = parser.parse_file(file_name, mmap=True)
+    assert str(tree) == str(parser.parse_file(file_name))
+    assert tree.find_all('number')[-1].value == b'-3'
+
+
+def test_bytes_mode_error():
+    parser = ParserPython(config, bytes_mode=True)
+    with pytest.raises(NoMatch) as e:
+        parser.parse("šđ = 1; b = [1, x]".encode('utf-8'))
+    assert e.value.position == 18
+    assert (e.value.line, e.value.col) == (1, 19)
+    assert "Expected number" in str(e.value)
+    assert "*x]" in str(e.value)
+
+
+def test_bytes_mode_peg():
+    grammar = """
+        config = pair+ EOF
+        pair = key "=" value ";"
+        key = r'[a-z]+'
+        value = r'\\d+' / "ON"
+    """
+    parser = ParserPEG(grammar, 'config', bytes_mode=True)
+    tree = parser.parse(b"a = 1; b = ON;")
+    assert [p[2][0].value for p in tree.find_all('pair')] == [b'1', b'ON']
+
+
+def test_bytes_mode_visitor():
+    class Visitor(PTNodeVisitor):
+        def visit_number(self, node, children):
+            return int(node.value)
+
+        def visit_pair(self, node, children):
+            return (node[0].value, children[1])
+
+        def visit_line(self, node, children):
+            return children.results['pair']
+
+    parser = ParserPython(config, bytes_mode=True)
+    result = visit_parse_tree(parser.parse(b"a = 1; b = -2"), Visitor())
+    assert result == [(b'a', 1), (b'b', -2)]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_comment_mode
+# Purpose: Test comment retention modes.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest
+from arpeggio import ZeroOrMore, EOF, ParserPython, NonTerminal, \
+    ParseTreeNode
+from arpeggio import RegExMatch as _
+
+
+def comment():      return [_(r"//.*"), ("/*", _(r"[^*]*"), "*/")]
+def item():         return _(r"\w+")
+def items():        return ZeroOrMore(item, sep=","), EOF
+
+
+INPUT = """
+// first
+a, /* second */ b // third
+  , c
+// fourth
+"""
+
+
+def test_tree_mode_default():
+    parser = ParserPython(items, comment)
+    assert parser.comment_mode == 'tree'
+    parser.parse(INPUT)
+
+    assert parser.comments_count == 4
+    assert len(parser.comments) == 4
+    assert all(isinstance(c, ParseTreeNode) for c in parser.comments)
+    assert isinstance(parser.comments[1], NonTerminal)
+
+
+def test_span_mode():
+    tree_parser = ParserPython(items, comment)
+    tree_parser.parse(INPUT)
+
+    parser = ParserPython(items, comment, comment_mode='span')
+    parser.parse(INPUT)
+
+    assert parser.comments_count == 4
+    assert parser.comments == [(c.position, c.position_end)
+                               for c in tree_parser.comments]
+    assert [INPUT[start:end] for start, end in parser.comments] == \
+        ['// first', '/* second */', '// third', '// fourth']
+
+
+def test_discard_mode():
+    parser = ParserPython(items, comment, comment_mode='discard')
+    parse_tree = parser.parse(INPUT)
+
+    assert parser.comments == []
+    assert parser.comments_count == 4
+    assert [t.value for t in parse_tree if t.rule_name == 'item'] == \
+        ['a', 'b', 'c']
+
+
+def test_same_parse_tree_in_all_modes():
+    results = []
+    for mode in ['tree', 'span', 'discard']:
+        parser = ParserPython(items, comment, comment_mode=mode)
+        results.append(repr(parser.parse(INPUT)))
+    assert results[0] == results[1] == results[2]
+
+
+def test_comments_reset_between_parses():
+    parser = ParserPython(items, comment, comment_mode='span')
+    parser.parse(INPUT)
+    parser.parse("a // one")
+    assert parser.comments == [(2, 8)]
+    assert parser.comments_count == 1
+
+
+def test_invalid_comment_mode():
+    with pytest.raises(ValueError):
+        ParserPython(items, comment, comment_mode='none')
@@ -2,7 +2,7 @@ from __future__ import unicode_literals
 import pytest  # noqa
 
 # Grammar
-from arpeggio import ZeroOrMore, OneOrMore, ParserPython, EOF
+from arpeggio import ZeroOrMore, OneOrMore, Sequence, ParserPython, EOF
 
 
 def test_zeroormore_eolterm():
@@ -37,3 +37,34 @@ def test_oneormore_eolterm():
     result = parser.parse(input)
 
     assert result
+
+
+def test_eolterm_restores_ws():
+
+    def grammar():      return first, second, EOF
+    def first():        return ZeroOrMore(["a", "b"], eolterm=True)
+    def second():       return "a"
+
+    parser = ParserPython(grammar, ws='\t\n ')
+    parser.parse("a b\n a")
+
+    assert parser.ws == '\t\n '
+    assert not parser.eolterm
+
+
+def test_sequence_ws_in_eolterm():
+    """
+    Whitespaces set by sequence inside eolterm repetition must not treat
+    newlines as whitespaces.
+    """
+
+    def grammar():      return first, second, EOF
+    def first():        return ZeroOrMore(Sequence("a", "b", ws='\n '),
+                                          eolterm=True)
+    def second():       return "a"
+
+    parser = ParserPython(grammar)
+    result = parser.parse("""a b a b
+    a""")
+
+    assert len(result[0]) == 4
@@ -9,11 +9,15 @@
 
 from __future__ import unicode_literals
 import pytest
+import io
+import json
 import os
-from arpeggio.export import PMDOTExporter, PTDOTExporter
+from arpeggio.export import PMDOTExporter, PTDOTExporter, JSONExporter, \
+    NDJSONExporter
 
 # Grammar
-from arpeggio import Optional, ZeroOrMore, OneOrMore, EOF, ParserPython
+from arpeggio import Optional, ZeroOrMore, OneOrMore, EOF, ParserPython, \
+    NonTerminal
 from arpeggio import RegExMatch as _
 
 
@@ -51,3 +55,261 @@ def test_export_parse_tree(parser):
                                "test_exporter_parse_tree.dot")
 
     assert os.path.exists("test_exporter_parse_tree.dot")
+
+
+def test_export_json(parser):
+    """
+    Testing streaming JSON export of parse trees.
+    """
+    parse_tree = parser.parse("-(4-1)*5+2")
+
+    def check(node, data):
+        assert data['rule'] == node.rule_name
+        assert (data['start'], data['end']) == \
+            (node.position, node.position_end)
+        if isinstance(node, NonTerminal):
+            assert 'value' not in data
+            assert len(data['children']) == len(node)
+            for child, child_data in zip(node, data['children']):
+                check(child, child_data)
+        else:
+            assert 'children' not in data
+            assert data['value'] == node.value
+
+    check(parse_tree, json.loads(JSONExporter().export(parse_tree)))
+
+    data = json.loads(JSONExporter(spans=False, values=False,
+                                   rule_names=False).export(parse_tree[0]))
+    assert set(data) == set(['children'])
+    assert data['children'][0]['children'][0]['children'][0] == {}
+
+    stream = io.StringIO()
+    JSONExporter().exportStream(parse_tree[-1], stream)
+    assert json.loads(stream.getvalue()) == \
+        {'rule': 'EOF', 'start': 10, 'end': 10, 'value': ''}
+
+
+def test_export_ndjson(parser):
+    """
+    Testing streaming NDJSON export of parse trees.
+    """
+    parse_tree = parser.parse("-(4-1)*5+2")
+    records = [json.loads(line) for line in
+               NDJSONExporter().export(parse_tree).splitlines()]
+
+    nodes = []
+    parents = {}
+    stack = [(parse_tree, None)]
+    while stack:
+        node, parent = stack.pop()
+        parents[len(nodes)] = parent
+        if isinstance(node, NonTerminal):
+            stack.extend((child, len(nodes)) for child in reversed(node))
+        nodes.append(node)
+
+    assert len(records) == len(nodes)
+    for node_id, (node, record) in enumerate(zip(nodes, records)):
+        expected = {'id': node_id, 'parent': parents[node_id],
+                    'rule': node.rule_name, 'start': node.position,
+                    'end': node.position_end}
+        if not isinstance(node, NonTerminal):
+            expected['value'] = node.value
+        assert record == expected
+
+    output = NDJSONExporter(spans=False).export(parse_tree[-1])
+    assert output == '{"id": 0, "parent": null, "rule": "EOF", "value": ""}\n'
+
+
+def test_export_json_bytes_mode():
+    parser = ParserPython(calc, bytes_mode=True)
+    parse_tree = parser.parse(b"2+3")
+    data = json.loads(JSONExporter().export(parse_tree))
+    assert data['children'][0]['children'][0]['children'][0] \
+        ['children'][0]['value'] == '2'
+
+
+def test_export_deep_parse_tree(parser):
+    """
+    Testing that export of deep trees doesn't hit the recursion limit.
+    """
+    node = parser.parse("1")[0]
+    for _ in range(5000):
+        node = NonTerminal(parser.parser_model.nodes[0], [node])
+    dot = PTDOTExporter().export(node)
+    assert dot.count('[label="1"]') == 5000 + 3
+
+
+def test_export_limits(parser):
+    """
+    Testing limits of the DOT export.
+    """
+    parse_tree = parser.parse("-(4-1)*5+(2+4.67)+5.89/(.2+7)")
+    node_count = PTDOTExporter().export(parse_tree).count('];')
+
+    dot = PTDOTExporter(max_nodes=10).export(parse_tree)
+    assert dot.count('];') == 11
+    assert 'Export limited to 10 nodes' in dot
+    assert dot.endswith('\n}')
+
+    # Only calc and expressions at depth 1.
+    dot = PTDOTExporter(max_depth=1).export(parse_tree)
+    assert dot.count('label="calc') == 1
+    assert dot.count('label="expression') == 1
+    assert dot.count('label="..."') == 1
+    assert dot.count('];') < node_count
+
+    dot = PTDOTExporter(root='number').export(parse_tree)
+    assert dot.count('];') == 1
+    assert "number '4'" in dot
+
+    with pytest.raises(ValueError):
+        PTDOTExporter(root='nothing').export(parse_tree)
+
+    # The parser model is a graph with cycles.
+    dot = PMDOTExporter().export(parser.parser_model)
+    dot_factor = PMDOTExporter(root='factor').export(parser.parser_model)
+    assert dot_factor.count('];') < dot.count('];')
+    assert dot_factor.count('label="factor=') == 1
+    assert dot_factor.count('label="expression=') == 1
+    assert 'calc=' not in dot_factor
+
+    dot = PMDOTExporter(max_depth=0).export(parser.parser_model)
+    assert dot.count('];') == 2
+
+
+def test_export_debug_limit(tmpdir):
+    """
+    Testing that the debug mode export of parse trees is limited.
+    """
+    from arpeggio.export import DEBUG_MAX_NODES
+    with tmpdir.as_cwd():
+        parser = ParserPython(calc, debug=True)
+        parser.parse("+".join(["1"] * DEBUG_MAX_NODES))
+        with open("calc_parse_tree.dot") as f:
+            dot = f.read()
+    assert dot.count('];') == DEBUG_MAX_NODES + 1
+
+
+def test_export_numpy(parser, tmpdir):
+    """
+    Testing columnar export of parse trees to NumPy arrays.
+    """
+    numpy = pytest.importorskip('numpy')
+    from arpeggio.export import NumPyExporter
+
+    parse_tree = parser.parse("-(4-1)*5+2")
+    nodes = []
+    stack = [(parse_tree, -1, 0)]
+    while stack:
+        node, parent, depth = stack.pop()
+        nodes.append((node, parent, depth))
+        if isinstance(node, NonTerminal):
+            stack.extend((child, len(nodes) - 1, depth + 1)
+                         for child in reversed(node))
+
+    exporter = NumPyExporter()
+    columns = exporter.export(parse_tree)
+    assert len(columns['rule']) == len(nodes)
+    rule_names = list(columns['rule_names'])
+    assert rule_names == exporter.rule_names
+    for i, (node, parent, depth) in enumerate(nodes):
+        assert rule_names[columns['rule'][i]] == node.rule_name
+        assert columns['parent'][i] == parent
+        assert columns['depth'][i] == depth
+        assert columns['start'][i] == node.position
+        assert columns['end'][i] == node.position_end
+        assert columns['terminal'][i] == (not isinstance(node, NonTerminal))
+
+    # Rule ids are the same for all trees of the exporter.
+    other = exporter.export(parser.parse("3+(1)"))
+    assert list(other['rule_names'][:len(rule_names)]) == rule_names
+    assert other['rule_names'][other['rule'][0]] == 'calc'
+
+    # Rule ids given by the parser model.
+    exporter = NumPyExporter(parser)
+    rule_names = list(exporter.rule_names)
+    assert 'number' in rule_names and 'EOF' in rule_names
+    columns = exporter.export(parse_tree)
+    assert list(columns['rule_names']) == rule_names
+
+    directory = str(tmpdir.join('tree'))
+    exporter.exportFile(parse_tree, directory)
+    loaded = NumPyExporter.load(directory)
+    assert sorted(loaded) == sorted(columns)
+    for name in columns:
+        assert isinstance(loaded[name], numpy.memmap)
+        assert (loaded[name] == columns[name]).all()
+    loaded = numpy.load(os.path.join(directory, 'rule.npy'), mmap_mode='r')
+    assert isinstance(loaded, numpy.memmap)
+    loaded = NumPyExporter.load(directory, mmap_mode=None)
+    numbers = loaded['rule'] == rule_names.index('number')
+    assert (loaded['end'] - loaded['start'])[numbers].sum() == 4
+
+
+def test_export_sqlite(parser, tmpdir):
+    """
+    Testing export of parse trees to SQLite database.
+    """
+    from arpeggio.export import SQLiteExporter
+
+    database = str(tmpdir.join('trees.db'))
+    with SQLiteExporter(database, batch_size=10) as exporter:
+        exporter.add(parser.parse("(4-1)*5"), 'a.calc', 'digest a')
+        exporter.add(parser.parse("4+2"), 'b.calc')
+        exporter.add(parser.parse("7"), 'c.calc')
+
+    def query(exporter, sql, *args):
+        return exporter.connection.execute(sql, args).fetchall()
+
+    # Factors whose number is 4.
+    factors = """
+        SELECT f.file, f.start, f."end" FROM named_nodes f
+        JOIN named_nodes n ON n.file = f.file AND n.parent = f.id
+        WHERE f.rule = 'factor' AND n.rule = 'number' AND n.value = ?
+        ORDER BY f.file"""
+
+    with SQLiteExporter(database) as exporter:
+        assert query(exporter, factors, '4') == \
+            [('a.calc', 1, 2), ('b.calc', 0, 1)]
+        assert exporter.digest('a.calc') == 'digest a'
+        assert exporter.digest('b.calc') is None
+
+        # Node ids are pre-order numbers and parents are ids.
+        tree = parser.parse("(4-1)*5")
+        rows = query(exporter, """
+            SELECT id, rule, start, "end", parent, value FROM named_nodes
+            WHERE file = 'a.calc' ORDER BY id""")
+        nodes = []
+        stack = [(tree, None)]
+        while stack:
+            node, parent = stack.pop()
+            value = None if isinstance(node, NonTerminal) else node.value
+            nodes.append((len(nodes), node.rule_name, node.position,
+                          node.position_end, parent, value))
+            if isinstance(node, NonTerminal):
+                stack.extend((child, len(nodes) - 1)
+                             for child in reversed(node))
+        assert rows == nodes
+
+        # Incremental update.
+        exporter.add(parser.parse("1+4"), 'a.calc', 'digest a2')
+        exporter.remove('c.calc')
+        exporter.remove('d.calc')
+        assert query(exporter, factors, '4') == \
+            [('a.calc', 2, 3), ('b.calc', 0, 1)]
+        assert exporter.digest('a.calc') == 'digest a2'
+
+    with SQLiteExporter(database) as exporter:
+        assert query(exporter, "SELECT name FROM files ORDER BY name") == \
+            [('a.calc',), ('b.calc',)]
+        assert query(exporter, "SELECT count(*) FROM nodes WHERE file = 3") \
+            == [(0,)]
+
+    # Changes are rolled back on errors.
+    with pytest.raises(ZeroDivisionError):
+        with SQLiteExporter(database, batch_size=1000) as exporter:
+            exporter.add(parser.parse("8"), 'd.calc')
+            1 / 0
+    with SQLiteExporter(database) as exporter:
+        assert exporter.digest('a.calc') == 'digest a2'
+        assert query(exporter, "SELECT count(*) FROM files") == [(2,)]
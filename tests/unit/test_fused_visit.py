@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_fused_visit
+# Purpose: Test visiting while parsing.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, PTNodeVisitor, visit_parse_tree, \
+    ZeroOrMore, Optional, EOF, VisitedNode
+from arpeggio import RegExMatch as _
+
+
+def number():     return _(r'\d+')
+def pair():       return number, ":", number
+def item():       return [pair, number]
+def items():      return "[", Optional(item, ZeroOrMore(",", item)), "]"
+def values():     return ZeroOrMore([items, item]), EOF
+
+
+class Visitor(PTNodeVisitor):
+
+    def __init__(self, **kwargs):
+        super(Visitor, self).__init__(**kwargs)
+        self.second = []
+
+    def visit_number(self, node, children):
+        return int(node.value)
+
+    def visit_pair(self, node, children):
+        return tuple(children)
+
+    def second_pair(self, pair):
+        self.second.append(pair)
+
+    def visit_items(self, node, children):
+        return list(children)
+
+    def visit_values(self, node, children):
+        return list(children)
+
+
+INPUT = "1 [2:3, 4] 5:6 [] [7, 8]"
+
+
+@pytest.mark.parametrize('memoization', [False, True])
+def test_fused_visit_same_result(memoization):
+
+    parser = ParserPython(values, memoization=memoization)
+    expected_visitor = Visitor()
+    expected = visit_parse_tree(parser.parse(INPUT), expected_visitor)
+
+    visitor = Visitor()
+    result = parser.parse(INPUT, visitor=visitor)
+
+    assert result == expected == [1, [(2, 3), 4], (5, 6), [], [7, 8]]
+    assert visitor.second == expected_visitor.second == [(2, 3), (5, 6)]
+    assert parser.parse_tree is None
+
+
+def test_fused_visit_backtracking():
+    """
+    `pair` is visited in `marked` which then fails on backtracking. Second
+    pass must not see the dropped pair.
+    """
+
+    def marked():     return pair, "!"
+    def choice():     return [marked, pair], EOF
+
+    calls = []
+
+    class CountingVisitor(Visitor):
+        def visit_pair(self, node, children):
+            calls.append(node.value)
+            return super(CountingVisitor, self).visit_pair(node, children)
+
+    parser = ParserPython(choice)
+    visitor = CountingVisitor()
+    assert parser.parse("2:3", visitor=visitor) == (2, 3)
+    assert visitor.second == [(2, 3)]
+    assert len(calls) == 2
+
+
+def test_fused_visit_node():
+    """
+    Visited children are replaced by VisitedNode terminals which keep
+    the value and the position of the replaced node.
+    """
+
+    nodes = []
+
+    class NodeVisitor(Visitor):
+        def visit_items(self, node, children):
+            nodes.extend(node)
+            return super(NodeVisitor, self).visit_items(node, children)
+
+    parser = ParserPython(values)
+    parser.parse("[2:3]", visitor=NodeVisitor())
+
+    item = nodes[1]
+    assert isinstance(item, VisitedNode)
+    assert item.rule_name == 'item'
+    assert item.value == '2 | : | 3'
+    assert item.flat_str() == '2:3'
+    assert item.position == 1
+    assert item.position_end == 4
+    assert item.result == (2, 3)
+
+
+def test_fused_visit_node_text():
+    """
+    Text of visited nodes is the same as of the parse tree nodes they
+    replace.
+    """
+
+    class TextVisitor(Visitor):
+        def visit_pair(self, node, children):
+            return (str(node), node.flat_str(), node.value)
+
+        def visit_items(self, node, children):
+            return (str(node), node.flat_str(), [str(n) for n in node],
+                    list(children))
+
+    content = "1 [ 2 : 3 ,  4 ]\n 5 : 6 [ ] [7,8]"
+    parser = ParserPython(values)
+    expected = visit_parse_tree(parser.parse(content), TextVisitor())
+    result = parser.parse(content, visitor=TextVisitor())
+    assert result == expected
+    assert result[1][:2] == ('[ | 2 | : | 3 | , | 4 | ]', '[2:3,4]')
+
+    class NodeVisitor(PTNodeVisitor):
+        def visit_values(self, node, children):
+            return node
+
+    expected = visit_parse_tree(parser.parse(content), NodeVisitor())
+    result = parser.parse(content, visitor=NodeVisitor())
+    assert str(result) == str(expected)
+    assert [n.value for n in result] == [n.value for n in expected]
+    assert result.flat_str() == expected.flat_str() == "1[2:3,4]5:6[][7,8]"
+
+
+def test_fused_visit_deep_nesting_memory():
+    """
+    Visited subtrees keep only their span so fused visiting of deeply nested
+    input uses less memory than parsing followed by visiting.
+    """
+    import sys
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    def nested():     return "(", [nested, number], ")"
+    def root():       return nested, EOF
+
+    class DepthVisitor(PTNodeVisitor):
+        def visit_number(self, node, children):
+            return 0
+
+        def visit_nested(self, node, children):
+            return children[0] + 1
+
+    def peak(parse):
+        # Parsing of nested rules is recursive.
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 10000))
+        tracemalloc.start()
+        try:
+            return parse(), tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            sys.setrecursionlimit(limit)
+
+    depth = 400
+    content = "(" * depth + "1" + ")" * depth
+    parser = ParserPython(root)
+    result, tree_peak = peak(
+        lambda: visit_parse_tree(parser.parse(content), DepthVisitor()))
+    fused_result, fused_peak = peak(
+        lambda: parser.parse(content, visitor=DepthVisitor()))
+
+    assert result == fused_result == depth
+    assert fused_peak < tree_peak
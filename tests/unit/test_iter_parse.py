@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_iter_parse
+# Purpose: Test streaming of top-level repetition items.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, OneOrMore, Optional, EOF, \
+    NoMatch, GrammarError, NonTerminal
+from arpeggio import RegExMatch as _
+
+
+def comment():     return _(r'#.*')
+def key():         return _(r'[a-z]+')
+def value():       return _(r'\d+')
+def record():      return key, "=", value, ";"
+def header():      return "records", ":"
+def records():     return Optional(header), ZeroOrMore(record), EOF
+def lines():       return OneOrMore(record, sep=","), EOF
+
+
+INPUT = """
+records:
+a = 1;  # first
+b = 2;
+c = 3;
+"""
+
+
+def test_iter_parse_yields_records():
+    parser = ParserPython(records, comment)
+    result = [str(r) for r in parser.iter_parse(INPUT)]
+    expected = [str(r) for r in parser.parse(INPUT)
+                if r.rule_name == 'record']
+    assert len(result) == 3
+    assert result == expected
+
+
+def test_iter_parse_is_lazy():
+    parser = ParserPython(records)
+    items = parser.iter_parse("a=1; b=2; c")
+    first = next(items)
+    assert isinstance(first, NonTerminal)
+    assert first.key.value == 'a'
+    assert next(items).key.value == 'b'
+    # Error is found only when the iteration reaches it.
+    with pytest.raises(NoMatch) as e:
+        next(items)
+    assert e.value.position == 11
+    assert parser.parse_tree is None
+
+
+def test_iter_parse_error_same_as_parse():
+    parser = ParserPython(records)
+    for text in ["a=1; b=; c=3;", "records a=1;", "a=1; b=2"]:
+        with pytest.raises(NoMatch) as parse_error:
+            parser.parse(text)
+        with pytest.raises(NoMatch) as iter_error:
+            list(parser.iter_parse(text))
+        assert str(iter_error.value) == str(parse_error.value)
+
+
+def test_iter_parse_discards_caches():
+    parser = ParserPython(records, comment, memoization=True)
+    for r in parser.iter_parse(INPUT):
+        assert all(p < r.position for p in parser.comment_positions)
+        assert all(not e._result_cache
+                   for e in parser.parser_model.nodes[1].nodes)
+    assert len(parser.comments) == 0
+    assert parser.parse(INPUT)
+
+
+def test_iter_parse_comments():
+    parser = ParserPython(records, comment)
+    comments = [[c.value for c in parser.comments]
+                for _ in parser.iter_parse(INPUT)]
+    assert comments == [[], ['# first'], []]
+
+
+def test_iter_parse_separator_and_one_or_more():
+    parser = ParserPython(lines)
+    result = [r.key.value for r in parser.iter_parse("a=1;, b=2;")]
+    assert result == ['a', 'b']
+    with pytest.raises(NoMatch):
+        list(parser.iter_parse(""))
+
+
+def test_iter_parse_rule_name():
+    parser = ParserPython(records)
+    assert len(list(parser.iter_parse("a=1;", rule_name='record'))) == 1
+    with pytest.raises(GrammarError):
+        parser.iter_parse("a=1;", rule_name='header').send(None)
+    with pytest.raises(GrammarError):
+        list(ParserPython(record).iter_parse("a=1;"))
+
+
+def test_iter_parse_restores_eolterm():
+    """
+    Parser can be reused after the iteration in eolterm repetition is
+    closed or failed.
+    """
+    def word():       return _(r'[a-z]+')
+    def pair():       return word, word
+    def document():   return pair, OneOrMore(pair, eolterm=True), EOF
+
+    parser = ParserPython(document)
+    items = parser.iter_parse("x\ny a b c d")
+    assert str(next(items)) == 'a | b'
+    items.close()
+    assert parser.eolterm is False
+    assert parser.parse("x\ny a b")
+
+    with pytest.raises(NoMatch):
+        list(parser.iter_parse("x\ny 1"))
+    assert parser.eolterm is False
+    assert parser.parse("x\ny a b")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parallel_visit
+# Purpose: Test visiting of independent subtrees by an executor.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+futures = pytest.importorskip('concurrent.futures')
+
+from arpeggio import ParserPython, PTNodeVisitor, visit_parse_tree, \
+    ZeroOrMore, OneOrMore, EOF  # noqa
+from arpeggio import RegExMatch as _  # noqa
+
+
+def name():        return _(r'[a-z]+')
+def number():      return _(r'\d+')
+def field():       return name, "=", [number, name]
+def declaration(): return "decl", name, "{", ZeroOrMore(field), "}"
+def module():      return OneOrMore(declaration), EOF
+
+
+INPUT = """
+decl a { x = 1 y = b }
+decl b { z = 3 }
+decl c { }
+decl d { w = a v = 4 }
+"""
+
+
+class Visitor(PTNodeVisitor):
+
+    def visit_number(self, node, children):
+        return int(node.value)
+
+    def visit_field(self, node, children):
+        return (children[0], children[1], node.position)
+
+    def visit_declaration(self, node, children):
+        return {'name': children[0], 'fields': list(children[1:]),
+                'refs': []}
+
+    def second_declaration(self, decl):
+        decl['refs'] = [f[1] for f in decl['fields'] if not isinstance(
+            f[1], int)]
+
+    def visit_module(self, node, children):
+        return list(children)
+
+
+@pytest.mark.parametrize('executor_class', [futures.ThreadPoolExecutor,
+                                            futures.ProcessPoolExecutor])
+def test_parallel_visit(executor_class):
+
+    parser = ParserPython(module)
+    parse_tree = parser.parse(INPUT)
+    expected = visit_parse_tree(parse_tree, Visitor())
+
+    with executor_class(max_workers=2) as executor:
+        result = visit_parse_tree(parse_tree, Visitor(), executor=executor,
+                                  parallel_rules=['declaration'])
+
+    assert result == expected
+    assert [d['name'] for d in result] == ['a', 'b', 'c', 'd']
+    assert result[0]['fields'][1] == ('y', 'b', INPUT.index('y'))
+    assert result[0]['refs'] == ['b']
+    assert result[3]['refs'] == ['a']
+
+
+def test_parallel_visit_no_rules():
+    """
+    Without parallel rules the executor is not used.
+    """
+
+    class NoExecutor(object):
+        def submit(self, *args):
+            assert False
+
+    parse_tree = ParserPython(module).parse(INPUT)
+    assert visit_parse_tree(parse_tree, Visitor(), executor=NoExecutor(),
+                            parallel_rules=['field_list']) == \
+        visit_parse_tree(parse_tree, Visitor())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_cache
+# Purpose: Test on-disk cache of parse trees.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import os
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, EOF, NoMatch, NonTerminal, \
+    COMMENTS_SPAN
+from arpeggio import RegExMatch as _
+from arpeggio.cache import ParseCache, SUFFIX
+from arpeggio.peg import ParserPEG
+
+
+def comment():     return _(r'//.*')
+def word():        return _(r'\w+')
+def line():        return word, "=", [word, "*"], ";"
+def lines():       return ZeroOrMore(line), EOF
+
+
+CONTENT = "a = b; // first\nc = *;\n// last\nšđč = ćž;\n"
+
+
+def write(tmpdir, content, name='input.txt'):
+    file_name = str(tmpdir.join(name))
+    with io.open(file_name, 'w', encoding='utf-8', newline='') as f:
+        f.write(content)
+    return file_name
+
+
+def nodes(tree):
+    """
+    Returns (rule, position, value) of all nodes and suppress flag of
+    terminals.
+    """
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        rule = node.rule if node.rule_name != 'EOF' else 'EOF'
+        if isinstance(node, NonTerminal):
+            result.append((rule, node.position, node.value))
+            stack.extend(reversed(node))
+        else:
+            result.append((rule, node.position, node.value, node.suppress))
+    return result
+
+
+def test_parse_cache_hit(tmpdir):
+    file_name = write(tmpdir, CONTENT)
+    cache = ParseCache(str(tmpdir.join('cache')))
+    parser = ParserPython(lines, comment, parse_cache=cache)
+
+    tree = parser.parse_file(file_name)
+    comments = [nodes(c) for c in parser.comments]
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    cached = parser.parse_file(file_name)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cached is not tree
+    assert nodes(cached) == nodes(tree)
+    assert [nodes(c) for c in parser.comments] == comments
+    assert parser.comments_count == 2
+    assert parser.parse_tree is cached
+    assert parser.input == CONTENT
+    assert parser.pos_to_linecol(cached[2].position) == (4, 1)
+
+    # Cache is used by other parsers for the same grammar. Nodes are
+    # bound to the rules of the parser.
+    parser = ParserPython(lines, comment, parse_cache=cache)
+    cached = parser.parse_file(file_name)
+    assert nodes(cached) == nodes(parser.parse(CONTENT))
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_parse_cache_key(tmpdir):
+    file_name = write(tmpdir, CONTENT)
+    cache = ParseCache(str(tmpdir.join('cache')))
+    ParserPython(lines, comment, parse_cache=cache).parse_file(file_name)
+
+    # Parser settings.
+    parser = ParserPython(lines, comment, reduce_tree=True,
+                          parse_cache=cache)
+    parser.parse_file(file_name)
+    assert cache.misses == 2
+
+    # Grammar.
+    def other_line(): return word, "=", [word, "*", "+"], ";"
+    def other_lines(): return ZeroOrMore(other_line), EOF
+    parser = ParserPython(other_lines, comment, parse_cache=cache)
+    parser.parse_file(file_name)
+    assert cache.misses == 3
+
+    # Content.
+    parser = ParserPython(lines, comment, parse_cache=cache)
+    parser.parse_file(write(tmpdir, CONTENT + "x = y;"))
+    assert (cache.hits, cache.misses) == (0, 4)
+    parser.parse_file(file_name)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_parse_cache_options(tmpdir):
+    file_name = write(tmpdir, "a = b; // first\nc = *;\n// last\n")
+    cache = ParseCache(str(tmpdir.join('cache')))
+    for kwargs in [dict(comment_mode=COMMENTS_SPAN, tree_index=True),
+                   dict(bytes_mode=True, reduce_tree=True)]:
+        parser = ParserPython(lines, comment, parse_cache=cache, **kwargs)
+        tree = parser.parse_file(file_name)
+        comments = parser.comments
+        cached = parser.parse_file(file_name)
+        assert nodes(cached) == nodes(tree)
+        assert parser.comments == comments
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert parser.parse_tree_index is None
+
+
+def test_parse_cache_peg(tmpdir):
+    grammar = r'''
+        lines <- line* EOF;
+        line <- word "=" word ";";
+        word <- r'\w+';
+    '''
+    file_name = write(tmpdir, "a = b;\nc = d;")
+    cache = ParseCache(str(tmpdir.join('cache')))
+    parser = ParserPEG(grammar, 'lines', parse_cache=cache)
+    tree = parser.parse_file(file_name)
+    cached = parser.parse_file(file_name)
+    assert cache.hits == 1
+    assert nodes(cached) == nodes(tree)
+
+
+def test_parse_cache_error(tmpdir):
+    file_name = write(tmpdir, "a = ;")
+    cache = ParseCache(str(tmpdir.join('cache')))
+    parser = ParserPython(lines, parse_cache=cache)
+    for _ in range(2):
+        with pytest.raises(NoMatch):
+            parser.parse_file(file_name)
+    assert cache.misses == 2
+    assert not os.listdir(cache.directory)
+
+
+def test_parse_cache_damaged(tmpdir):
+    file_name = write(tmpdir, CONTENT)
+    cache = ParseCache(str(tmpdir.join('cache')))
+    parser = ParserPython(lines, comment, parse_cache=cache)
+    tree = parser.parse_file(file_name)
+    entry, = os.listdir(cache.directory)
+    with open(os.path.join(cache.directory, entry), 'r+b') as f:
+        f.truncate(20)
+    assert nodes(parser.parse_file(file_name)) == nodes(tree)
+    assert cache.misses == 2
+    assert nodes(parser.parse_file(file_name)) == nodes(tree)
+    assert cache.hits == 1
+
+
+def test_parse_cache_size_on_replace(tmpdir):
+    file_name = write(tmpdir, CONTENT)
+    cache = ParseCache(str(tmpdir.join('cache')))
+    parser = ParserPython(lines, comment, parse_cache=cache)
+    parser.parse_file(file_name)
+    entry = os.path.join(cache.directory, os.listdir(cache.directory)[0])
+    size = os.path.getsize(entry)
+    assert cache._size == size
+
+    # Invalid entry of the same size is replaced.
+    with open(entry, 'r+b') as f:
+        f.write(b'XXXX')
+    parser.parse_file(file_name)
+    assert cache.misses == 2
+    assert cache._size == os.path.getsize(entry) == size
+
+
+def test_parse_cache_eviction(tmpdir):
+    cache = ParseCache(str(tmpdir.join('cache')), max_size=2000)
+    parser = ParserPython(lines, parse_cache=cache)
+    file_names = [write(tmpdir, "a{} = b;\n".format(i) * 10,
+                        'input{}.txt'.format(i)) for i in range(20)]
+    for file_name in file_names:
+        parser.parse_file(file_name)
+        # Keep the first file recently used.
+        parser.parse_file(file_names[0])
+
+    entries = [os.path.join(cache.directory, e)
+               for e in os.listdir(cache.directory)]
+    assert all(e.endswith(SUFFIX) for e in entries)
+    assert sum(os.path.getsize(e) for e in entries) <= 2000
+    assert 1 < len(entries) < 20
+
+    hits = cache.hits
+    parser.parse_file(file_names[0])
+    assert cache.hits == hits + 1
+
+    cache.clear()
+    assert not os.listdir(cache.directory)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_events
+# Purpose: Test parsing to a stream of events.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, NonTerminal, ZeroOrMore, OneOrMore, \
+    Optional, UnorderedGroup, And, Not, Combine, EOF, NoMatch, \
+    EVENT_ENTER, EVENT_EXIT, EVENT_TERMINAL
+from arpeggio import RegExMatch as _
+
+
+def comment():    return _(r'//.*')
+def number():     return Combine(_(r'\d+'), Optional(".", _(r'\d+')))
+def ident():      return _(r'[a-z][a-z0-9]*')
+def call():       return ident, "(", Optional(value, ZeroOrMore(",", value)), ")"
+def pair():       return ident, ":", value
+def attrs():      return "{", UnorderedGroup("a", "b", Optional("c"), sep=","), "}"
+def value():      return [call, pair, ident, number, attrs]
+def statement():  return Not("end"), value, And(";"), ";"
+def program():    return OneOrMore(statement), "end", EOF
+
+
+INPUT = """
+f(1, x:2.5, g()) ; // comment
+y: { b, a } ;
+z1 ;
+end
+"""
+
+
+def tree_events(node, events):
+    if isinstance(node, NonTerminal):
+        events.append((EVENT_ENTER, node.rule_name, node.position, None))
+        for child in node:
+            tree_events(child, events)
+        events.append((EVENT_EXIT, node.rule_name, node.position_end, None))
+    else:
+        events.append((EVENT_TERMINAL, node.rule_name, node.position,
+                       node.value))
+    return events
+
+
+def test_events_follow_parse_tree():
+
+    parser = ParserPython(program, comment)
+    expected = tree_events(parser.parse(INPUT), [])
+
+    events = []
+    parser.parse_events(INPUT, lambda *event: events.append(event))
+
+    assert events == expected
+    assert parser.parse_tree is None
+    assert events[0] == (EVENT_ENTER, 'program', 1, None)
+    assert (EVENT_TERMINAL, 'number', INPUT.index('2.5'), '2.5') in events
+
+
+def test_events_committed_while_parsing():
+    """
+    Events of a statement are passed to the handler before the next
+    statement is parsed.
+    """
+
+    parser = ParserPython(program, comment)
+    committed = []
+
+    def handler(event, rule_name, position, value):
+        if event == EVENT_EXIT and rule_name == 'statement':
+            committed.append(parser.position)
+
+    parser.parse_events(INPUT, handler)
+
+    assert committed == [i + 1 for i, c in enumerate(INPUT) if c == ';']
+
+
+def test_events_no_match():
+
+    parser = ParserPython(program, comment)
+    events = []
+    with pytest.raises(NoMatch):
+        parser.parse_events("a ; b", lambda *event: events.append(event))
+
+    # The first statement is committed.
+    assert events[-1] == (EVENT_EXIT, 'statement', 3, None)
+
+    # Parser is usable for building parse trees afterwards.
+    assert parser.parse("a ; end").rule_name == 'program'
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_file
+# Purpose: Test parsing of files with and without memory mapping.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, EOF, NoMatch
+from arpeggio import RegExMatch as _
+
+
+def word():        return _(r'\w+')
+def line():        return word, "=", word, ";"
+def lines():       return ZeroOrMore(line), EOF
+
+
+def write(tmpdir, content):
+    file_name = str(tmpdir.join('input.txt'))
+    with io.open(file_name, 'w', encoding='utf-8', newline='') as f:
+        f.write(content)
+    return file_name
+
+
+@pytest.mark.parametrize('content', ["a = b;\r\nc = d;\n",
+                                     "šđč = ćž;\n中 = 文;\n", ""])
+def test_parse_file_mmap(tmpdir, content):
+    file_name = write(tmpdir, content)
+    parser = ParserPython(lines)
+    tree = parser.parse_file(file_name)
+    mmap_tree = parser.parse_file(file_name, mmap=True)
+    assert parser.input == content
+    assert str(mmap_tree) == str(tree)
+    assert [n.position for n in mmap_tree] == [n.position for n in tree]
+
+
+def test_parse_file_mmap_error(tmpdir):
+    file_name = write(tmpdir, "šđč = ćž;\n中 = ;\n")
+    parser = ParserPython(lines)
+    with pytest.raises(NoMatch) as e:
+        parser.parse_file(file_name)
+    with pytest.raises(NoMatch) as mmap_e:
+        parser.parse_file(file_name, mmap=True)
+    assert str(mmap_e.value) == str(e.value)
+    assert (mmap_e.value.line, mmap_e.value.col) == (2, 5)
+    assert mmap_e.value.position == 14
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_files
+# Purpose: Test parsing of many files in a process pool.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import pytest  # noqa
+
+futures = pytest.importorskip('concurrent.futures')
+
+from arpeggio import ParserPython, PTNodeVisitor, NoMatch, NonTerminal, \
+    ZeroOrMore, EOF  # noqa
+from arpeggio import RegExMatch as _  # noqa
+from arpeggio.batch import parse_files, FileResult  # noqa
+
+
+def name():        return _(r'[a-z]+')
+def number():      return _(r'\d+')
+def field():       return name, "=", [number, name]
+def module():      return ZeroOrMore(field), EOF
+
+
+def make_parser():
+    return ParserPython(module)
+
+
+class Visitor(PTNodeVisitor):
+
+    def visit_number(self, node, children):
+        return int(node.value)
+
+    def visit_field(self, node, children):
+        return (children[0], children[1])
+
+    def visit_module(self, node, children):
+        return dict(list(children))
+
+
+def nodes(tree):
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        result.append((node.rule_name, node.position, node.value))
+        if isinstance(node, NonTerminal):
+            stack.extend(reversed(node))
+    return result
+
+
+@pytest.fixture
+def files(tmpdir):
+    file_names = []
+    for i in range(12):
+        file_name = str(tmpdir.join('file{}.txt'.format(i)))
+        with io.open(file_name, 'w', encoding='utf-8') as f:
+            if i == 5:
+                f.write('a = 1\nb = \n')
+            else:
+                f.write(''.join('{} = {}\n'.format('x' * (j + 1), i * j)
+                                for j in range(i)))
+        file_names.append(file_name)
+    return file_names
+
+
+def test_parse_files_trees(files):
+    results = list(parse_files(files, make_parser, workers=2))
+    assert [r.file_name for r in results] == files
+    parser = make_parser()
+    for file_name, result in zip(files, results):
+        assert isinstance(result, FileResult)
+        if file_name.endswith('file5.txt'):
+            continue
+        assert result.error is None and result.result is None
+        assert nodes(result.tree) == nodes(parser.parse_file(file_name))
+        assert result.tree.rule_name == 'module'
+
+
+def test_parse_files_errors(files):
+    results = list(parse_files(files, make_parser, workers=2))
+    errors = [r for r in results if r.error is not None]
+    assert len(errors) == 1
+    error = errors[0].error
+    assert isinstance(error, NoMatch)
+    assert errors[0].tree is None
+    assert error.position == 11
+    assert [r.rule_name for r in error.rules] == ['number', 'name']
+
+    with pytest.raises(NoMatch) as expected:
+        make_parser().parse_file(files[5])
+    assert str(error) == str(expected.value)
+    assert (error.line, error.col) == (expected.value.line,
+                                       expected.value.col) == (3, 1)
+    assert 'file5.txt' in str(error)
+
+    results = list(parse_files([files[0], 'missing.txt'], make_parser,
+                               workers=1))
+    assert results[0].error is None
+    assert isinstance(results[1].error, (IOError, OSError))
+
+
+def test_parse_files_visitor(files):
+    results = list(parse_files(files, make_parser, workers=2,
+                               visitor=Visitor()))
+    assert all(r.tree is None for r in results)
+    assert results[3].result == {'x': 0, 'xx': 3, 'xxx': 6}
+    assert results[0].result == {}
+
+    results = list(parse_files(files[:4], make_parser, workers=2,
+                               visitor=Visitor(), tree=True))
+    assert results[2].result == {'x': 0, 'xx': 2}
+    assert results[2].tree.rule_name == 'module'
+
+
+def test_parse_files_as_completed(files):
+    results = list(parse_files(files, make_parser, workers=3,
+                               ordered=False, tree=False))
+    assert sorted(r.file_name for r in results) == sorted(files)
+    assert all(r.tree is None for r in results)
+
+
+def test_parse_files_executor(files):
+    with futures.ThreadPoolExecutor(2) as executor:
+        results = list(parse_files(files, make_parser, executor=executor))
+    assert [r.file_name for r in results] == files
+    assert results[3].tree.rule_name == 'module'
+
+
+def test_parse_files_executor_second_pass(files):
+
+    class SecondVisitor(Visitor):
+        def visit_module(self, node, children):
+            return [len(children)]
+
+        def second_module(self, result):
+            result.append('second')
+
+    with futures.ThreadPoolExecutor(2) as executor:
+        results = list(parse_files(files[:4], make_parser, executor=executor,
+                                   visitor=SecondVisitor()))
+    assert [r.result for r in results] == \
+        [[0, 'second'], [1, 'second'], [2, 'second'], [3, 'second']]
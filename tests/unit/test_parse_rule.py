@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_rule
+# Purpose: Test parsing of an input part by a rule of the parser model.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, EOF, NoMatch, Terminal
+from arpeggio.cleanpeg import ParserPEG
+from arpeggio import RegExMatch as _
+
+
+def number():      return _(r'\d+')
+def ident():       return _(r'[a-z]+')
+def call():        return ident, "(", ZeroOrMore(number, sep=","), ")"
+def statement():   return [call, ident], ";"
+def program():     return ZeroOrMore(statement), EOF
+
+
+INPUT = "foo(1, 2); bar; baz(3);"
+
+
+def test_parse_rule_at_offset():
+    parser = ParserPython(program)
+    node, end = parser.parse_rule('call', INPUT, start=15)
+    assert node.rule_name == 'call'
+    assert node.position == 16
+    assert node.ident.value == 'baz'
+    assert node.number.position == 20
+    assert end == 22
+    # The same as in the parse of the whole input.
+    whole = parser.parse(INPUT)
+    assert str(node) == str(whole[2][0])
+
+
+def test_parse_rule_bounded():
+    parser = ParserPython(program)
+    node, end = parser.parse_rule('number', "12345", start=1, end=3)
+    assert isinstance(node, Terminal)
+    assert node.value == '23'
+    assert end == 3
+
+    node, end = parser.parse_rule('program', INPUT, end=10)
+    assert node.statement.call.ident.value == 'foo'
+    assert end == 10
+
+    # String match can't pass the end
+    with pytest.raises(NoMatch) as e:
+        parser.parse_rule('statement', INPUT, start=11, end=14)
+    assert e.value.position == 14
+    assert (e.value.line, e.value.col) == (1, 15)
+
+    # Whole input is parsed again after bounded parse.
+    assert parser.parse(INPUT)
+
+
+def test_parse_rule_memoization():
+    parser = ParserPython(program, memoization=True)
+    with pytest.raises(NoMatch):
+        parser.parse_rule('statement', INPUT, start=15, end=20)
+    node, end = parser.parse_rule('statement', INPUT, start=15)
+    assert node.call.ident.value == 'baz'
+    assert end == 23
+
+
+def test_parse_rule_peg():
+    parser = ParserPEG("""
+        program = pair+ EOF
+        pair = key "=" value
+        key = r'[a-z]+'
+        value = r'\\d+'
+    """, 'program')
+    node, end = parser.parse_rule('pair', "a=1 b=2", start=3)
+    assert node.key.value == 'b'
+    assert end == 7
+
+
+def test_parse_rule_unknown():
+    parser = ParserPython(program)
+    with pytest.raises(ValueError):
+        parser.parse_rule('missing', INPUT)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_parse_stream
+# Purpose: Test parsing of input read in chunks.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, Optional, EOF, NoMatch, \
+    COMMENTS_SPAN
+from arpeggio import RegExMatch as _
+
+
+def comment():     return _(r'#.*')
+def key():         return _(r'[a-z]+')
+def value():       return _(r'\d+')
+def record():      return key, "=", value, ";"
+def header():      return "records", ":"
+def records():     return Optional(header), ZeroOrMore(record), EOF
+
+
+INPUT = "records:\n" + "".join("k{0} = {1};{2}\n".format(
+    "abcdefghij"[i % 10], i, "  # comment" if i % 3 else "")
+    for i in range(50))
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def describe(parser, nodes):
+    return [(str(n), n.position, n.position_end,
+             parser.pos_to_linecol(n.position)) for n in nodes]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 10000])
+def test_parse_stream_same_as_iter_parse(size):
+    parser = ParserPython(records, comment)
+    expected = [describe(parser, [n]) for n in parser.iter_parse(INPUT)]
+
+    parser = ParserPython(records, comment)
+    items = []
+    for node in parser.parse_stream(chunked(INPUT, size), chunk_size=size,
+                                    lookahead=4):
+        items.append(describe(parser, [node]))
+        # Input before the current item is dropped.
+        assert len(parser.input) < 3 * size + 40
+    assert items == expected
+
+
+def test_parse_stream_file():
+    parser = ParserPython(records, comment, memoization=True,
+                          comment_mode=COMMENTS_SPAN)
+    comments = []
+    values = []
+    for node in parser.parse_stream(io.StringIO(INPUT), chunk_size=16):
+        values.append(node[2].value)
+        comments.extend(INPUT[start:end] for start, end in parser.comments)
+    assert values == [str(i) for i in range(50)]
+    # The last comment is matched after the last item.
+    assert comments == ["# comment"] * 32
+
+
+def test_parse_stream_bytes():
+    parser = ParserPython(records, bytes_mode=True)
+    data = b"a = 1; bb = 22;\nccc = 333;"
+    nodes = list(parser.parse_stream(io.BytesIO(data), chunk_size=4,
+                                     lookahead=2))
+    assert [n.key.value for n in nodes] == ['a', 'bb', 'ccc']
+    assert [n.position for n in nodes] == [0, 7, 16]
+    assert parser.pos_to_linecol(nodes[2].position) == (2, 1)
+
+
+@pytest.mark.parametrize('text', ["records: a = 1; b = ; c = 3;",
+                                  "records:\na = 1;\nb = 2;\nc = 3\n",
+                                  "a = 1;\nb = 2;\n\n c 3"])
+def test_parse_stream_error(text):
+    parser = ParserPython(records)
+    with pytest.raises(NoMatch) as parse_error:
+        parser.parse(text)
+
+    with pytest.raises(NoMatch) as stream_error:
+        list(parser.parse_stream(chunked(text, 2), chunk_size=2,
+                                 lookahead=1))
+    assert stream_error.value.position == parse_error.value.position
+    assert (stream_error.value.line, stream_error.value.col) == \
+        (parse_error.value.line, parse_error.value.col)
+    assert str(stream_error.value) == str(parse_error.value)
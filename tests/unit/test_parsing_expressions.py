@@ -8,6 +8,7 @@
 #######################################################################
 
 from __future__ import unicode_literals
+import weakref
 import pytest
 from arpeggio import ParserPython, UnorderedGroup, ZeroOrMore, OneOrMore, \
     NoMatch, EOF, Optional, And, Not, StrMatch
@@ -333,3 +334,28 @@ def test_not():
     # And will not consume 'c' from the input so 'b' will never match
     with pytest.raises(NoMatch):
         parser.parse("acb")
+
+
+def test_expression_slots():
+
+    def grammar():
+        return ZeroOrMore("a"), "b", EOF
+
+    parser = ParserPython(grammar)
+
+    # Parser model nodes keep their attributes in slots. Tools built on the
+    # parser model can set other attributes and keep weak references.
+    stack = [parser.parser_model]
+    while stack:
+        expr = stack.pop()
+        assert 'rule_name' not in vars(expr)
+        expr._tx_class = type(expr)
+        assert weakref.ref(expr)() is expr
+        stack.extend(expr.nodes)
+    assert parser.parse("a b")
+
+    # Expected rule description can be set on any expression.
+    parser.parser_model.nodes[1]._exp_str = "letter b"
+    with pytest.raises(NoMatch) as e:
+        parser.parse("a a c")
+    assert "letter b" in str(e.value)
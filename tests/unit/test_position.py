@@ -8,7 +8,7 @@
 #######################################################################
 from __future__ import unicode_literals
 import pytest
-from arpeggio import ParserPython
+from arpeggio import ParserPython, SourceMap
 
 
 @pytest.fixture
@@ -49,3 +49,67 @@ def test_pos_to_linecol():
     assert parser.pos_to_linecol(b_pos) == (4, 2)
     c_pos = parse_tree[2].position
     assert parser.pos_to_linecol(c_pos) == (5, 1)
+
+
+def test_line_ends():
+
+    def grammar(): return ("a", "b", "c")
+
+    parser = ParserPython(grammar)
+    parser.parse("a\n\n\n b\nc")
+    with pytest.deprecated_call():
+        assert parser.line_ends == [1, 2, 3, 6]
+
+
+def test_source_map():
+
+    def grammar(): return ("a", "b", "c")
+
+    parser = ParserPython(grammar)
+
+    parse_tree = parser.parse("a\n\n\n b\nc")
+
+    source_map = parser.source_map
+    assert isinstance(source_map, SourceMap)
+    assert list(source_map.line_starts) == [0, 2, 3, 4, 7]
+
+    positions = [n.position for n in parse_tree]
+    assert source_map.linecols(positions) == ([1, 4, 5], [1, 2, 1])
+    assert source_map.linecols([]) == ([], [])
+
+    # Newline belongs to the line it terminates
+    assert source_map.pos_to_linecol(1) == (1, 2)
+
+    # Source map is rebuilt for each input
+    parser.parse("a b c")
+    assert parser.source_map is not source_map
+    assert parser.pos_to_linecol(4) == (1, 5)
+
+
+def test_node_linecol():
+
+    def grammar(): return ("a", "bb", "c")
+
+    parser = ParserPython(grammar)
+
+    parse_tree = parser.parse("a\n  bb\nc")
+
+    assert parse_tree[1].linecol(parser) == (2, 3)
+    assert parse_tree[1].linecol_end(parser.source_map) == (2, 5)
+    assert parse_tree.linecol_end(parser) == (3, 2)
+
+    spans = parser.source_map.tree_linecols(parse_tree)
+    assert [(n.rule_name, start, end) for n, start, end in spans] == \
+        [('grammar', (1, 1), (3, 2)),
+         ('', (1, 1), (1, 2)),
+         ('', (2, 3), (2, 5)),
+         ('', (3, 1), (3, 2))]
+
+
+def test_source_map_numpy():
+    numpy = pytest.importorskip('numpy')
+
+    source_map = SourceMap("a\nbc\n\nd")
+    lines, cols = source_map.linecols(numpy.array([0, 1, 2, 4, 5, 6]))
+    assert list(lines) == [1, 1, 2, 2, 3, 4]
+    assert list(cols) == [1, 2, 1, 3, 1, 1]
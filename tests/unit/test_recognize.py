@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_recognize
+# Purpose: Test input validation without building the parse tree.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, OneOrMore, Optional, Not, \
+    EOF, NoMatch, Combine
+from arpeggio import RegExMatch as _
+
+
+def comment():     return _(r'#.*')
+def name():        return Not("end"), _(r'[a-z]+')
+def number():      return Combine(_(r'\d+'), Optional(".", _(r'\d+')))
+def item():        return [(name, "(", ZeroOrMore(number, sep=","), ")"),
+                           (name, "=", number), name]
+def block():       return "begin", OneOrMore(item), "end"
+def program():     return ZeroOrMore(block), EOF
+
+
+VALID = """
+begin
+  a(1,2.5)  # comment
+  b =3
+  c
+end
+begin d end
+"""
+
+
+@pytest.mark.parametrize('memoization', [False, True])
+def test_recognize(memoization):
+
+    parser = ParserPython(program, comment, memoization=memoization)
+    assert parser.recognize(VALID) is True
+    assert parser.parse_tree is None
+
+
+@pytest.mark.parametrize('memoization', [False, True])
+@pytest.mark.parametrize('invalid', [
+    VALID.replace('2.5', '2.'),
+    VALID.replace('b =3', 'b = '),
+    VALID.replace('begin d', 'begin'),
+    VALID + "x",
+])
+def test_recognize_no_match(memoization, invalid):
+    """
+    Test that recognize raises the same error as parse.
+    """
+
+    parser = ParserPython(program, comment, memoization=memoization)
+
+    with pytest.raises(NoMatch) as parse_error:
+        parser.parse(invalid)
+    with pytest.raises(NoMatch) as recognize_error:
+        parser.recognize(invalid)
+
+    parse_error, recognize_error = parse_error.value, recognize_error.value
+    assert recognize_error.position == parse_error.position
+    assert (recognize_error.line, recognize_error.col) == \
+        (parse_error.line, parse_error.col)
+    assert recognize_error.rules == parse_error.rules
+    assert str(recognize_error) == str(parse_error)
+
+
+def test_recognize_memoization():
+
+    parser = ParserPython(program, comment, memoization=True)
+    parser.recognize(VALID)
+    assert parser.cache_hits > 0
+
+    # Caches are cleared after recognition.
+    assert not parser.parser_model._recognize_cache
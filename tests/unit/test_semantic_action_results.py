@@ -57,3 +57,38 @@ def test_semantic_action_results():
     assert isinstance(first_sar, SemanticActionResults)
     assert len(first_sar.third) == 3
     assert third_sar.third_str[0] == '3'
+
+
+def test_semantic_action_results_lazy_grouping():
+
+    results = SemanticActionResults()
+    results.append_result('third', 1)
+    results.append_result('', '3')
+    assert results.third == [1]
+    assert results.fourth == []
+
+    # Grouping is rebuilt after new results are appended.
+    results.append_result('third', 2)
+    assert results.third == [1, 2]
+    assert results.results == {'third': [1, 2]}
+    assert list(results) == [1, '3', 2]
+
+
+def test_default_visit_override_gets_results():
+    """
+    Containers are not created for terminals and default handling only
+    if the default visit method is not overridden.
+    """
+
+    class DefaultVisitor(PTNodeVisitor):
+        def visit__default__(self, node, children):
+            assert isinstance(children, SemanticActionResults)
+            if node.rule_name == 'first':
+                assert len(children.third) == 3
+            return super(DefaultVisitor, self).visit__default__(node,
+                                                                children)
+
+    parser = ParserPython(grammar, reduce_tree=False)
+    result = parser.parse("4 3 3 3 a 3 3 b")
+    assert visit_parse_tree(result, DefaultVisitor()) == \
+        visit_parse_tree(result, PTNodeVisitor())
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_serialize
+# Purpose: Test compact binary serialization of parse trees.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import io
+import pickle
+import pytest  # noqa
+
+from arpeggio import ParserPython, ZeroOrMore, EOF, NonTerminal
+from arpeggio import RegExMatch as _
+from arpeggio.serialize import dumps, loads, dump, load
+
+
+def comment():     return _(r'//.*')
+def word():        return _(r'\w+')
+def line():        return word, "=", [word, "*"], ";"
+def lines():       return ZeroOrMore(line), EOF
+
+
+CONTENT = "a = b; // first\nc = *;\n// last\nšđč = ćž;\n"
+
+
+def nodes(tree):
+    """
+    Returns (rule, position, value) of all nodes and suppress flag of
+    terminals.
+    """
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        rule = node.rule if node.rule_name != 'EOF' else 'EOF'
+        if isinstance(node, NonTerminal):
+            result.append((rule, node.position, node.position_end,
+                           node.value))
+            stack.extend(reversed(node))
+        else:
+            result.append((rule, node.position, node.position_end,
+                           node.value, node.suppress))
+    return result
+
+
+def test_round_trip():
+    parser = ParserPython(lines, comment)
+    tree = parser.parse(CONTENT)
+    data = dumps(tree, parser)
+    assert len(data) < len(pickle.dumps(tree, -1))
+
+    loaded = loads(data, parser)
+    assert nodes(loaded) == nodes(tree)
+    assert str(loaded) == str(tree)
+    assert loaded.line[0][0].value == 'a'
+    assert loaded[-1].rule_name == 'EOF'
+
+    # Nodes are bound to the rules of the given parser.
+    other = ParserPython(lines, comment)
+    loaded = loads(data, other)
+    assert nodes(loaded) == nodes(other.parse(CONTENT))
+
+
+def test_empty_nonterminal():
+    parser = ParserPython(lines)
+    tree = parser.parse("a = b;")
+    tree = NonTerminal(parser.parser_model, list(tree) +
+                       [NonTerminal(parser.parser_model.nodes[0], [])])
+    loaded = loads(dumps(tree, parser), parser)
+    assert nodes(loaded) == nodes(tree)
+    assert len(loaded[-1]) == 0
+
+
+def test_list():
+    parser = ParserPython(lines, comment)
+    parser.parse(CONTENT)
+    loaded = loads(dumps(parser.comments, parser), parser)
+    assert [nodes(c) for c in loaded] == \
+        [nodes(c) for c in parser.comments]
+    assert loads(dumps([], parser), parser) == []
+
+
+def test_options():
+    content = b"a = b; // first\nc = *;\n// last\n"
+    parser = ParserPython(lines, comment, bytes_mode=True, reduce_tree=True)
+    tree = parser.parse(content)
+    loaded = loads(dumps(tree, parser), parser)
+    assert nodes(loaded) == nodes(tree)
+    assert loaded.line[0][0].value == b'a'
+
+
+def test_file():
+    parser = ParserPython(lines, comment)
+    tree = parser.parse(CONTENT)
+    f = io.BytesIO()
+    dump(tree, parser, f)
+    f.seek(0)
+    assert nodes(load(f, parser)) == nodes(tree)
+
+
+def test_different_grammar():
+    parser = ParserPython(lines, comment)
+    data = dumps(parser.parse(CONTENT), parser)
+
+    with pytest.raises(ValueError) as e:
+        loads(data, ParserPython(lines))
+    assert 'different grammar' in str(e.value)
+
+    with pytest.raises(ValueError):
+        loads(data, ParserPython(lines, comment, reduce_tree=True))
+
+    # Trees can't be serialized with a parser of other grammar.
+    with pytest.raises(ValueError):
+        dumps(parser.parse_tree, ParserPython(lines))
+
+
+def test_invalid_data():
+    parser = ParserPython(lines, comment)
+    data = dumps(parser.parse(CONTENT), parser)
+    for invalid in [b'', b'XXXX' + data[4:], data[:len(data) // 2],
+                    data[:40] + b'\xff' * 8 + data[48:]]:
+        with pytest.raises(ValueError):
+            loads(invalid, parser)
+
+
+def test_fingerprint_independent_of_interpreter(monkeypatch):
+    import marshal
+    import sys
+    from arpeggio.serialize import grammar_fingerprint
+
+    fingerprint = grammar_fingerprint(ParserPython(lines, comment))
+    monkeypatch.setattr(sys, 'version_info', (4, 0, 0, 'final', 0))
+    monkeypatch.setattr(marshal, 'version', marshal.version + 1)
+    assert grammar_fingerprint(ParserPython(lines, comment)) == fingerprint
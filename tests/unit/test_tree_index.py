@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#######################################################################
+# Name: test_tree_index
+# Purpose: Test whole-tree rule name index of the parse tree.
+# License: MIT License
+#######################################################################
+from __future__ import unicode_literals
+import pytest
+from arpeggio import ZeroOrMore, OneOrMore, EOF, ParserPython, \
+    ParseTreeIndex
+from arpeggio import RegExMatch as _
+
+
+def value():    return [number, array]
+def number():   return _(r'\d+')
+def array():    return "[", ZeroOrMore(value, sep=","), "]"
+def values():   return OneOrMore(value), EOF
+
+
+INPUT = "1 [2, [3, 4], 5] [6]"
+
+
+@pytest.fixture
+def parser():
+    return ParserPython(values, tree_index=True)
+
+
+def test_index_built(parser):
+    parse_tree = parser.parse(INPUT)
+    index = parser.parse_tree_index
+    assert isinstance(index, ParseTreeIndex)
+    assert index.root is parse_tree
+
+    parser = ParserPython(values)
+    parser.parse(INPUT)
+    assert parser.parse_tree_index is None
+
+
+def test_find_all_document_order(parser):
+    parse_tree = parser.parse(INPUT)
+    numbers = parse_tree.find_all('number')
+    assert [n.value for n in numbers] == ['1', '2', '3', '4', '5', '6']
+    arrays = parse_tree.find_all('array')
+    assert [a.position for a in arrays] == [2, 6, 17]
+    assert parse_tree.find_all('nonexisting') == []
+
+
+def test_scoped_lookup(parser):
+    parse_tree = parser.parse(INPUT)
+    outer = parse_tree.first('array')
+    assert outer.position == 2
+    assert [n.value for n in outer.find_all('number')] == \
+        ['2', '3', '4', '5']
+    inner = outer.find_all('array')[1]
+    assert [n.value for n in inner.find_all('number')] == ['3', '4']
+    assert inner.first('number').value == '3'
+    assert parser.parse_tree_index.count('number', inner) == 2
+
+    # Nodes of other subtrees are not found.
+    last = parse_tree.find_all('array')[-1]
+    assert last.first('array') is last
+    assert [n.value for n in last.find_all('number')] == ['6']
+
+
+def test_index_same_as_traversal(parser):
+    parse_tree = parser.parse(INPUT)
+    unindexed = ParserPython(values).parse(INPUT)
+    for rule_name in ['value', 'number', 'array']:
+        assert [n.position for n in parse_tree.find_all(rule_name)] == \
+            [n.position for n in unindexed.find_all(rule_name)]
+        assert unindexed.first(rule_name).position == \
+            parse_tree.first(rule_name).position
+
+
+def test_index_existing_tree():
+    parse_tree = ParserPython(values).parse(INPUT)
+    index = ParseTreeIndex(parse_tree)
+    assert len(index.find_all('number')) == 6
+    assert set(index.rule_names) >= set(['values', 'value', 'number',
+                                         'array'])
+    terminal = index.first('number')
+    assert index.find_all('number', terminal) == [terminal]
+    assert index.find_all('array', terminal) == []
+
+
+def test_position_end_cached(parser):
+    parse_tree = parser.parse(INPUT)
+    assert parse_tree.position_end == len(INPUT)
+    arr = parse_tree.first('array')
+    assert arr.position_end == 16
+    assert arr._position_end == 16
+
+
+def test_node_at(parser):
+    # 1 [2, [3, 4], 5] [6]
+    # 01234567890123456789
+    parser.parse(INPUT)
+    index = parser.parse_tree_index
+
+    assert index.node_at(0).value == '1'
+    assert index.node_at(0).rule_name == 'number'
+    assert index.node_at(7).value == '3'
+    # Comma inside inner array is a terminal of the array.
+    assert index.node_at(8).value == ','
+    # Whitespace between elements belongs to the enclosing array.
+    node = index.node_at(9)
+    assert node.rule_name == 'array'
+    assert node.position == 6
+    # Whitespace before the first node is not covered by any node.
+    assert ParseTreeIndex(ParserPython(values).parse("  1")).node_at(0) \
+        is None
+    assert index.node_at(100) is None
+
+    assert [n.rule_name for n in index.nodes_at(7)] == \
+        ['values', 'value', 'array', 'value', 'array', 'value', 'number']
+
+
+def test_node_at_same_as_traversal(parser):
+    parse_tree = parser.parse(INPUT)
+    index = parser.parse_tree_index
+
+    def deepest(node, offset):
+        if not node.position <= offset < node.position_end:
+            return None
+        if not isinstance(node, list):
+            return node
+        for child in node:
+            found = deepest(child, offset)
+            if found is not None:
+                return found
+        return node
+
+    for offset in range(len(INPUT) + 1):
+        assert index.node_at(offset) is deepest(parse_tree, offset)
+
+
+def test_nodes_in_range(parser):
+    parse_tree = parser.parse(INPUT)
+    index = parser.parse_tree_index
+
+    nodes = index.nodes_in_range(7, 11)
+    expected = [n for n in index._nodes
+                if n.position < 11 and n.position_end > 7]
+    assert nodes == expected
+    assert [n.value for n in nodes if n.rule_name == 'number'] == ['3', '4']
+
+    # Nodes are in document order
+    assert index.nodes_in_range(0, len(INPUT)) == index._nodes[:-1]
+    assert index.nodes_in_range(2, 3) == index.nodes_at(2)
+
+
+def test_large_positions():
+    """
+    Positions in inputs larger than 4 GiB fit in the index.
+    """
+    from arpeggio import NonTerminal, Terminal, StrMatch, Sequence
+
+    position = 2 ** 32 + 5
+    leaf = Terminal(StrMatch('x', rule_name='leaf'), position, 'x')
+    tree = NonTerminal(Sequence(rule_name='root'), [leaf])
+    index = ParseTreeIndex(tree)
+    assert index._starts.itemsize == 8
+    assert index.node_at(position) is leaf
+    assert index.nodes_in_range(position, position + 1) == [tree, leaf]
@@ -57,3 +57,76 @@ def test_semantic_action_results():
     assert isinstance(first_sar, SemanticActionResults)
     assert len(first_sar.third) == 3
     assert third_sar.third_str[0] == '3'
+
+
+def test_visit_deep_tree():
+    """
+    Visiting is not limited by the recursion limit.
+    """
+    import sys
+    from arpeggio import NonTerminal, Terminal, StrMatch, Sequence
+
+    leaf_rule = StrMatch('x', rule_name='leaf')
+    nested_rule = Sequence(rule_name='nested')
+
+    depth = sys.getrecursionlimit() * 2
+    tree = Terminal(leaf_rule, 0, 'x')
+    for _ in range(depth):
+        tree = NonTerminal(nested_rule, [tree])
+
+    class DepthVisitor(PTNodeVisitor):
+        def visit_leaf(self, node, children):
+            return 0
+
+        def visit_nested(self, node, children):
+            return children[0] + 1
+
+    assert visit_parse_tree(tree, DepthVisitor()) == depth
+
+
+def test_visit_methods_resolved_once():
+
+    parser = ParserPython(grammar, reduce_tree=False)
+    result = parser.parse("4 3 3 3 a 3 3 b")
+
+    lookups = []
+
+    class CountingVisitor(PTNodeVisitor):
+        def __getattribute__(self, name):
+            if name.startswith('visit_') and name != 'visit__default__':
+                lookups.append(name)
+            return super(CountingVisitor, self).__getattribute__(name)
+
+        def visit_third(self, node, children):
+            return 1
+
+    visit_parse_tree(result, CountingVisitor())
+
+    assert len(lookups) == len(set(lookups))
+    assert 'visit_third' in lookups
+
+
+def _item():        return _(r'\d+')
+def items():        return OneOrMore(_item)
+
+
+def test_results_of_rule_with_underscore_name():
+    """
+    Results of rules whose names start with an underscore are accessible by
+    the rule name.
+    """
+    import copy
+    import pickle
+
+    class ItemsVisitor(PTNodeVisitor):
+        def visit__item(self, node, children):
+            return int(node.value)
+
+        def visit_items(self, node, children):
+            assert copy.copy(children) == children
+            assert list(pickle.loads(pickle.dumps(children))) == \
+                list(children)
+            return children._item
+
+    tree = ParserPython(items).parse("1 2 3")
+    assert visit_parse_tree(tree, ItemsVisitor()) == [1, 2, 3]